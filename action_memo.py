@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for remembering the responses of actions that depend on nothing
+but the tokens of a message and the strings.
+
+The response of an action declared deterministic is remembered for the
+tokens it answered. For an action declared randomChoice every response
+it may pick is made once, by going through the strings of its list, and
+one of them is picked on each call. Everything is forgotten when the
+strings file has been loaded again. Other actions are run every time.
+"""
+
+from collections import OrderedDict
+import threading
+
+from action_meta import DETERMINISTIC, RANDOM_CHOICE
+from metrics import METRICS
+from string_store import STRINGS, choosing, randomIndex
+
+
+class ActionMemo():
+    """The responses of deterministic and random choice actions, with LRU eviction"""
+    def __init__(self, strings, maxSize=512):
+        self.strings = strings
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def run(self, action, words):
+        """Return the response of the action to the tokens, remembered when possible"""
+        kind = getattr(action, "memoize", None)
+        if kind not in (DETERMINISTIC, RANDOM_CHOICE):
+            return action(words)
+
+        key = (action, tuple(words))
+        self.strings.reloadIfChanged()
+        version = self.strings.mtime
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            pool = self.entries.get(key)
+            if pool is None:
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits"] += 1
+                self.entries.move_to_end(key)
+
+        if pool is None:
+            pool = self.responses(kind, action, words)
+            if pool is None:
+                return action(words)
+            self.store(key, pool, version)
+
+        return pool[0] if len(pool) == 1 else pool[randomIndex(len(pool))]
+
+    @staticmethod
+    def responses(kind, action, words):
+        """
+        Return every response the action may answer the tokens with, or None
+        when it picked from more than one list and can not be remembered.
+        """
+        if kind == DETERMINISTIC:
+            return (action(words),)
+
+        counts = []
+
+        def first(count):
+            counts.append(count)
+            return 0
+
+        with choosing(first):
+            pool = [action(words)]
+        if len(counts) > 1:
+            return None
+
+        for index in range(1, counts[0] if counts else 1):
+            with choosing(lambda count, index=index: index):
+                pool.append(action(words))
+        return tuple(pool)
+
+    def store(self, key, pool, version):
+        """Remember the responses, unless the strings changed while making them"""
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = pool
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Forget all responses"""
+        with self.lock:
+            self.entries.clear()
+
+    def counters(self):
+        """Return how many lookups found remembered responses and how many did not"""
+        with self.lock:
+            return dict(self.stats)
+
+
+# The responses remembered by the running bot
+MEMO = ActionMemo(STRINGS)
+
+METRICS.collect("marvin_action_memo_lookups_total", "counter", lambda: [
+    ({"result": result}, count) for result, count in MEMO.counters().items()
+])
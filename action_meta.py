@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Metadata for Marvin actions and an index from trigger keywords to the
+actions that may respond to them.
+
+Keywords are compiled into a TriggerMatcher, which finds all of them in
+a tokenized message in one pass with a dict lookup for each word. A
+keyword of several words, like "god morgon", matches those words in a
+row.
+
+Actions that depend on nothing but the tokens and the strings can also
+be declared deterministic or randomChoice, letting the dispatcher
+remember their responses.
+"""
+
+from functools import lru_cache
+import threading
+
+# Kinds of actions whose responses may be remembered, see action_memo
+DETERMINISTIC, RANDOM_CHOICE = "deterministic", "randomChoice"
+
+
+def triggers(*keywords):
+    """
+    Declare the keywords that can make an action respond. The action is
+    only a candidate for a message containing at least one of them. The
+    keywords are kept as action.triggers, for the action to check itself
+    with findTriggers.
+    """
+    def decorate(action):
+        action.triggers = tuple(keywords)
+        return action
+    return decorate
+
+
+def deterministic(action):
+    """
+    Declare that the action always answers the same tokens with the same
+    response, as long as the strings are not changed.
+    """
+    action.memoize = DETERMINISTIC
+    return action
+
+
+def randomChoice(action):
+    """
+    Declare that the action answers the same tokens with one string picked
+    from a list, and does nothing else random.
+    """
+    action.memoize = RANDOM_CHOICE
+    return action
+
+
+class TriggerMatcher():
+    """Keywords of many keys, like actions, compiled for finding them all in one pass"""
+    def __init__(self):
+        self.phrases = {}
+        self.firsts = frozenset()
+
+    def add(self, key, keywords):
+        """Let the keywords match key"""
+        for keyword in keywords:
+            phrase = tuple(keyword.split())
+            if phrase:
+                self.phrases.setdefault(phrase[0], []).append((phrase, key))
+        self.firsts = frozenset(self.phrases)
+
+    def scan(self, words):
+        """
+        Return a dict from each key matched in the tokenized message to the
+        (start, end) spans of its keywords, in the order they were found.
+        A Message without any of the first words is passed over at once.
+        """
+        found = {}
+        tokenSet = getattr(words, "tokenSet", None)
+        if tokenSet is not None and tokenSet.isdisjoint(self.firsts):
+            return found
+        for start, word in enumerate(words):
+            for phrase, key in self.phrases.get(word, ()):
+                end = start + len(phrase)
+                if len(phrase) == 1 or tuple(words[start:end]) == phrase:
+                    found.setdefault(key, []).append((start, end))
+        return found
+
+
+@lru_cache(maxsize=256)
+def compileKeywords(keywords):
+    """Return a matcher for a tuple of keywords, where each keyword is its own key"""
+    matcher = TriggerMatcher()
+    for keyword in keywords:
+        matcher.add(keyword, (keyword,))
+    return matcher
+
+
+def findTriggers(words, keywords):
+    """
+    Return the sorted (start, end) spans of the keywords found in the
+    tokenized message. A Message keeps them, and those of the triggers of
+    the actions it was dispatched to are already there.
+    """
+    keywords = tuple(keywords)
+    known = getattr(words, "spans", None)
+    if known is not None and keywords in known:
+        return known[keywords]
+    found = compileKeywords(keywords).scan(words)
+    spans = sorted(span for spans in found.values() for span in spans)
+    if known is not None:
+        known[keywords] = spans
+    return spans
+
+
+class ActionIndex():
+    """
+    Index from trigger keyword to registered actions. Actions without
+    declared triggers are candidates for every message. The index follows
+    the list of actions it was created with, so actions added at runtime
+    are picked up on the next lookup.
+
+    The actions indexed, their matcher and the actions without triggers
+    are built together and swapped in with one assignment, so a lookup in
+    another thread always sees an index and the list it was built from.
+    """
+    def __init__(self, actions):
+        self.actions = actions
+        self.lock = threading.Lock()
+        self.index = ((), TriggerMatcher(), ())
+
+    def rebuild(self):
+        """Index all actions again"""
+        with self.lock:
+            self.index = self.build(tuple(self.actions))
+
+    @staticmethod
+    def build(actions):
+        """Return the actions with a matcher of their triggers and those without any"""
+        matcher = TriggerMatcher()
+        always = []
+        for position, action in enumerate(actions):
+            keywords = getattr(action, "triggers", None)
+            if keywords is None:
+                always.append(position)
+            else:
+                matcher.add(position, keywords)
+        return actions, matcher, tuple(always)
+
+    def unchanged(self, indexed):
+        """Check that the list holds the indexed actions and no others"""
+        actions = self.actions
+        return len(actions) == len(indexed) and all(
+            action is other for action, other in zip(indexed, actions))
+
+    def sync(self):
+        """
+        Index the actions again if any were added, replaced or removed since
+        the last lookup. Return the index to look up in.
+        """
+        index = self.index
+        if self.unchanged(index[0]):
+            return index
+        with self.lock:
+            if not self.unchanged(self.index[0]):
+                self.index = self.build(tuple(self.actions))
+            return self.index
+
+    def matches(self, words):
+        """
+        Return (action, spans) for the actions that may respond to the
+        tokenized message, in the order they were registered. The spans are
+        where their keywords were found, empty for actions without triggers.
+        """
+        actions, matcher, always = self.sync()
+        found = matcher.scan(words)
+        known = getattr(words, "spans", None)
+        if known is not None:
+            for position, spans in found.items():
+                known[actions[position].triggers] = sorted(spans)
+        for position in always:
+            found.setdefault(position, [])
+        return [(actions[position], found[position]) for position in sorted(found)]
+
+    def candidates(self, words):
+        """
+        Return the actions that may respond to the tokenized message, in
+        the order they were registered.
+        """
+        return [action for action, _ in self.matches(words)]
@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for loading new versions of the actions into the running bot.
+
+Sending SIGHUP to the process reloads the strings and the modules of the
+actions on the next message, without touching the connection to the
+server. The strings are loaded first, the file is only used when it
+parses. The new code of every module is then run into a new module
+object, and nothing is replaced unless all of them load and return
+their actions. Only then are the modules swapped in sys.modules, the
+lists of actions of the bot replaced and the indexes and remembered
+responses rebuilt. When anything fails the bot keeps running the old
+actions, with the old metrics collectors.
+"""
+
+import importlib.util
+import logging
+import signal
+import sys
+
+from action_memo import MEMO
+from action_meta import compileKeywords
+from metrics import METRICS
+from string_store import STRINGS
+
+LOG = logging.getLogger("marvin.reload")
+
+# Modules of actions, the function in each returning its actions and the
+# list of the bot they are registered in
+MODULES = (
+    ("marvin_actions", "getAllActions", "ACTIONS"),
+    ("marvin_general_actions", "getAllGeneralActions", "GENERAL_ACTIONS"),
+)
+
+
+def loadModule(name):
+    """
+    Run the current source of a module into a new module object, leaving
+    the one in sys.modules as it is. The source is always compiled, a
+    cached .pyc of a file edited within the same second is not used.
+    """
+    spec = importlib.util.find_spec(name)
+    module = importlib.util.module_from_spec(spec)
+    code = compile(spec.loader.get_source(name), spec.origin, "exec")
+    exec(code, module.__dict__)  # pylint: disable=exec-used
+    return module
+
+
+class ActionReloader():
+    """Reload the actions of a bot on request, all or nothing"""
+    def __init__(self, modules=MODULES):
+        self.modules = modules
+        self.bot = None
+        self.requested = False
+
+    def arm(self, bot):
+        """Reload the actions of bot when SIGHUP is received, where there is one"""
+        self.bot = bot
+        try:
+            signal.signal(signal.SIGHUP, self.request)
+        except (AttributeError, ValueError) as err:
+            LOG.warning("Reloading on SIGHUP is not available. %s", err)
+
+    def request(self, _signum=None, _frame=None):
+        """Reload on the next message"""
+        self.requested = True
+
+    def tick(self):
+        """Called for each message by the thread dispatching them"""
+        if self.requested:
+            self.requested = False
+            self.reload()
+
+    def reload(self):
+        """Load the strings and actions again, return False if the old ones were kept"""
+        if self.bot is None:
+            return False
+        collectors = dict(METRICS.collectors)
+        try:
+            STRINGS.load()
+            loaded = []
+            for name, getter, target in self.modules:
+                module = loadModule(name)
+                loaded.append((name, module, target, list(getattr(module, getter)())))
+        except Exception as err:
+            for name, (kind, func) in collectors.items():
+                METRICS.collect(name, kind, func)
+            LOG.error("Reload failed, keeping the actions running. %s", err, exc_info=True)
+            return False
+
+        for name, module, target, actions in loaded:
+            module.setConfig(self.bot.CONFIG)
+            sys.modules[name] = module
+            getattr(self.bot, target)[:] = actions
+        self.bot.ACTION_INDEX.rebuild()
+        self.bot.GENERAL_ACTION_INDEX.rebuild()
+        compileKeywords.cache_clear()
+        MEMO.clear()
+        LOG.info("Reloaded the strings and %s", ", ".join(name for name, *_ in loaded))
+        return True
+
+
+# Reloads the actions of the running bot
+RELOADER = ActionReloader()
@@ -0,0 +1,184 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark what one message costs, from tokenizing it to the actions.
+
+A corpus resembling a busy channel, where some messages are addressed to
+Marvin with the triggers of the actions, is pushed through Bot.tokenize
+and IrcBot.checkMarvinActions, and every action is called with every
+message of it. Network calls are answered at once by a stub and sending
+replies is skipped, so only the work done by the bot is measured. Run
+from the root of the repo:
+
+python3 -m benchmarks.bench_dispatch [--messages N] [--output FILE]
+
+Messages per second, latency percentiles and allocated memory for each
+action are printed and written as JSON to the output file, so the
+results of two commits can be compared.
+"""
+
+import argparse
+from collections import deque
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from types import SimpleNamespace
+import warnings
+
+from bot import Bot
+from irc_bot import IrcBot
+import marvin_actions
+import marvin_general_actions
+
+
+WORDS = [
+    "hej", "hjälp", "lunch", "smörgås", "python", "irc", "kod", "källkod", "git",
+    "merge", "rebase", "funkar", "inte", "varför", "ja", "nej", "kanske", "imorgon",
+    "idag", "tack", "kursen", "labben", "kmom01", "redovisning", "https://dbwebb.se",
+]
+
+# One response for every upstream service the actions talk to
+STUB_JSON = {
+    "recenttracks": {"track": [{"artist": {"#text": "Queen"}, "name": "Innuendo",
+                                "url": "https://last.fm/queen"}]},
+    "results": {"sunrise": "4:35:12 AM", "sunset": "9:05:43 PM"},
+    "dagar": [{"namnsdag": ["Ada", "Adina"]}],
+    "value": "Chuck Norris can divide by zero.",
+}
+STUB_HTML = (b"<h1>Karlskrona</h1><h4>Idag</h4><p>Regn</p>"
+             b"<strong><a>Ada</a></strong><strong><a>Bertil</a></strong>")
+
+
+# Answers every request at once with the same response
+STUB_RESPONSE = SimpleNamespace(text=json.dumps(STUB_JSON), content=STUB_HTML,
+                                json=lambda: STUB_JSON)
+STUB_HTTP = SimpleNamespace(get=lambda url, **kwargs: STUB_RESPONSE)
+
+
+def allActions():
+    """Return all actions, specific and general"""
+    return marvin_actions.getAllActions() + marvin_general_actions.getAllGeneralActions()
+
+
+def generateCorpus(count, nick="marvin", seed=1):
+    """Return raw lines from a channel, some of them asking Marvin something"""
+    rand = random.Random(seed)
+    keywords = [keyword for action in allActions() for keyword in action.triggers]
+    lines = []
+    for _ in range(count):
+        user = f"user{rand.randint(0, 300)}"
+        text = [rand.choice(WORDS) for _ in range(rand.randint(1, 15))]
+        roll = rand.random()
+        if roll < 0.3:
+            text.insert(rand.randint(0, len(text)), rand.choice(keywords))
+            text.insert(0, rand.choice([nick, nick + ":", nick + ","]))
+        elif roll < 0.35:
+            text.insert(0, rand.choice(marvin_general_actions.marvinMorning.triggers))
+        lines.append(f":{user}!~{user}@host.example PRIVMSG #db-o-webb :{' '.join(text)}")
+    return lines
+
+
+def createBot():
+    """Return an IrcBot with all actions, which does not send its replies"""
+    bot = IrcBot()
+    bot.CONFIG.update({"nick": "marvin", "channel": "#db-o-webb"})
+    bot.IRCLOG = deque([], bot.CONFIG["irclogmax"])
+    bot.sendMsg = lambda msg: True
+    bot.registerActions(marvin_actions.getAllActions())
+    bot.registerGeneralActions(marvin_general_actions.getAllGeneralActions())
+    return bot
+
+
+def percentiles(samples):
+    """Return the p50, p90, p99 and max of latencies in ns, as microseconds"""
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    result = {f"p{p}": ordered[last * p // 100] / 1000 for p in (50, 90, 99)}
+    result["max"] = ordered[-1] / 1000
+    return result
+
+
+def throughput(name, func, items):
+    """Call func with every item and return the messages per second"""
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    rate = len(items) / (time.perf_counter() - start)
+    print(f"{name:<24} {rate:>12.0f} msgs/s")
+    return rate
+
+
+def allocated(func, items):
+    """Return the bytes allocated and still held, per call, by calling func with every item"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    peaks = []
+    for item in items:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func(item)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {"peak": statistics.mean(peaks), "held": held / len(items)}
+
+
+def measureAction(action, rows):
+    """Return latency percentiles and allocations of an action over all rows"""
+    samples = []
+    clock = time.perf_counter_ns
+    for row in rows:
+        start = clock()
+        action(row)
+        samples.append(clock() - start)
+    result = percentiles(samples)
+    result["bytes"] = allocated(action, rows)
+    print(f"{action.__name__:<24} {result['p50']:>9.1f} {result['p90']:>9.1f}"
+          f" {result['p99']:>9.1f} {result['max']:>10.1f}"
+          f" {result['bytes']['peak']:>10.0f} {result['bytes']['held']:>8.1f}")
+    return result
+
+
+def main():
+    """Parse options and run the benchmark"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--output", default="build/bench_dispatch.json")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    marvin_actions.HTTP = STUB_HTTP
+    marvin_actions.setConfig({"lastfm": {"user": "marvin", "apikey": "secret"}})
+    marvin_actions.CACHE.clear()
+
+    lines = generateCorpus(args.messages)
+    texts = [line.split(" :", 1)[1] for line in lines]
+    words = [line.split() for line in lines]
+    rows = [Bot.tokenize(text) for text in texts]
+    bot = createBot()
+
+    print(f"Corpus: {len(lines)} messages")
+    results = {
+        "messages": len(lines),
+        "tokenize": throughput("tokenize", Bot.tokenize, texts),
+        "checkMarvinActions": throughput("checkMarvinActions", bot.checkMarvinActions, words),
+        "actions": {},
+    }
+
+    print(f"{'action':<24} {'p50 µs':>9} {'p90 µs':>9} {'p99 µs':>9} {'max µs':>10}"
+          f" {'peak B':>10} {'held B':>8}")
+    for action in allActions():
+        results["actions"][action.__name__] = measureAction(action, rows)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark splitting IRC traffic into lines.
+
+Pushes megabytes of traffic through the LineFramer in reads of varying
+size and compares it with the old approach of decoding every read as a
+whole and splitting it on newline. Run from the root of the repo:
+
+python3 -m benchmarks.bench_framer [--capture FILE] [--megabytes N]
+
+Without a capture file, traffic resembling a busy channel is generated.
+"""
+
+import argparse
+import random
+import time
+
+from irc_bot import IrcBot
+from irc_framer import LineFramer
+
+
+WORDS = [
+    "marvin", "hej", "hjälp", "väder", "lunch", "smörgås", "räksmörgås", "python",
+    "irc", "kod", "källkod", "git", "commit", "merge", "rebase", "funkar", "inte",
+    "varför", "ja", "nej", "kanske", "imorgon", "idag", "😀", "tack", "https://dbwebb.se",
+]
+
+
+def generateTraffic(megabytes, seed=1):
+    """Return bytes looking like traffic from a busy channel"""
+    rand = random.Random(seed)
+    lines = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        if rand.random() < 0.02:
+            line = f"PING :irc.example.{rand.randint(0, 9)}\r\n"
+        else:
+            nick = f"user{rand.randint(0, 300)}"
+            text = " ".join(rand.choice(WORDS) for _ in range(rand.randint(1, 25)))
+            line = f":{nick}!~{nick}@host.example PRIVMSG #db-o-webb :{text}\r\n"
+        data = line.encode()
+        lines.append(data)
+        size += len(data)
+    return b"".join(lines)
+
+
+def chunked(data, sizes, seed=2):
+    """Split data into reads of random size chosen from sizes"""
+    rand = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        size = rand.choice(sizes)
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def intact(line):
+    """Check that a decoded line was not cut at a read boundary"""
+    start = line[:1] == ":" or line[:4].isupper()
+    return start and line.rstrip("\r")[-1:] not in ("", " ")
+
+
+def legacyReceive(bot, chunks):
+    """The old receive, decoding each read as a whole and dropping partial lines"""
+    count = 0
+    for chunk in chunks:
+        lines = bot.decode_irc(chunk).split("\n")
+        lines.pop()
+        count += sum(1 for line in lines if intact(line) and line.endswith("\r"))
+    return count
+
+
+def framedReceive(bot, chunks):
+    """Frame the reads into lines and decode only complete lines"""
+    framer = LineFramer()
+    count = 0
+    for chunk in chunks:
+        count += sum(1 for line in framer.feed(chunk) if intact(bot.decode_irc(line)))
+    return count
+
+
+def framedOnly(bot, chunks):
+    """Frame the reads into lines without decoding them"""
+    framer = LineFramer()
+    count = 0
+    for chunk in chunks:
+        count += len(framer.feed(chunk))
+    return count
+
+
+def measure(name, func, bot, chunks, expected):
+    """Run one variant and print its throughput"""
+    size = sum(len(chunk) for chunk in chunks)
+    start = time.perf_counter()
+    count = func(bot, chunks)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {len(chunks):>8} reads {size / elapsed / 1024 / 1024:>8.1f} MB/s"
+          f" {count / elapsed:>11.0f} lines/s {count:>9} of {expected} lines intact")
+
+
+def main():
+    """Parse options and run the benchmark"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capture", help="file with raw traffic to use")
+    parser.add_argument("--megabytes", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+    else:
+        data = generateTraffic(args.megabytes)
+
+    expected = data.count(b"\n")
+    bot = IrcBot()
+    print(f"Traffic: {len(data) / 1024 / 1024:.1f} MB, {expected} lines")
+
+    for sizes in [(2048,), (65536,), (512, 1400, 4096, 65536)]:
+        chunks = chunked(data, sizes)
+        print(f"Read sizes {sizes}:")
+        measure("legacy", legacyReceive, bot, chunks, expected)
+        measure("framer", framedReceive, bot, chunks, expected)
+        measure("framing", framedOnly, bot, chunks, expected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Load test the IRC bot against a local stand-in for an IRC server.
+
+The stand-in listens on localhost and the bot, a real IrcBot in a
+process of its own, connects to it over TCP and logs in. The stand-in
+then plays the traffic of many clients through that connection:
+
+chatty      hundreds of clients talking, some of them asking Marvin
+pingstorm   a burst of PINGs, all waiting for their PONG
+joinburst   a burst of clients joining the channel
+slowreader  chatty clients while the stand-in reads the replies slowly
+
+Among the traffic are probes, PINGs and messages asking Marvin to google
+a unique token, which are timed until the PONG or reply carrying the
+token comes back. Nothing but Python is needed, no Docker and no
+network. Run from the root of the repo:
+
+python3 -m benchmarks.bench_load [--clients N] [--messages N] [--transport sync|asyncio]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+
+CHANNEL = "#db-o-webb"
+
+WORDS = [
+    "hej", "lunch", "smörgås", "python", "kod", "git", "merge", "rebase", "funkar",
+    "inte", "varför", "ja", "nej", "kanske", "imorgon", "tack", "kursen", "labben",
+]
+
+PROBE = re.compile(rb"probe(\d+)")
+
+BOT = """
+from irc_bot import IrcBot
+import marvin_actions
+import marvin_general_actions
+bot = IrcBot()
+bot.CONFIG.update({config!r})
+bot.registerActions(marvin_actions.getAllActions())
+bot.registerGeneralActions(marvin_general_actions.getAllGeneralActions())
+bot.begin()
+"""
+
+
+class StandInServer():
+    """
+    An IRC server for a single connection, the bot, playing the traffic
+    of simulated clients to it and timing the probes among the traffic.
+    """
+    def __init__(self):
+        self.server = None
+        self.writer = None
+        self.joined = asyncio.Event()
+        self.pending = {}
+        self.probes = 0
+        self.readSize = 65536
+        self.readDelay = 0.0
+
+    async def start(self):
+        """Listen on a free port on localhost and return the port"""
+        self.server = await asyncio.start_server(self.accept, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def accept(self, reader, writer):
+        """
+        Take the connection from the bot, only one is expected, and read
+        what it sends, noting when it joins and timing the probes.
+        """
+        self.writer = writer
+        buffer = b""
+        while True:
+            data = await reader.read(self.readSize)
+            if not data:
+                return
+            if self.readDelay:
+                await asyncio.sleep(self.readDelay)
+            buffer += data
+            *lines, buffer = buffer.split(b"\r\n")
+            now = time.perf_counter()
+            for line in lines:
+                if line.startswith(b"JOIN "):
+                    self.joined.set()
+                match = PROBE.search(line)
+                future = self.pending.pop(int(match.group(1)), None) if match else None
+                if future and not future.done():
+                    future.set_result(now)
+
+    def probe(self):
+        """Return a new probe token and the future set when it comes back"""
+        self.probes += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.probes] = future
+        return f"probe{self.probes}", future
+
+    async def send(self, lines):
+        """Send lines to the bot"""
+        self.writer.write("".join(line + "\r\n" for line in lines).encode())
+        await self.writer.drain()
+
+    async def close(self):
+        """Close the connection, which makes the bot exit"""
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        self.server.close()
+
+
+def chat(rand, clients):
+    """Return a line from a random client talking in the channel"""
+    user = f"user{rand.randint(0, clients - 1)}"
+    text = " ".join(rand.choice(WORDS) for _ in range(rand.randint(1, 15)))
+    return f":{user}!~{user}@client.example PRIVMSG {CHANNEL} :{text}"
+
+
+async def playTraffic(server, lines, probeEvery, askMarvin, batch=200):
+    """
+    Send the lines in batches, with a probe after every probeEvery lines.
+    Return the result of collect for the probes.
+    """
+    futures = []
+    start = time.perf_counter()
+    for pos in range(0, len(lines), batch):
+        chunk = lines[pos:pos + batch]
+        for _ in range(0, len(chunk), probeEvery):
+            token, future = server.probe()
+            sent = time.perf_counter()
+            futures.append((sent, future))
+            if askMarvin:
+                chunk.append(f":prober!~p@client.example PRIVMSG {CHANNEL} :marvin google {token}")
+            else:
+                chunk.append(f"PING :{token}")
+        await server.send(chunk)
+
+    return await collect(start, futures)
+
+
+async def pingStorm(server, count):
+    """Send count PINGs at once, return when all were answered like playTraffic"""
+    futures = []
+    lines = []
+    start = time.perf_counter()
+    for _ in range(count):
+        token, future = server.probe()
+        futures.append((start, future))
+        lines.append(f"PING :{token}")
+    await server.send(lines)
+    return await collect(start, futures)
+
+
+async def collect(start, futures, timeout=10):
+    """
+    Wait up to timeout seconds for the probes to come back. Return the
+    seconds from start until the last came back, the latencies of those
+    that did and the number of probes. Probes the bot dropped never do.
+    """
+    await asyncio.wait([future for _, future in futures], timeout=timeout)
+    done = [(sent, future.result()) for sent, future in futures if future.done()]
+    elapsed = max(received for _, received in done) - start if done else timeout
+    return elapsed, [received - sent for sent, received in done], len(futures)
+
+
+async def scenarios(server, args):
+    """Run every scenario and return their results"""
+    rand = random.Random(1)
+    results = {}
+
+    lines = [chat(rand, args.clients) for _ in range(args.messages)]
+    results["chatty"] = await playTraffic(server, lines, 50, True)
+
+    results["pingstorm"] = await pingStorm(server, args.pings)
+
+    lines = [f":join{i}!~join{i}@client.example JOIN {CHANNEL}" for i in range(args.joins)]
+    results["joinburst"] = await playTraffic(server, lines, 100, False)
+
+    server.readSize = 512
+    server.readDelay = 0.005
+    lines = [chat(rand, args.clients) for _ in range(args.messages // 4)]
+    results["slowreader"] = await playTraffic(server, lines, 20, True)
+    server.readSize = 65536
+    server.readDelay = 0.0
+    return results
+
+
+def percentile(ordered, p):
+    """Return the p:th percentile of sorted samples, in milliseconds"""
+    return ordered[(len(ordered) - 1) * p // 100] * 1000 if ordered else float("nan")
+
+
+def report(name, result, lines):
+    """Print throughput and probe latencies of a scenario"""
+    elapsed, latencies, probes = result
+    ordered = sorted(latencies)
+    print(f"{name:<11} {lines:>7} lines {lines / elapsed:>9.0f} lines/s"
+          f" {len(ordered):>5}/{probes:<5} probes"
+          f" p50 {percentile(ordered, 50):>8.2f} ms p99 {percentile(ordered, 99):>8.2f} ms"
+          f" max {percentile(ordered, 100):>8.2f} ms")
+
+
+async def run(args):
+    """Start the stand-in and the bot, play the scenarios and report"""
+    server = StandInServer()
+    port = await server.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            "server": "127.0.0.1",
+            "port": port,
+            "channel": CHANNEL,
+            "transport": args.transport,
+            "floodrate": args.floodrate,
+            "floodburst": args.floodrate,
+            "irclogfile": os.path.join(tmp, "irclog.txt"),
+            "dirIncoming": os.path.join(tmp, "incoming"),
+            "dirDone": os.path.join(tmp, "done"),
+        }
+        start = time.perf_counter()
+        with subprocess.Popen([sys.executable, "-c", BOT.format(config=config)],
+                              stdout=subprocess.DEVNULL) as bot:
+            await asyncio.wait_for(server.joined.wait(), 30)
+            print(f"Bot joined {(time.perf_counter() - start) * 1000:.1f} ms after starting,"
+                  f" transport {args.transport}, {args.clients} clients")
+
+            results = await scenarios(server, args)
+            report("chatty", results["chatty"], args.messages)
+            report("pingstorm", results["pingstorm"], args.pings)
+            report("joinburst", results["joinburst"], args.joins)
+            report("slowreader", results["slowreader"], args.messages // 4)
+
+            await server.close()
+            try:
+                bot.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({name: {"seconds": elapsed, "latencies": latencies, "probes": probes}
+                       for name, (elapsed, latencies, probes) in results.items()}, f)
+
+
+def main():
+    """Parse options and run the load test"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--pings", type=int, default=2000)
+    parser.add_argument("--joins", type=int, default=5000)
+    parser.add_argument("--transport", choices=["sync", "asyncio"], default="sync")
+    parser.add_argument("--floodrate", type=float, default=1e9,
+                        help="messages per second the bot may send, unlimited by default")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the whole path of a line, from the socket to the reply.
+
+Traffic captured by running the bot with --capturefile is replayed at
+full speed through IrcBot.mainLoop, with the socket replaced by one in
+memory. Every line is framed, decoded, logged and dispatched to the
+actions, and replies go through the send queue and the writer thread
+like when connected to a server. Network calls of the actions are
+answered at once by a stub and flood control is turned off. Run from
+the root of the repo:
+
+python3 -m benchmarks.bench_replay [--capture FILE] [--messages N] [--read-size N]
+
+Without a capture file, traffic from a channel is generated. Lines
+handled per second, the latency from reading a line to sending its
+reply and how the outgoing bytes were written are printed.
+"""
+
+import argparse
+from collections import defaultdict, deque
+import contextlib
+import os
+import random
+import tempfile
+import threading
+import time
+import warnings
+
+from benchmarks.bench_dispatch import STUB_HTTP, generateCorpus
+from irc_bot import IrcBot
+import marvin_actions
+import marvin_general_actions
+
+
+class FakeSocket():
+    """
+    A socket returning the captured traffic in reads of read size and
+    recording everything sent. When the traffic is used up it waits for
+    the replies to be sent before telling the bot the connection closed.
+    """
+    def __init__(self, data, readSize):
+        self.reads = deque(data[pos:pos + readSize] for pos in range(0, len(data), readSize))
+        self.lastRead = time.perf_counter()
+        self.firstRead = None
+        self.finished = None
+        self.pending = defaultdict(deque)
+        self.unsent = 0
+        self.sent = []
+        self.latencies = []
+        self.lock = threading.Condition()
+
+    def recv(self, _size):
+        """Return the next read, or nothing once all replies are sent"""
+        if self.reads:
+            self.lastRead = time.perf_counter()
+            if self.firstRead is None:
+                self.firstRead = self.lastRead
+            return self.reads.popleft()
+
+        self.finished = time.perf_counter()
+        with self.lock:
+            self.lock.wait_for(lambda: self.unsent == 0, timeout=10)
+        return b""
+
+    def expect(self, data):
+        """Remember when the line a reply answers was read"""
+        with self.lock:
+            self.pending[data].append(self.lastRead)
+            self.unsent += 1
+
+    def forget(self, data):
+        """The reply was dropped and will never be sent"""
+        with self.lock:
+            self.pending[data].pop()
+            self.unsent -= 1
+            self.lock.notify_all()
+
+    def sendall(self, data):
+        """Record what was sent and how long after its line was read"""
+        now = time.perf_counter()
+        with self.lock:
+            self.sent.append(len(data))
+            stamps = self.pending.get(data)
+            if stamps:
+                self.latencies.append(now - stamps.popleft())
+                self.unsent -= 1
+                self.lock.notify_all()
+
+
+def createBot(tmp):
+    """Return an IrcBot with all actions and flood control turned off"""
+    bot = IrcBot()
+    bot.CONFIG.update({
+        "nick": "marvin",
+        "channel": "#db-o-webb",
+        "floodrate": 1e9,
+        "floodburst": 1e9,
+        "sendqueuemax": 100000,
+        "irclogfile": os.path.join(tmp, "irclog.txt"),
+        "historyfile": os.path.join(tmp, "history.jsonl"),
+        "dirIncoming": os.path.join(tmp, "incoming"),
+        "dirDone": os.path.join(tmp, "done"),
+    })
+    bot.registerActions(marvin_actions.getAllActions())
+    bot.registerGeneralActions(marvin_general_actions.getAllGeneralActions())
+    return bot
+
+
+def generateTraffic(messages, seed=1):
+    """Return bytes of channel traffic with a PING now and then"""
+    rand = random.Random(seed)
+    lines = []
+    for line in generateCorpus(messages, seed=seed):
+        if rand.random() < 0.01:
+            lines.append(f"PING :irc.example.{rand.randint(0, 9)}")
+        lines.append(line)
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def replay(data, readSize, tmp):
+    """Replay the traffic through the main loop, return the socket with what happened"""
+    sock = FakeSocket(data, readSize)
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        bot = createBot(tmp)
+        bot.SOCKET = sock
+        sendMsg = bot.sendMsg
+
+        def expectReply(msg):
+            """Send the message, remembering the line it answers"""
+            data = msg.encode()
+            sock.expect(data)
+            sent = sendMsg(msg)
+            if not sent:
+                sock.forget(data)
+            return sent
+
+        bot.sendMsg = expectReply
+        bot.startSending()
+        bot.login()
+        bot.mainLoop()
+    return sock
+
+
+def percentile(ordered, p):
+    """Return the p:th percentile of sorted samples, in milliseconds"""
+    return ordered[(len(ordered) - 1) * p // 100] * 1000 if ordered else 0.0
+
+
+def main():
+    """Parse options and run the benchmark"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capture", help="file with raw traffic recorded by the bot")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--read-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+    else:
+        data = generateTraffic(args.messages)
+
+    warnings.simplefilter("ignore")
+    marvin_actions.HTTP = STUB_HTTP
+    marvin_actions.setConfig({"lastfm": {"user": "marvin", "apikey": "secret"}})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = replay(data, args.read_size, tmp)
+
+    lines = data.count(b"\n")
+    elapsed = sock.finished - sock.firstRead
+    latencies = sorted(sock.latencies)
+    print(f"Traffic: {len(data) / 1024:.0f} KiB, {lines} lines in reads of {args.read_size}")
+    print(f"Handled {lines / elapsed:.0f} lines/s, {len(latencies)} replies")
+    print(f"Reply latency p50 {percentile(latencies, 50):.2f} ms,"
+          f" p90 {percentile(latencies, 90):.2f} ms,"
+          f" p99 {percentile(latencies, 99):.2f} ms,"
+          f" max {percentile(latencies, 100):.2f} ms")
+    print(f"Written {sum(sock.sent)} bytes in {len(sock.sent)} sendall calls,"
+          f" {sum(sock.sent) / max(1, len(sock.sent)):.0f} bytes per call"
+          f" and {len(sock.sent) / max(1, len(latencies)):.2f} calls per reply")
+
+
+if __name__ == "__main__":
+    main()
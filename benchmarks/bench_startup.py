@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark how fast the bot starts and how much memory it uses.
+
+For IRC the bot is started against a local server and timed until it
+sends JOIN, its resident memory is read at that point. For Discord,
+which needs a real token to connect, the time and memory to import main
+and create the bot are measured. Every measurement is also made with the
+heavy dependencies imported up front, as all of them were before they
+were imported lazily. Run from the root of the repo:
+
+python3 -m benchmarks.bench_startup [--runs N]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules the bot used to import at startup, whatever the protocol
+HEAVY = ["asyncio", "chardet", "requests", "bs4", "discord"]
+
+CREATE_BOT = """
+import resource, time
+start = time.perf_counter()
+{imports}
+import main
+main.createBot({protocol!r})
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+RUN_MAIN = """
+{imports}
+import runpy, sys
+sys.argv = {argv!r}
+runpy.run_path("main.py", run_name="__main__")
+"""
+
+
+def python(template, preload, **kwargs):
+    """Return the command running the template, importing the heavy modules first if preload"""
+    imports = f"import {', '.join(HEAVY)}" if preload else ""
+    return [sys.executable, "-c", template.format(imports=imports, **kwargs)]
+
+
+def rssOf(pid):
+    """Return the resident memory of a process in KiB"""
+    with open(f"/proc/{pid}/status", encoding="UTF-8") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def createBot(protocol, preload):
+    """Return seconds and max RSS in KiB to import main and create the bot"""
+    output = subprocess.run(
+        python(CREATE_BOT, preload, protocol=protocol),
+        capture_output=True, text=True, check=True
+    ).stdout.split("\n")
+    elapsed, rss = output[-2].split()
+    return float(elapsed), int(rss)
+
+
+def timeToJoin(preload, tmp):
+    """Return seconds from starting main.py irc until JOIN, and the RSS in KiB then"""
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        server.settimeout(30)
+        config = os.path.join(tmp, "config.json")
+        with open(config, "w", encoding="UTF-8") as f:
+            json.dump({
+                "server": "127.0.0.1",
+                "port": server.getsockname()[1],
+                "channel": "#bench",
+                "irclogfile": os.path.join(tmp, "irclog.txt"),
+                "dirIncoming": os.path.join(tmp, "incoming"),
+                "dirDone": os.path.join(tmp, "done"),
+            }, f)
+
+        start = time.perf_counter()
+        with subprocess.Popen(
+                python(RUN_MAIN, preload, argv=["main.py", "irc", "--config", config]),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) as proc:
+            conn, _ = server.accept()
+            with conn:
+                data = b""
+                while b"JOIN" not in data:
+                    chunk = conn.recv(4096)
+                    if not chunk:
+                        break
+                    data += chunk
+                elapsed = time.perf_counter() - start
+                rss = rssOf(proc.pid)
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return elapsed, rss
+
+
+def report(name, samples):
+    """Print the median time and memory of the samples"""
+    seconds = statistics.median(sample[0] for sample in samples)
+    rss = statistics.median(sample[1] for sample in samples)
+    print(f"{name:<32} {seconds * 1000:>8.1f} ms {rss / 1024:>8.1f} MiB")
+
+
+def main():
+    """Parse options and run the benchmark"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Median of {args.runs} runs, eager imports {', '.join(HEAVY)} up front")
+    with tempfile.TemporaryDirectory() as tmp:
+        for preload in (False, True):
+            mode = "eager" if preload else "lazy"
+            report(f"irc time to JOIN ({mode})",
+                   [timeToJoin(preload, tmp) for _ in range(args.runs)])
+            for protocol in ("irc", "discord"):
+                report(f"{protocol} create bot ({mode})",
+                       [createBot(protocol, preload) for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,18 @@
 Module for the common base class for all Bots
 """
 
-import re
+import logging
+import time
+
+from action_memo import MEMO
+from action_meta import ActionIndex
+from message import parse
+from metrics import METRICS, MetricsServer
+from profiler import PROFILER
+from structured_log import fields
+
+LOG = logging.getLogger("marvin.bot")
+
 
 class Bot():
     """Base class for things common between different protocols"""
@@ -13,6 +24,8 @@ class Bot():
         self.CONFIG = {}
         self.ACTIONS = []
         self.GENERAL_ACTIONS = []
+        self.ACTION_INDEX = ActionIndex(self.ACTIONS)
+        self.GENERAL_ACTION_INDEX = ActionIndex(self.GENERAL_ACTIONS)
 
     def getConfig(self):
         """Return the current configuration"""
@@ -24,19 +37,65 @@ class Bot():
 
     def registerActions(self, actions):
         """Register actions to use"""
-        print("Adding actions:")
-        for action in actions:
-            print(" - " + action.__name__)
+        LOG.info("Adding actions: %s", ", ".join(action.__name__ for action in actions))
         self.ACTIONS.extend(actions)
+        self.ACTION_INDEX.sync()
 
     def registerGeneralActions(self, actions):
         """Register general actions to use"""
-        print("Adding general actions:")
-        for action in actions:
-            print(" - " + action.__name__)
+        LOG.info("Adding general actions: %s", ", ".join(action.__name__ for action in actions))
         self.GENERAL_ACTIONS.extend(actions)
+        self.GENERAL_ACTION_INDEX.sync()
+
+    def actionsFor(self, words):
+        """Return the registered actions that may respond to the tokenized message"""
+        return self.ACTION_INDEX.candidates(words)
+
+    def generalActionsFor(self, words):
+        """Return the general actions that may respond to the tokenized message"""
+        return self.GENERAL_ACTION_INDEX.candidates(words)
+
+    @staticmethod
+    def runAction(action, words):
+        """
+        Run an action, counting and timing it by name, and return its
+        response. Responses of deterministic and random choice actions are
+        remembered.
+        """
+        labels = {"action": action.__name__}
+        METRICS.inc("marvin_action_calls_total", labels)
+        start = time.perf_counter()
+        try:
+            response = MEMO.run(action, words)
+        except Exception:
+            METRICS.inc("marvin_action_errors_total", labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            METRICS.observe("marvin_action_seconds", elapsed, labels)
+            PROFILER.record(action.__name__, elapsed)
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug("Action ran", extra=fields(
+                    action=action.__name__, latency=f"{elapsed * 1000:.3f}ms"
+                ))
+        if response:
+            METRICS.inc("marvin_action_hits_total", labels)
+        return response
+
+    def startMetrics(self):
+        """Serve the metrics over HTTP when a port is configured, return the server or None"""
+        port = self.CONFIG.get("metricsport")
+        if not port:
+            return None
+        try:
+            server = MetricsServer(METRICS, self.CONFIG.get("metricshost", "127.0.0.1"), port)
+        except OSError as err:
+            LOG.error("Failed serving metrics on port %s. %s", port, err)
+            return None
+        server.start()
+        return server
 
     @staticmethod
     def tokenize(message):
-        """Split a message into normalized tokens"""
-        return re.sub("[,.?:]", " ", message).strip().lower().split()
+        """Return the message as a Message of normalized tokens, cached for lines seen lately"""
+        return parse(message)
@@ -0,0 +1,154 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for calling upstream services that may be slow or down.
+
+Every call gets a hard deadline, it runs in a pool of threads and the
+caller stops waiting for it when the deadline has passed, cancelling it
+if it has not started. An upstream with too many calls still running is
+not called again until one of them ends. After a number of failures in
+a row the circuit opens and calls fail at once, without touching the
+upstream. When it has been open for a while the next call
+starts a probe in the background, still failing at once itself, and the
+circuit closes again when the probe succeeds.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import logging
+import threading
+import time
+
+from metrics import METRICS
+
+LOG = logging.getLogger("marvin.circuit")
+
+# Threads running the calls to all upstream services, created on first use
+EXECUTOR = None
+
+# Guards the executor and the state of all circuits, calls are few enough
+LOCK = threading.Lock()
+
+# Calls to one upstream running at once, those given up on included, so
+# an upstream that hangs can not take all threads of the pool
+CONCURRENCY = 2
+
+# Calls running for each upstream
+RUNNING = {}
+
+
+def executor():
+    """Return the pool of threads running the calls"""
+    global EXECUTOR
+    with LOCK:
+        if EXECUTOR is None:
+            EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="upstream")
+        return EXECUTOR
+
+
+class CircuitOpen(Exception):
+    """The upstream failed too many times lately and was not called"""
+
+
+class CircuitBreaker():
+    """Deadline and circuit breaker for the calls to one upstream service"""
+    def __init__(self, name, failures=3, resetAfter=30.0, deadline=4.0):
+        self.name = name
+        self.failures = failures
+        self.resetAfter = resetAfter
+        self.deadline = deadline
+        self.failed = 0
+        self.openedAt = None
+        self.probing = None
+
+    def call(self, func, *args):
+        """
+        Return func(*args), raising CircuitOpen when the circuit is open
+        and TimeoutError when the deadline passes first.
+        """
+        with LOCK:
+            if self.openedAt is not None:
+                if self.probing is None and time.monotonic() - self.openedAt >= self.resetAfter:
+                    self.probing = threading.Thread(
+                        target=self.probe, args=(func, args), name=f"probe-{self.name}",
+                        daemon=True
+                    )
+                    self.probing.start()
+                METRICS.inc("marvin_circuit_rejected_total", {"upstream": self.name})
+                raise CircuitOpen(f"{self.name} is failing, not calling it")
+
+        try:
+            result = self.run(func, args)
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True)
+        return result
+
+    def run(self, func, args):
+        """
+        Run func in the pool and wait for it until the deadline. Fail at once
+        when the upstream already has CONCURRENCY calls running.
+        """
+        with LOCK:
+            running = RUNNING.get(self.name, 0)
+            if running >= CONCURRENCY:
+                raise TimeoutError(f"{self.name} is still busy with {running} calls")
+            RUNNING[self.name] = running + 1
+        try:
+            future = executor().submit(func, *args)
+        except Exception:
+            self.finished()
+            raise
+        future.add_done_callback(self.finished)
+        try:
+            return future.result(timeout=self.deadline)
+        except FutureTimeout as err:
+            future.cancel()
+            raise TimeoutError(
+                f"{self.name} did not answer within {self.deadline} seconds"
+            ) from err
+
+    def finished(self, _future=None):
+        """Count a call to the upstream as no longer running"""
+        with LOCK:
+            RUNNING[self.name] -= 1
+
+    def probe(self, func, args):
+        """Call the upstream once more in the background and close the circuit if it answers"""
+        try:
+            self.run(func, args)
+            succeeded = True
+        except Exception as err:
+            LOG.warning("Probing %s failed. %s", self.name, err)
+            succeeded = False
+        self.record(succeeded)
+        with LOCK:
+            self.probing = None
+
+    def record(self, succeeded):
+        """Count a call, opening or closing the circuit"""
+        with LOCK:
+            if succeeded:
+                if self.openedAt is not None:
+                    LOG.info("Circuit for %s closed", self.name)
+                self.failed = 0
+                self.openedAt = None
+                return
+            self.failed += 1
+            if self.failed >= self.failures:
+                if self.openedAt is None:
+                    LOG.warning("Circuit for %s opened after %s failures", self.name, self.failed)
+                    METRICS.inc("marvin_circuit_opened_total", {"upstream": self.name})
+                self.openedAt = time.monotonic()
+
+    def isOpen(self):
+        """Check if calls currently fail at once"""
+        with LOCK:
+            return self.openedAt is not None
+
+    def reset(self):
+        """Close the circuit and forget the failures"""
+        with LOCK:
+            self.failed = 0
+            self.openedAt = None
@@ -7,42 +7,116 @@ Module for the Discord bot.
 Connecting, sending and receiving messages and doing custom actions.
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
 import discord
 
+from action_reload import RELOADER
 from bot import Bot
+from metrics import METRICS
+from profiler import PROFILER, OPTIONS as PROFILER_OPTIONS
+from structured_log import fields, logRaw, OPTIONS as LOG_OPTIONS
+
+LOG = logging.getLogger("marvin.discord")
 
 class DiscordBot(discord.Client, Bot):
     """Bot implementing the discord protocol"""
     def __init__(self):
         Bot.__init__(self)
         self.CONFIG = {
-            "token": ""
+            "token": "",
+            "actionworkers": 4,
+            "actiontimeout": 10.0,
+            "metricshost": "127.0.0.1",
+            "metricsport": 0,
+            **PROFILER_OPTIONS,
+            **LOG_OPTIONS,
         }
         intents = discord.Intents.default()
         intents.message_content = True
         discord.Client.__init__(self, intents=intents)
 
+        # Threads executing the actions, created on first use
+        self.EXECUTOR = None
+
+        # Listener serving the metrics, when a port is configured
+        self.METRICS_SERVER = None
+
     def begin(self):
         """Start the bot"""
+        self.METRICS_SERVER = self.startMetrics()
+        PROFILER.configure(self.CONFIG)
         self.run(self.CONFIG.get("token"))
 
+    def executor(self):
+        """Return the bounded pool of threads executing the actions"""
+        if self.EXECUTOR is None:
+            self.EXECUTOR = ThreadPoolExecutor(
+                max_workers=max(1, self.CONFIG.get("actionworkers", 1)),
+                thread_name_prefix="action"
+            )
+        return self.EXECUTOR
+
+    async def runActions(self, actions, words):
+        """
+        Run the actions concurrently in the executor and return their
+        responses in registration order. An action failing or not answering
+        within actiontimeout seconds of the start of all of them is skipped,
+        its thread can not be stopped but the event loop does not wait for it.
+        """
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self.executor(), self.runAction, action, words)
+            for action in actions
+        ]
+        timeout = self.CONFIG.get("actiontimeout")
+        deadline = loop.time() + timeout if timeout else None
+
+        for action, future in zip(actions, futures):
+            try:
+                remaining = None if deadline is None else max(0, deadline - loop.time())
+                response = await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                LOG.warning("Action timed out after %s seconds", timeout,
+                            extra=fields(action=action.__name__))
+                continue
+            except Exception as err:
+                LOG.warning("Action failed: %s", err, extra=fields(action=action.__name__))
+                continue
+            if response:
+                yield response
+
     async def checkMarvinActions(self, message):
         """Check if Marvin should perform any actions"""
         words = self.tokenize(message.content)
         if self.user.name.lower() in words:
-            for action in self.ACTIONS:
-                response = action(words)
-                if response:
-                    await message.channel.send(response)
+            actions = self.actionsFor(words)
         else:
-            for action in self.GENERAL_ACTIONS:
-                response = action(words)
-                if response:
-                    await message.channel.send(response)
+            actions = self.generalActionsFor(words)
+
+        async for response in self.runActions(actions, words):
+            await message.channel.send(response)
+            METRICS.inc("marvin_messages_sent_total", {"protocol": "discord"})
+
+    async def close(self):
+        """Close the connection and stop the threads executing the actions"""
+        await super().close()
+        if self.EXECUTOR:
+            self.EXECUTOR.shutdown(wait=False, cancel_futures=True)
+            self.EXECUTOR = None
+        if self.METRICS_SERVER:
+            self.METRICS_SERVER.stop()
+            self.METRICS_SERVER = None
+        PROFILER.stop()
 
     async def on_message(self, message):
         """Hook run on every message"""
-        print(f"#{message.channel.name} <{message.author}> {message.content}")
+        logRaw(message.content, channel=f"#{message.channel.name}", nick=message.author)
+        METRICS.inc("marvin_messages_received_total", {"protocol": "discord"})
+        PROFILER.tick()
+        RELOADER.tick()
         if message.author.name == self.user.name:
             # don't react to own messages
             return
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the HTTP client shared by all actions talking to the web.
+
+Every host gets a session of its own which keeps its connections alive,
+so only the first request to a host pays for DNS, TCP and TLS. All
+requests get the same timeouts and are retried on connection errors and
+on responses saying the upstream is temporarily unavailable.
+"""
+
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import METRICS
+
+# Seconds to wait for a connection and for the response
+TIMEOUT = (3.05, 5)
+
+# Retry twice, waiting a little longer each time, on errors worth retrying
+RETRIES = {
+    "total": 2,
+    "backoff_factor": 0.3,
+    "status_forcelist": (502, 503, 504),
+    "allowed_methods": ("GET", "HEAD"),
+}
+
+
+class HttpClient():
+    """
+    Pooled keep-alive sessions, one for each host. requests is imported
+    when the first session is created, not when the module is loaded.
+    """
+    def __init__(self, timeout=TIMEOUT, retries=None, poolSize=4):
+        self.timeout = timeout
+        self.retries = RETRIES if retries is None else retries
+        self.poolSize = poolSize
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def session(self, url):
+        """Return the session for the host of the url, created on first use"""
+        # pylint: disable=import-outside-toplevel
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        host = urlsplit(url).netloc
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                adapter = HTTPAdapter(
+                    max_retries=Retry(**self.retries),
+                    pool_connections=1,
+                    pool_maxsize=self.poolSize
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            self.requests += 1
+        return session
+
+    def get(self, url, **kwargs):
+        """GET the url, raising requests.HTTPError if the response is an error"""
+        kwargs.setdefault("timeout", self.timeout)
+        labels = {"host": urlsplit(url).netloc}
+        start = time.perf_counter()
+        try:
+            response = self.session(url).get(url, **kwargs)
+            response.raise_for_status()
+        except Exception:
+            METRICS.inc("marvin_http_errors_total", labels)
+            raise
+        finally:
+            METRICS.observe("marvin_http_request_seconds", time.perf_counter() - start, labels)
+        return response
+
+    def counters(self):
+        """Return the number of hosts, requests and connections opened to send them"""
+        with self.lock:
+            sessions = list(self.sessions.values())
+            stats = {"hosts": len(sessions), "requests": self.requests}
+
+        connections = 0
+        for session in sessions:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    connections += pool.num_connections if pool else 0
+        stats["connections"] = connections
+        stats["reused"] = max(0, stats["requests"] - connections)
+        return stats
+
+    def close(self):
+        """Close all sessions and their connections"""
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for watching the incoming directory for new files.
+
+On Linux inotify tells when a file has been written and closed, or moved
+into the directory, so new files are handed over right away. Elsewhere,
+or if inotify is not available, the directory is polled.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+LOG = logging.getLogger("marvin.incoming")
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def loadInotify():
+    """Return libc if it has inotify, otherwise None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.restype = ctypes.c_int
+        libc.inotify_add_watch.restype = ctypes.c_int
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class IncomingWatcher(threading.Thread):
+    """
+    Watch a directory in a background thread and hand over the names of new
+    files in batches. Events arriving within batchDelay of each other end up
+    in one batch of at most maxBatch files.
+    """
+    def __init__(self, directory, callback, interval=1.0, batchDelay=0.05, maxBatch=100):
+        super().__init__(name="incoming", daemon=True)
+        self.directory = directory
+        self.callback = callback
+        self.interval = interval
+        self.batchDelay = batchDelay
+        self.maxBatch = maxBatch
+        self.stopped = threading.Event()
+        self.mode = None
+
+    def listing(self):
+        """Return the files in the directory, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        paths = [os.path.join(self.directory, name) for name in names]
+        return sorted((p for p in paths if os.path.isfile(p)), key=os.path.getmtime)
+
+    def deliver(self, paths):
+        """Hand over the files that still exist, return those still left afterwards"""
+        paths = [path for path in paths if os.path.isfile(path)]
+        if not paths:
+            return []
+        try:
+            self.callback(paths)
+        except Exception as err:
+            LOG.error("Failed handling incoming files. %s", err)
+        return [path for path in paths if os.path.isfile(path)]
+
+    def openInotify(self):
+        """Start watching the directory with inotify, return the fd or None"""
+        libc = loadInotify()
+        if libc is None or not os.path.isdir(self.directory):
+            return None
+
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            return None
+
+        path = os.fsencode(os.path.abspath(self.directory))
+        if libc.inotify_add_watch(fd, path, IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def readEvents(self, fd):
+        """Read pending inotify events and return the paths they concern"""
+        data = os.read(fd, 64 * 1024)
+        paths = []
+        pos = 0
+        while pos < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b"\0")
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, look at everything in the directory
+                paths.extend(self.listing())
+            elif name:
+                paths.append(os.path.join(self.directory, os.fsdecode(name)))
+        return paths
+
+    def watchInotify(self, fd):
+        """Deliver files as inotify reports them, until stopped"""
+        self.mode = "inotify"
+        try:
+            # Files that were there before we started watching
+            left = self.deliver(self.listing())
+
+            while not self.stopped.is_set():
+                ready, _, _ = select.select([fd], [], [], self.interval)
+                if not ready:
+                    # Try again with files that were not handled the last time
+                    left = self.deliver(left)
+                    continue
+
+                batch = list(left)
+                while ready and len(batch) < self.maxBatch:
+                    for path in self.readEvents(fd):
+                        if path not in batch:
+                            batch.append(path)
+                    ready, _, _ = select.select([fd], [], [], self.batchDelay)
+                left = self.deliver(batch)
+        finally:
+            os.close(fd)
+
+    def watchPolling(self):
+        """Deliver files found when listing the directory, until stopped"""
+        self.mode = "polling"
+        while not self.stopped.is_set():
+            self.deliver(self.listing())
+            self.stopped.wait(self.interval)
+
+    def run(self):
+        """Watch the directory with inotify if possible, otherwise poll it"""
+        fd = self.openInotify()
+        if fd is None:
+            self.watchPolling()
+        else:
+            self.watchInotify(fd)
+
+    def stop(self):
+        """Stop watching"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for running the IRC bot on asyncio streams.
+
+Reading, writing and executing actions run as separate tasks, so a slow
+action can not hold up PING/PONG or the rest of the channel traffic.
+Lines are framed with the same LineFramer as the synchronous transport.
+PING is answered on the stream by the reader, not through the send queue.
+Actions are ordinary synchronous functions and are executed in the
+default thread pool of the event loop, the writer waits for the send
+queue in a thread of its own.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from action_reload import RELOADER
+from irc_decode import lineFields
+from metrics import METRICS
+from profiler import PROFILER
+from structured_log import logRaw
+
+LOG = logging.getLogger("marvin.irc")
+
+
+class AsyncIrcTransport():
+    """
+    Drive an IrcBot using asyncio streams. The writer task drains the send
+    queue of the bot, which IrcBot.sendMsg fills from any thread.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.loop = None
+        self.reader = None
+        self.writer = None
+        self.outgoing = None
+        self.writerThread = None
+        self.work = None
+
+    async def connect(self):
+        """Connect to the server and log in, return False on failure"""
+        server = self.bot.CONFIG["server"]
+        port = self.bot.CONFIG["port"]
+
+        if not (server and port):
+            LOG.error("Failed to connect, missing server or port in configuration.")
+            return False
+
+        LOG.info("Connecting: %s:%s", server, port)
+        self.reader, self.writer = await asyncio.open_connection(server, port)
+        self.bot.login()
+        return True
+
+    async def readLoop(self):
+        """Read lines, answer the IRC protocol and queue work for the actions"""
+        while True:
+            data = await self.reader.read(self.bot.CONFIG["recvsize"])
+            if not data:
+                LOG.info("Connection closed by server.")
+                return
+
+            self.bot.capture(data)
+            lines = self.bot.FRAMER.feed(data)
+            METRICS.inc("marvin_messages_received_total", {"protocol": "irc"}, len(lines))
+            RELOADER.tick()
+            for raw in lines:
+                line = self.bot.decode_irc(raw).strip()
+                words = line.split()
+
+                if not words:
+                    continue
+
+                logRaw(line, **lineFields(words))
+                PROFILER.tick()
+                if words[0] == "PING":
+                    self.pong(words)
+                else:
+                    self.bot.checkIrcActions(words)
+                self.bot.logPrivMsg(words)
+                await self.work.put(words)
+            await self.writer.drain()
+
+    def pong(self, words):
+        """
+        Answer PING on the stream at once. The send queue is only drained
+        between reads, a read with more PINGs than it holds would drop some.
+        """
+        msg = f"PONG {words[1]}\r\n"
+        self.writer.write(msg.encode())
+        METRICS.inc("marvin_messages_sent_total", {"protocol": "irc"})
+        LOG.info("SEND: %s", msg.rstrip("\r\n"))
+
+    async def writeLoop(self):
+        """Write queued messages to the server, waiting for them in a thread of its own"""
+        while True:
+            data = await self.loop.run_in_executor(self.writerThread, self.outgoing.get)
+            if data is None:
+                return
+            self.writer.write(data)
+            await self.writer.drain()
+
+    async def actionLoop(self):
+        """Execute the actions for queued messages"""
+        while True:
+            words = await self.work.get()
+            try:
+                await self.loop.run_in_executor(None, self.bot.dispatchActions, words)
+            except Exception as err:
+                LOG.warning("Action failed: %s", err)
+
+    async def run(self):
+        """Connect and run all tasks until the server closes the connection"""
+        self.loop = asyncio.get_running_loop()
+        self.outgoing = self.bot.openSendQueue()
+        self.writerThread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self.work = asyncio.Queue()
+        METRICS.collect("marvin_action_queue_depth", "gauge",
+                        lambda: [({"protocol": "irc"}, self.work.qsize())])
+
+        if not await self.connect():
+            self.writerThread.shutdown()
+            return
+
+        self.bot.startWorkers()
+
+        workers = max(1, self.bot.CONFIG.get("actionworkers", 1))
+        tasks = [asyncio.create_task(self.writeLoop())]
+        tasks += [asyncio.create_task(self.actionLoop()) for _ in range(workers)]
+
+        try:
+            await self.readLoop()
+        finally:
+            self.outgoing.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.writerThread.shutdown()
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.bot.stopWorkers()
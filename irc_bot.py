@@ -10,15 +10,40 @@ Keeping a log and reading incoming material.
 """
 from collections import deque
 from datetime import datetime
-import json
+import logging
 import os
 import re
 import shutil
 import socket
+import sys
 
-import chardet
-
+from action_reload import RELOADER
 from bot import Bot
+from incoming_watcher import IncomingWatcher
+from irc_decode import Decoder, lineFields
+from irc_framer import LineFramer
+from irc_history import HistoryStore
+from irc_log import IrcLogWriter
+from irc_send_queue import QueueWriter, SendQueue
+from metrics import METRICS
+from profiler import PROFILER, OPTIONS as PROFILER_OPTIONS
+from structured_log import fields, logRaw, OPTIONS as LOG_OPTIONS
+
+LOG = logging.getLogger("marvin.irc")
+
+
+def onEventLoop():
+    """Check if the calling thread is running an asyncio event loop"""
+    # There is no event loop unless someone has imported asyncio
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
 
 class IrcBot(Bot):
     """Bot implementing the IRC protocol"""
@@ -33,17 +58,47 @@ class IrcBot(Bot):
             "ident": None,
             "irclogfile": "irclog.txt",
             "irclogmax": 20,
+            "irclogflush": 2,
+            "historyfile": "",
+            "historymaxbytes": 10 * 1024 * 1024,
+            "historyrotate": "size",
             "dirIncoming": "incoming",
             "dirDone": "done",
+            "incomingpoll": 1,
+            "floodrate": 1.0,
+            "floodburst": 5,
+            "sendqueuemax": 500,
+            "sendtimeout": 10,
             "lastfm": None,
+            "recvsize": 65536,
+            "transport": "sync",
+            "actionworkers": 4,
+            "capturefile": "",
+            "metricshost": "127.0.0.1",
+            "metricsport": 0,
+            **PROFILER_OPTIONS,
+            **LOG_OPTIONS,
         }
 
         # Socket for IRC server
         self.SOCKET = None
 
+        # Parts working beside the main loop while connected, the watcher
+        # of the incoming directory, the irclog writer and the send queue
+        self.WORKERS = {}
+
+        # Lines split from the data read from the socket
+        self.FRAMER = LineFramer()
+
+        # Decoding of lines, remembering the encoding of each sender
+        self.DECODER = Decoder()
+
         # Keep a log of the latest messages
         self.IRCLOG = None
 
+        # File recording the raw traffic from the server, when capturing
+        self.CAPTURE = None
+
 
     def connectToServer(self):
         """Connect to the IRC Server"""
@@ -54,19 +109,25 @@ class IrcBot(Bot):
 
         if server and port:
             self.SOCKET = socket.socket()
-            print("Connecting: {SERVER}:{PORT}".format(SERVER=server, PORT=port))
+            LOG.info("Connecting: %s:%s", server, port)
             self.SOCKET.connect((server, port))
+            self.startSending()
         else:
-            print("Failed to connect, missing server or port in configuration.")
+            LOG.error("Failed to connect, missing server or port in configuration.")
             return
 
+        self.login()
+
+    def login(self):
+        """Identify with the server and join the channel"""
+
         # Send the nick to server
         nick = self.CONFIG["nick"]
         if nick:
             msg = 'NICK {NICK}\r\n'.format(NICK=nick)
             self.sendMsg(msg)
         else:
-            print("Ignore sending nick, missing nick in configuration.")
+            LOG.warning("Ignore sending nick, missing nick in configuration.")
 
         # Present yourself
         realname = self.CONFIG["realname"]
@@ -77,36 +138,79 @@ class IrcBot(Bot):
         if ident:
             self.sendMsg('PRIVMSG nick IDENTIFY {IDENT}\r\n'.format(IDENT=ident))
         else:
-            print("Ignore identifying with password, ident is not set.")
+            LOG.info("Ignore identifying with password, ident is not set.")
 
         # Join a channel
         channel = self.CONFIG["channel"]
         if channel:
             self.sendMsg('JOIN {CHANNEL}\r\n'.format(CHANNEL=channel))
         else:
-            print("Ignore joining channel, missing channel name in configuration.")
+            LOG.warning("Ignore joining channel, missing channel name in configuration.")
 
     def sendPrivMsg(self, message, channel):
-        """Send and log a PRIV message"""
+        """Send and log a PRIV message, return False if it was dropped"""
+        msg = "PRIVMSG {CHANNEL} :{MSG}\r\n".format(CHANNEL=channel, MSG=message)
+        if not self.sendMsg(msg):
+            return False
+
         if channel == self.CONFIG["channel"]:
             self.ircLogAppend(user=self.CONFIG["nick"].ljust(8), message=message)
-
-        msg = "PRIVMSG {CHANNEL} :{MSG}\r\n".format(CHANNEL=channel, MSG=message)
-        self.sendMsg(msg)
+        return True
 
     def sendMsg(self, msg):
-        """Send and occasionally print the message sent"""
-        print("SEND: " + msg.rstrip('\r\n'))
-        self.SOCKET.send(msg.encode())
+        """Send and log the message, return False if the send queue dropped it"""
+        data = msg.encode()
+        queue = self.WORKERS.get("send")
+        if queue:
+            lane = "pong" if msg.startswith("PONG") else "channel"
+            # Only wait for room in the queue where it does not hold up reading
+            if lane == "channel" and not onEventLoop():
+                queued = queue.put(data, lane, self.CONFIG["sendtimeout"])
+            else:
+                queued = queue.put(data, lane, timeout=0)
+            if not queued:
+                METRICS.inc("marvin_messages_dropped_total", {"protocol": "irc"})
+                LOG.warning("DROP: %s", msg.rstrip("\r\n"), extra=fields(lane=lane))
+                return False
+        else:
+            self.SOCKET.sendall(data)
+
+        METRICS.inc("marvin_messages_sent_total", {"protocol": "irc"})
+        LOG.info("SEND: %s", msg.rstrip("\r\n"))
+        return True
+
+    def openSendQueue(self):
+        """Create the queue of messages to send, paced to avoid flooding"""
+        queue = SendQueue(
+            self.CONFIG["floodrate"],
+            self.CONFIG["floodburst"],
+            self.CONFIG["sendqueuemax"]
+        )
+        self.WORKERS["send"] = queue
+
+        for name, kind, field in [
+                ("marvin_send_queue_depth", "gauge", "depth"),
+                ("marvin_send_queue_dropped_total", "counter", "dropped"),
+                ("marvin_send_queue_wait_seconds_max", "gauge", "waitMax")]:
+            METRICS.collect(name, kind, lambda field=field: [
+                ({"lane": lane}, stats[field]) for lane, stats in queue.metrics().items()
+            ])
+        return queue
+
+    def startSending(self):
+        """Send queued messages to the socket from a writer thread"""
+        self.WORKERS["writer"] = QueueWriter(self.openSendQueue(), self.SOCKET.sendall)
+        self.WORKERS["writer"].start()
 
     def decode_irc(self, raw, preferred_encs=None):
         """
         Do character detection.
-        You can send preferred encodings as a list through preferred_encs.
+        You can send preferred encodings as a list through preferred_encs,
+        otherwise the decoder of the bot is used.
         http://stackoverflow.com/questions/938870/python-irc-bot-and-encoding-issue
         """
         if preferred_encs is None:
-            preferred_encs = ["UTF-8", "CP1252", "ISO-8859-1"]
+            return self.DECODER.decode(raw)
 
         changed = False
         enc = None
@@ -120,6 +224,7 @@ class IrcBot(Bot):
 
         if not changed:
             try:
+                import chardet  # pylint: disable=import-outside-toplevel
                 enc = chardet.detect(raw)['encoding']
                 res = raw.decode(enc)
             except Exception:
@@ -128,17 +233,29 @@ class IrcBot(Bot):
         return res
 
     def receive(self):
-        """Read incoming message and guess encoding"""
+        """
+        Read incoming data and return the complete lines in it with their
+        encoding guessed. Return None when the connection is closed or lost.
+        """
         try:
-            buf = self.SOCKET.recv(2048)
-            lines = self.decode_irc(buf)
-            lines = lines.split("\n")
-            buf = lines.pop()
-        except Exception as err:
-            print("Error reading incoming message. " + err)
+            data = self.SOCKET.recv(self.CONFIG["recvsize"])
+        except OSError as err:
+            LOG.error("Error reading incoming message. %s", err)
+            return None
 
+        if not data:
+            return None
+
+        self.capture(data)
+        lines = [self.decode_irc(line) for line in self.FRAMER.feed(data)]
+        METRICS.inc("marvin_messages_received_total", {"protocol": "irc"}, len(lines))
         return lines
 
+    def capture(self, data):
+        """Append raw data from the server to the capture file, when capturing"""
+        if self.CAPTURE:
+            self.CAPTURE.write(data)
+
     def ircLogAppend(self, line=None, user=None, message=None):
         """Read incoming message and guess encoding"""
         if not user:
@@ -153,10 +270,85 @@ class IrcBot(Bot):
             'msg': message
         })
 
-    def ircLogWriteToFile(self):
-        """Write IRClog to file"""
-        with open(self.CONFIG["irclogfile"], 'w', encoding="UTF-8") as f:
-            json.dump(list(self.IRCLOG), f, indent=2)
+        writer = self.WORKERS.get("irclog")
+        if writer:
+            writer.markDirty()
+            writer.record({
+                'time': datetime.now().isoformat(timespec="seconds"),
+                'user': user.strip(),
+                'msg': message
+            })
+
+    def startWorkers(self):
+        """
+        Create the irclog and start writing it to file when it changes,
+        start sending files as soon as they show up in the incoming directory
+        and serve the metrics when a port is configured.
+        """
+        self.IRCLOG = deque([], self.CONFIG["irclogmax"])
+
+        if self.CONFIG.get("capturefile"):
+            # pylint: disable=consider-using-with
+            self.CAPTURE = open(self.CONFIG["capturefile"], "ab")
+
+        history = None
+        if self.CONFIG.get("historyfile"):
+            history = HistoryStore(
+                self.CONFIG["historyfile"],
+                self.CONFIG["historymaxbytes"],
+                self.CONFIG["historyrotate"]
+            )
+
+        self.WORKERS["irclog"] = IrcLogWriter(
+            self.CONFIG["irclogfile"],
+            self.CONFIG["irclogflush"],
+            lambda: list(self.IRCLOG),
+            history
+        )
+        self.WORKERS["irclog"].start()
+
+        self.WORKERS["incoming"] = IncomingWatcher(
+            self.CONFIG["dirIncoming"],
+            self.sendIncoming,
+            self.CONFIG["incomingpoll"]
+        )
+        self.WORKERS["incoming"].start()
+
+        METRICS.collect("marvin_decoded_lines_total", "counter", lambda: [
+            ({"how": how}, count) for how, count in self.DECODER.stats.items()
+        ])
+        metrics = self.startMetrics()
+        if metrics:
+            self.WORKERS["metrics"] = metrics
+
+    def stopWorkers(self):
+        """
+        Stop watching the incoming directory and serving metrics, stop the
+        writer dropping messages not yet sent, write pending changes to the
+        irclog and the history, close the capture file and close an open
+        profiling window.
+        """
+        for name in ("incoming", "metrics"):
+            worker = self.WORKERS.pop(name, None)
+            if worker:
+                worker.stop()
+
+        queue = self.WORKERS.pop("send", None)
+        if queue:
+            queue.close()
+        writer = self.WORKERS.pop("writer", None)
+        if writer:
+            writer.stop()
+
+        logWriter = self.WORKERS.pop("irclog", None)
+        if logWriter:
+            logWriter.close()
+
+        if self.CAPTURE:
+            self.CAPTURE.close()
+            self.CAPTURE = None
+
+        PROFILER.stop()
 
     def readincoming(self):
         """
@@ -167,44 +359,83 @@ class IrcBot(Bot):
             return
 
         listing = os.listdir(self.CONFIG["dirIncoming"])
+        self.sendIncoming([os.path.join(self.CONFIG["dirIncoming"], f) for f in listing])
 
-        for infile in listing:
-            filename = os.path.join(self.CONFIG["dirIncoming"], infile)
-
-            with open(filename, "r", encoding="UTF-8") as f:
-                for msg in f:
-                    self.sendPrivMsg(msg, self.CONFIG["channel"])
+    def sendIncoming(self, filenames):
+        """
+        Send the content of the files as messages and move them to directory
+        done. A file that can not be read is moved there with the suffix
+        .failed, without stopping the files after it. When the send queue
+        drops a message, the file is left in the incoming directory with the
+        messages not yet sent, to be sent on a later read.
+        """
+        for filename in filenames:
+            target = self.CONFIG["dirDone"]
+            try:
+                with open(filename, "r", encoding="UTF-8") as f:
+                    messages = f.readlines()
+            except (OSError, UnicodeDecodeError) as err:
+                LOG.error("Failed reading incoming file %s. %s", filename, err)
+                target = os.path.join(target, os.path.basename(filename) + ".failed")
+                messages = []
+
+            sent = 0
+            while sent < len(messages) and self.sendPrivMsg(messages[sent],
+                                                            self.CONFIG["channel"]):
+                sent += 1
+            if sent < len(messages):
+                LOG.warning("Leaving incoming file %s, the send queue is full.", filename)
+                try:
+                    with open(filename, "w", encoding="UTF-8") as f:
+                        f.writelines(messages[sent:])
+                except OSError as err:
+                    LOG.error("Failed rewriting incoming file %s. %s", filename, err)
+                continue
 
             try:
-                shutil.move(filename, self.CONFIG["dirDone"])
+                shutil.move(filename, target)
             except Exception:
-                os.remove(filename)
+                if os.path.exists(filename):
+                    os.remove(filename)
 
     def mainLoop(self):
         """For ever, listen and answer to incoming chats"""
-        self.IRCLOG = deque([], self.CONFIG["irclogmax"])
-
-        while 1:
-            # Write irclog
-            self.ircLogWriteToFile()
-
-            # Check in any in the incoming directory
-            self.readincoming()
-
-            for line in self.receive():
-                print(line)
-                words = line.strip().split()
-
-                if not words:
-                    continue
-
-                self.checkIrcActions(words)
-                self.checkMarvinActions(words)
+        self.startWorkers()
+        try:
+            while 1:
+                lines = self.receive()
+                if lines is None:
+                    LOG.info("Connection closed.")
+                    return
+
+                for line in lines:
+                    words = line.strip().split()
+
+                    if not words:
+                        continue
+
+                    logRaw(line, **lineFields(words))
+                    PROFILER.tick()
+                    RELOADER.tick()
+                    self.checkIrcActions(words)
+                    self.checkMarvinActions(words)
+        finally:
+            self.stopWorkers()
 
     def begin(self):
         """Start the bot"""
-        self.connectToServer()
-        self.mainLoop()
+        PROFILER.configure(self.CONFIG)
+        transport = self.CONFIG.get("transport", "sync")
+        if transport == "sync":
+            self.connectToServer()
+            self.mainLoop()
+        elif transport == "asyncio":
+            # pylint: disable=import-outside-toplevel
+            import asyncio
+            from irc_async import AsyncIrcTransport
+            asyncio.run(AsyncIrcTransport(self).run())
+        else:
+            raise ValueError(f"Unsupported transport: {transport}")
 
     def checkIrcActions(self, words):
         """
@@ -219,22 +450,29 @@ class IrcBot(Bot):
 
     def checkMarvinActions(self, words):
         """Check if Marvin should perform any actions"""
+        self.logPrivMsg(words)
+        self.dispatchActions(words)
+
+    def logPrivMsg(self, words):
+        """Add messages to the channel to the irclog"""
         if words[1] == 'PRIVMSG' and words[2] == self.CONFIG["channel"]:
             self.ircLogAppend(words)
 
+    def dispatchActions(self, words):
+        """Let the first matching action answer a PRIV message"""
         if words[1] == 'PRIVMSG':
             raw = ' '.join(words[3:])
             row = self.tokenize(raw)
 
             if self.CONFIG["nick"] in row:
-                for action in self.ACTIONS:
-                    msg = action(row)
+                for action in self.actionsFor(row):
+                    msg = self.runAction(action, row)
                     if msg:
                         self.sendPrivMsg(msg, words[2])
                         break
             else:
-                for action in self.GENERAL_ACTIONS:
-                    msg = action(row)
+                for action in self.generalActionsFor(row):
+                    msg = self.runAction(action, row)
                     if msg:
                         self.sendPrivMsg(msg, words[2])
                         break
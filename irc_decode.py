@@ -0,0 +1,138 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for decoding lines from the IRC server.
+
+Pure ASCII and valid UTF-8 are decoded in a single pass without raising
+and catching any exception and without consulting chardet. Other
+lines are decoded with the encoding last learned for their sender, or
+CP1252 with ISO-8859-1 as the last resort. The encoding of senders that
+are not yet known is guessed with chardet in a background thread and
+remembered for their next line.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+def senderOf(raw):
+    """Return the user@host part of the prefix of a raw line, or None"""
+    if not raw.startswith(b":"):
+        return None
+    end = raw.find(b" ")
+    prefix = raw[1:end] if end >= 0 else raw[1:]
+    return prefix.partition(b"!")[2] or prefix
+
+
+def lineFields(words):
+    """Return the nick and channel of a decoded line split into words, as log fields"""
+    values = {}
+    if words[0].startswith(":"):
+        values["nick"] = words[0][1:].split("!", 1)[0]
+    if len(words) > 2 and words[1] == "PRIVMSG":
+        values["channel"] = words[2]
+    return values
+
+
+class Decoder():
+    """Decode raw lines and learn which encoding each sender uses"""
+    def __init__(self, fallback="CP1252", maxSenders=1024):
+        self.fallback = fallback
+        self.maxSenders = maxSenders
+        self.senders = OrderedDict()
+        self.lock = threading.Lock()
+        self.detecting = {}
+        self.executor = None
+        self.stats = {
+            "ascii": 0,
+            "utf8": 0,
+            "sender": 0,
+            "fallback": 0,
+            "latin1": 0,
+            "detected": 0,
+        }
+
+    def decode(self, raw):
+        """Decode a raw line"""
+        if raw.isascii():
+            self.stats["ascii"] += 1
+            return raw.decode("ascii")
+
+        try:
+            text = raw.decode("UTF-8")
+            self.stats["utf8"] += 1
+            return text
+        except UnicodeDecodeError:
+            pass
+
+        sender = senderOf(raw)
+        encoding = self.senders.get(sender)
+        if encoding:
+            try:
+                text = raw.decode(encoding)
+                self.stats["sender"] += 1
+                return text
+            except UnicodeDecodeError:
+                self.forget(sender)
+        elif sender:
+            self.detectLater(sender, raw)
+
+        try:
+            text = raw.decode(self.fallback)
+            self.stats["fallback"] += 1
+        except UnicodeDecodeError:
+            text = raw.decode("ISO-8859-1")
+            self.stats["latin1"] += 1
+
+        return text
+
+    def remember(self, sender, encoding):
+        """Remember the encoding used by a sender"""
+        with self.lock:
+            self.senders[sender] = encoding
+            self.senders.move_to_end(sender)
+            while len(self.senders) > self.maxSenders:
+                self.senders.popitem(last=False)
+
+    def forget(self, sender):
+        """Forget the encoding of a sender"""
+        with self.lock:
+            self.senders.pop(sender, None)
+
+    def detectLater(self, sender, raw):
+        """Guess the encoding of a sender in the background"""
+        with self.lock:
+            if sender in self.detecting:
+                return
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chardet")
+            self.detecting[sender] = self.executor.submit(self.detect, sender, raw)
+
+    def detect(self, sender, raw):
+        """Guess the encoding of a line with chardet and remember it for the sender"""
+        try:
+            import chardet  # pylint: disable=import-outside-toplevel
+            encoding = chardet.detect(raw)["encoding"]
+            if encoding:
+                raw.decode(encoding)
+                self.remember(sender, encoding)
+                with self.lock:
+                    self.stats["detected"] += 1
+        except Exception:
+            pass
+        finally:
+            with self.lock:
+                self.detecting.pop(sender, None)
+
+    def wait(self):
+        """Wait for all background detections to finish"""
+        with self.lock:
+            pending = list(self.detecting.values())
+        for future in pending:
+            future.result()
+
+    def counters(self):
+        """Return how many lines took each decoding path"""
+        return dict(self.stats)
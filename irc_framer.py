@@ -0,0 +1,43 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for splitting the byte stream from the IRC server into lines.
+"""
+
+
+class LineFramer():
+    """
+    Split a stream of bytes into lines. Partial lines are kept until the
+    rest of them arrives with a later read. Lines are split on LF and a
+    trailing CR is removed, which handles both CR-LF and bare LF servers.
+    """
+    def __init__(self, maxLength=65536):
+        self.buffer = bytearray()
+        self.maxLength = maxLength
+
+    def feed(self, data):
+        """Add data read from the socket and return all complete lines in it"""
+        self.buffer += data
+        end = self.buffer.rfind(b"\n")
+
+        if end < 0:
+            if len(self.buffer) > self.maxLength:
+                # No line ending in sight, pass it on rather than grow forever
+                line = bytes(self.buffer)
+                self.buffer.clear()
+                return [line]
+            return []
+
+        chunk = bytes(self.buffer[:end])
+        del self.buffer[:end + 1]
+
+        return [
+            line[:-1] if line.endswith(b"\r") else line
+            for line in chunk.split(b"\n")
+            if line and line != b"\r"
+        ]
+
+    def pending(self):
+        """Return the number of bytes waiting for the end of their line"""
+        return len(self.buffer)
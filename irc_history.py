@@ -0,0 +1,207 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for keeping the channel history in append only JSONL files.
+
+Every entry is appended as one JSON line and the file is rotated when it
+grows too big or, if configured, when the date changes. A small index
+next to each file records the offset of every INDEX_STRIDE:th entry. The
+latest entries are read from the end of the memory mapped file, so the
+cost depends on how many entries are asked for and not on the size of
+the history.
+"""
+
+from datetime import date
+import glob
+import json
+import mmap
+import os
+import re
+import threading
+
+INDEX_STRIDE = 1000
+
+
+class HistoryStore():
+    """Append only channel history with rotation and fast tail reads"""
+    def __init__(self, filename, maxBytes=10 * 1024 * 1024, rotate="size"):
+        self.filename = filename
+        self.maxBytes = maxBytes
+        self.rotate = rotate
+        self.lock = threading.Lock()
+        self.file = None
+        self.count = 0
+        self.day = None
+
+    def open(self):
+        """Open the current file for appending, count its entries if it exists"""
+        self.dropTornLine(self.filename)
+        self.file = open(self.filename, "ab")  # pylint: disable=consider-using-with
+        self.count = self.countEntries(self.filename)
+        self.day = self.fileDay()
+
+    def close(self):
+        """Close the current file"""
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def fileDay(self):
+        """Return the date the current file was last written"""
+        if os.path.getsize(self.filename):
+            return date.fromtimestamp(os.path.getmtime(self.filename))
+        return date.today()
+
+    @staticmethod
+    def dropTornLine(filename):
+        """Cut off a last line left without its line end by an interrupted write"""
+        if not os.path.exists(filename) or not os.path.getsize(filename):
+            return
+
+        with open(filename, "r+b") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[-1:] == b"\n":
+                    return
+                end = data.rfind(b"\n") + 1
+            f.truncate(end)
+
+    @staticmethod
+    def indexName(filename):
+        """Return the name of the offset index for a history file"""
+        return filename + ".idx"
+
+    @classmethod
+    def lastIndexed(cls, filename):
+        """Return the last entry number and offset recorded in the index of a file"""
+        last = (0, 0)
+        if os.path.exists(cls.indexName(filename)):
+            with open(cls.indexName(filename), encoding="UTF-8") as f:
+                for line in f:
+                    last = tuple(map(int, line.split()))
+        return last
+
+    @classmethod
+    def countEntries(cls, filename):
+        """Count the entries in a history file, reading only what follows the last index"""
+        number, offset = cls.lastIndexed(filename)
+        with open(filename, "rb") as f:
+            f.seek(offset)
+            rest = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+        return number + rest
+
+    def append(self, entry):
+        """Append an entry to the history"""
+        data = json.dumps(entry, ensure_ascii=False).encode("UTF-8") + b"\n"
+
+        with self.lock:
+            if self.file is None:
+                self.open()
+            if self.needsRotation(len(data)):
+                self.rotateFile()
+
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+
+            if self.count % INDEX_STRIDE == 0:
+                with open(self.indexName(self.filename), "a", encoding="UTF-8") as f:
+                    f.write(f"{self.count} {offset}\n")
+            self.count += 1
+
+    def needsRotation(self, size):
+        """Check if the current file should be rotated before writing size bytes"""
+        if self.rotate == "daily":
+            return self.count > 0 and self.day != date.today()
+        return self.count > 0 and self.file.tell() + size > self.maxBytes
+
+    def rotateFile(self):
+        """Move the current file and its index aside and start a new one"""
+        self.file.close()
+        stamp = self.day.strftime("%Y%m%d") if self.rotate == "daily" else ""
+        base, ext = os.path.splitext(self.filename)
+        previous = self.rotatedFiles()
+        number = self.rotationNumber(previous[-1]) + 1 if previous else 1
+        rotated = f"{base}.{stamp or 'part'}.{number:04d}{ext}"
+
+        os.replace(self.filename, rotated)
+        if os.path.exists(self.indexName(self.filename)):
+            os.replace(self.indexName(self.filename), self.indexName(rotated))
+
+        self.file = open(self.filename, "ab")  # pylint: disable=consider-using-with
+        self.count = 0
+        self.day = date.today()
+
+    def rotationNumber(self, name):
+        """Return the sequence number of a rotated file"""
+        ext = os.path.splitext(self.filename)[1]
+        return int(name[:len(name) - len(ext)].rsplit(".", 1)[1])
+
+    def rotatedFiles(self):
+        """Return the rotated files, oldest first"""
+        base, ext = os.path.splitext(self.filename)
+        pattern = re.compile(re.escape(base) + r"\.\w+\.\d{4,}" + re.escape(ext) + "$")
+        files = [name for name in glob.glob(glob.escape(base) + ".*") if pattern.match(name)]
+        return sorted(files, key=self.rotationNumber)
+
+    @staticmethod
+    def tailFile(filename, n):
+        """Return up to the last n entries of a file, oldest first"""
+        if n <= 0 or not os.path.exists(filename) or not os.path.getsize(filename):
+            return []
+
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = len(data)
+                if data[end - 1:end] == b"\n":
+                    end -= 1
+                lines = []
+                while len(lines) <= n and end > 0:
+                    start = data.rfind(b"\n", 0, end) + 1
+                    lines.append(data[start:end])
+                    end = start - 1
+
+        if not lines:
+            return []
+
+        try:
+            newest = [json.loads(lines[0])]
+        except ValueError:
+            # A torn last line, the writer was interrupted in the middle of it
+            newest = []
+        return [json.loads(line) for line in reversed(lines[1:n + 1 - len(newest)])] + newest
+
+    def tail(self, n):
+        """Return the latest n entries, oldest first, also from rotated files"""
+        with self.lock:
+            if self.file:
+                self.file.flush()
+            entries = self.tailFile(self.filename, n)
+            for rotated in reversed(self.rotatedFiles()):
+                if len(entries) >= n:
+                    break
+                entries = self.tailFile(rotated, n - len(entries)) + entries
+        return entries
+
+    def entry(self, number):
+        """Return entry number of the current file, using the offset index to seek"""
+        with self.lock:
+            if self.file:
+                self.file.flush()
+            first, offset = 0, 0
+            if os.path.exists(self.indexName(self.filename)):
+                with open(self.indexName(self.filename), encoding="UTF-8") as f:
+                    for line in f:
+                        indexed, position = map(int, line.split())
+                        if indexed > number:
+                            break
+                        first, offset = indexed, position
+
+            with open(self.filename, "rb") as f:
+                f.seek(offset)
+                for _ in range(number - first):
+                    f.readline()
+                line = f.readline()
+
+        return json.loads(line) if line else None
@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for writing the irclog, and optionally the channel history, to
+file in the background.
+"""
+
+from collections import deque
+import json
+import logging
+import os
+import threading
+
+LOG = logging.getLogger("marvin.irclog")
+
+
+class IrcLogWriter(threading.Thread):
+    """
+    Write the irclog to file in a background thread when it has changed, at
+    most once per interval. The file is written to a temporary file which
+    is then renamed over the old one, so readers never see a half written
+    log. Entries recorded for the history are appended to it by the same
+    thread.
+    """
+    def __init__(self, filename, interval, snapshot, history=None):
+        super().__init__(name="irclog", daemon=True)
+        self.filename = filename
+        self.interval = interval
+        self.snapshot = snapshot
+        self.history = history
+        self.pending = deque()
+        self.dirty = True
+        self.stopped = threading.Event()
+
+    def markDirty(self):
+        """Note that the log has changed since it was last written"""
+        self.dirty = True
+
+    def record(self, entry):
+        """Queue an entry to append to the history"""
+        if self.history:
+            self.pending.append(entry)
+
+    def writeHistory(self):
+        """Append the queued entries to the history"""
+        while self.pending:
+            entry = self.pending.popleft()
+            try:
+                self.history.append(entry)
+            except OSError as err:
+                self.pending.appendleft(entry)
+                LOG.error("Failed writing history to %s. %s", self.history.filename, err)
+                return
+
+    def flush(self):
+        """Write the log if it has changed, return True if it was written"""
+        if not self.dirty:
+            return False
+
+        self.dirty = False
+        try:
+            self.write(self.snapshot())
+        except OSError as err:
+            self.dirty = True
+            LOG.error("Failed writing irclog to %s. %s", self.filename, err)
+            return False
+        return True
+
+    def write(self, entries):
+        """Atomically replace the file with the entries"""
+        tmp = self.filename + ".tmp"
+        with open(tmp, "w", encoding="UTF-8") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp, self.filename)
+
+    def run(self):
+        """Write the log once per interval until stopped"""
+        while not self.stopped.wait(self.interval):
+            self.writeHistory()
+            self.flush()
+
+    def close(self):
+        """Stop the background thread, write any pending changes and close the history"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.writeHistory()
+        self.flush()
+        if self.history:
+            self.history.close()
@@ -0,0 +1,160 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the queue of messages to send to the IRC server.
+
+Messages wait in lanes until a single writer takes them. PONG has a lane
+of its own which is always emptied first and is not paced. Other messages
+are paced by a token bucket, so a burst of messages does not get the bot
+kicked for flooding. QueueWriter passes the messages on to a socket from
+a thread of its own.
+"""
+
+from collections import deque
+import logging
+import threading
+import time
+
+LOG = logging.getLogger("marvin.irc")
+
+LANES = ("pong", "channel")
+
+
+class TokenBucket():
+    """
+    Allow burst messages at once and rate messages per second over time.
+    A rate of zero or less disables pacing.
+    """
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.last = now
+
+    def refill(self, now):
+        """Add the tokens earned since the last refill"""
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def take(self, now):
+        """Take a token, return 0 if one was taken or else the seconds to wait"""
+        if self.rate <= 0:
+            return 0
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class SendQueue():
+    """Bounded queue of outgoing data with priority lanes and flood control"""
+    def __init__(self, rate=1.0, burst=5, maxSize=500, clock=time.monotonic):
+        self.clock = clock
+        self.bucket = TokenBucket(rate, burst, clock())
+        self.maxSize = maxSize
+        self.lanes = {lane: deque() for lane in LANES}
+        self.cond = threading.Condition()
+        self.closed = False
+        self.stats = {
+            lane: {"queued": 0, "sent": 0, "dropped": 0, "waitTotal": 0.0, "waitMax": 0.0}
+            for lane in LANES
+        }
+
+    def put(self, data, lane="channel", timeout=10):
+        """
+        Queue data to send. When the lane is full, wait up to timeout
+        seconds for space before dropping the data. Return True if queued.
+        """
+        with self.cond:
+            queue = self.lanes[lane]
+            if not self.cond.wait_for(lambda: len(queue) < self.maxSize or self.closed, timeout):
+                self.stats[lane]["dropped"] += 1
+                return False
+            if self.closed:
+                return False
+            queue.append((self.clock(), data))
+            self.stats[lane]["queued"] += 1
+            self.cond.notify_all()
+            return True
+
+    def pop(self, lane, now):
+        """Remove the next item of a lane and record how long it waited"""
+        queued, data = self.lanes[lane].popleft()
+        waited = now - queued
+        stats = self.stats[lane]
+        stats["sent"] += 1
+        stats["waitTotal"] += waited
+        stats["waitMax"] = max(stats["waitMax"], waited)
+        self.cond.notify_all()
+        return data
+
+    def get(self):
+        """Wait for the next data allowed to be sent, None when closed"""
+        with self.cond:
+            while not self.closed:
+                now = self.clock()
+                if self.lanes["pong"]:
+                    return self.pop("pong", now)
+                if self.lanes["channel"]:
+                    wait = self.bucket.take(now)
+                    if not wait:
+                        return self.pop("channel", now)
+                    self.cond.wait(wait)
+                else:
+                    self.cond.wait()
+            return None
+
+    def drainTo(self, send):
+        """Pass all data to send until the queue is closed"""
+        while True:
+            data = self.get()
+            if data is None:
+                return
+            send(data)
+
+    def close(self):
+        """Stop the writer and wake up everyone waiting"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def depth(self, lane=None):
+        """Return the number of queued items in a lane or in all lanes"""
+        with self.cond:
+            if lane:
+                return len(self.lanes[lane])
+            return sum(len(queue) for queue in self.lanes.values())
+
+    def metrics(self):
+        """Return depth, counters and wait times for each lane"""
+        with self.cond:
+            result = {}
+            for lane in LANES:
+                stats = dict(self.stats[lane])
+                stats["depth"] = len(self.lanes[lane])
+                stats["waitAvg"] = stats["waitTotal"] / stats["sent"] if stats["sent"] else 0.0
+                result[lane] = stats
+            return result
+
+
+class QueueWriter(threading.Thread):
+    """Pass everything from a send queue to send in a background thread"""
+    def __init__(self, queue, send):
+        super().__init__(name="writer", daemon=True)
+        self.queue = queue
+        self.send = send
+
+    def run(self):
+        """Send until the queue is closed or sending fails"""
+        try:
+            self.queue.drainTo(self.send)
+        except OSError as err:
+            LOG.error("Error sending message. %s", err)
+
+    def stop(self):
+        """Close the queue, dropping messages not yet sent, and wait for the writer"""
+        self.queue.close()
+        if self.is_alive():
+            self.join()
@@ -44,8 +44,9 @@ import json
 import os
 import sys
 
-from discord_bot import DiscordBot
-from irc_bot import IrcBot
+from action_reload import RELOADER
+from prefetch_scheduler import PrefetchScheduler
+from structured_log import setupLogging
 
 import marvin_actions
 import marvin_general_actions
@@ -118,6 +119,11 @@ def parseOptions(options):
     return options
 
 
+def prefetch():
+    """Warm the caches of the actions, of the module loaded last when reloaded"""
+    sys.modules["marvin_actions"].prefetch()
+
+
 def determineProtocol():
     """Parse the argument to determine what protocol to use"""
     parser = argparse.ArgumentParser()
@@ -127,10 +133,16 @@ def determineProtocol():
 
 
 def createBot(protocol):
-    """Return an instance of a bot with the requested implementation"""
+    """
+    Return an instance of a bot with the requested implementation. Only
+    the module of that bot is imported, discord.py is not loaded for IRC.
+    """
+    # pylint: disable=import-outside-toplevel
     if protocol == "irc":
+        from irc_bot import IrcBot
         return IrcBot()
     if protocol == "discord":
+        from discord_bot import DiscordBot
         return DiscordBot()
     raise ValueError(f"Unsupported protocol: {protocol}")
 
@@ -145,12 +157,19 @@ def main():
     options.update(mergeOptionsWithConfigFile(options, "marvin_config.json"))
     config = parseOptions(options)
     bot.setConfig(config)
+    setupLogging(config)
     marvin_actions.setConfig(options)
     marvin_general_actions.setConfig(options)
     actions = marvin_actions.getAllActions()
     general_actions = marvin_general_actions.getAllGeneralActions()
     bot.registerActions(actions)
     bot.registerGeneralActions(general_actions)
+    RELOADER.arm(bot)
+    PrefetchScheduler(
+        prefetch,
+        marvin_actions.PREFETCH_INTERVAL,
+        delay=marvin_actions.PREFETCH_DELAY
+    ).start()
     bot.begin()
 
     sys.exit(0)
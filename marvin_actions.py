@@ -5,14 +5,20 @@
 Make actions for Marvin, one function for each action.
 """
 from urllib.parse import quote_plus
-from urllib.request import urlopen
 import calendar
 import datetime
 import json
+import logging
 import random
-import requests
 
-from bs4 import BeautifulSoup
+from action_meta import deterministic, findTriggers, randomChoice, triggers
+from circuit_breaker import CircuitBreaker
+from http_client import HttpClient
+from metrics import METRICS
+from response_cache import ResponseCache
+from string_store import STRINGS
+
+LOG = logging.getLogger("marvin.actions")
 
 
 def getAllActions():
@@ -48,13 +54,49 @@ def getAllActions():
     ]
 
 
-# Load all strings from file
-with open("marvin_strings.json", encoding="utf-8") as f:
-    STRINGS = json.load(f)
-
 # Configuration loaded
 CONFIG = None
 
+# Keep-alive connections to the upstream services, shared by all actions
+HTTP = HttpClient()
+
+# Responses from upstream services, cached by the URL they were fetched from
+CACHE = ResponseCache(maxSize=64)
+
+METRICS.collect("marvin_cache_lookups_total", "counter", lambda: [
+    ({"result": result}, count) for result, count in CACHE.counters().items()
+])
+
+METRICS.collect("marvin_http_connections_total", "counter", lambda: [
+    ({"state": "opened" if name == "connections" else name}, count)
+    for name, count in HTTP.counters().items() if name in ("connections", "reused")
+])
+
+# Deadline and circuit breaker for each upstream service
+BREAKERS = {
+    name: CircuitBreaker(name)
+    for name in ["listen", "sun", "smhi", "birthday", "nameday", "joke", "commit"]
+}
+
+METRICS.collect("marvin_circuit_open", "gauge", lambda: [
+    ({"upstream": name}, int(breaker.isOpen())) for name, breaker in BREAKERS.items()
+])
+
+# Seconds a cached response is fresh, for each upstream service
+CACHE_TTL = {
+    "listen": 60,
+    "sun": 3600,
+    "smhi": 1800,
+    "birthday": 3600,
+    "nameday": 3600,
+}
+
+# Seconds between refreshing the responses describing today in the background
+PREFETCH_INTERVAL = 1800
+
+# Seconds after start before the first refresh, so it does not slow down connecting
+PREFETCH_DELAY = 30
+
 def setConfig(config):
     """
     Keep reference to the loaded configuration.
@@ -67,28 +109,24 @@ def getString(key, key1=None):
     """
     Get a string from the string database.
     """
-    data = STRINGS[key]
-    if isinstance(data, list):
-        res = data[random.randint(0, len(data) - 1)]
-    elif isinstance(data, dict):
-        if key1 is None:
-            res = data
-        else:
-            res = data[key1]
-            if isinstance(res, list):
-                res = res[random.randint(0, len(res) - 1)]
-    elif isinstance(data, str):
-        res = data
+    return STRINGS.get(key, key1)
 
-    return res
 
+def fetchCached(name, url, fetch):
+    """
+    Return the cached response from an upstream service, fetching it
+    through the circuit breaker of the service when needed.
+    """
+    return CACHE.get(url, CACHE_TTL[name], lambda: BREAKERS[name].call(fetch, url))
 
+
+@triggers("smile", "le", "skratta", "smilies")
 def marvinSmile(row):
     """
     Make Marvin smile.
     """
     msg = None
-    if any(r in row for r in ["smile", "le", "skratta", "smilies"]):
+    if findTriggers(row, marvinSmile.triggers):
         msg = getString("smile")
     return msg
 
@@ -98,22 +136,20 @@ def wordsAfterKeyWords(words, keyWords):
     Return all items in the words list after the first occurence
     of an item in the keyWords list.
     """
-    kwIndex = []
-    for kw in keyWords:
-        if kw in words:
-            kwIndex.append(words.index(kw))
-
-    if not kwIndex:
+    spans = findTriggers(words, keyWords)
+    if not spans:
         return None
 
-    return words[min(kwIndex)+1:]
+    return words[spans[0][1]:]
 
 
+@triggers("google", "googla")
+@randomChoice
 def marvinGoogle(row):
     """
     Let Marvin present an url to google.
     """
-    query = wordsAfterKeyWords(row, ["google", "googla"])
+    query = wordsAfterKeyWords(row, marvinGoogle.triggers)
     if not query:
         return None
 
@@ -124,12 +160,14 @@ def marvinGoogle(row):
     return msg.format(url)
 
 
+@triggers("explain", "förklara")
+@randomChoice
 def marvinExplainShell(row):
     """
     Let Marvin present an url to the service explain shell to
     explain a shell command.
     """
-    query = wordsAfterKeyWords(row, ["explain", "förklara"])
+    query = wordsAfterKeyWords(row, marvinExplainShell.triggers)
     if not query:
         return None
     cmd = " ".join(query)
@@ -139,23 +177,27 @@ def marvinExplainShell(row):
     return msg.format(url)
 
 
+@triggers("källkod", "source")
+@deterministic
 def marvinSource(row):
     """
     State message about sourcecode.
     """
     msg = None
-    if any(r in row for r in ["källkod", "source"]):
+    if findTriggers(row, marvinSource.triggers):
         msg = getString("source")
 
     return msg
 
 
+@triggers("budord", "stentavla")
+@deterministic
 def marvinBudord(row):
     """
     What are the budord for Marvin?
     """
     msg = None
-    if any(r in row for r in ["budord", "stentavla"]):
+    if findTriggers(row, marvinBudord.triggers):
         if any(r in row for r in ["#1", "1"]):
             msg = getString("budord", "#1")
         elif any(r in row for r in ["#2", "2"]):
@@ -170,12 +212,14 @@ def marvinBudord(row):
     return msg
 
 
+@triggers("quote", "citat", "filosofi", "filosofera")
+@randomChoice
 def marvinQuote(row):
     """
     Make a quote.
     """
     msg = None
-    if any(r in row for r in ["quote", "citat", "filosofi", "filosofera"]):
+    if findTriggers(row, marvinQuote.triggers):
         msg = getString("hitchhiker")
 
     return msg
@@ -197,72 +241,82 @@ def videoOfToday():
     return msg
 
 
+@triggers("idag", "dagens")
 def marvinVideoOfToday(row):
     """
     Show the video of today.
     """
     msg = None
-    if any(r in row for r in ["idag", "dagens"]):
+    if findTriggers(row, marvinVideoOfToday.triggers):
         if any(r in row for r in ["video", "youtube", "tube"]):
             msg = videoOfToday()
 
     return msg
 
 
+@triggers("vem")
+@deterministic
 def marvinWhoIs(row):
     """
     Who is Marvin.
     """
     msg = None
-    if all(r in row for r in ["vem", "är"]):
+    if "är" in row and findTriggers(row, marvinWhoIs.triggers):
         msg = getString("whois")
 
     return msg
 
 
+@triggers("hjälp", "help", "menu", "meny")
+@deterministic
 def marvinHelp(row):
     """
     Provide a menu.
     """
     msg = None
-    if any(r in row for r in ["hjälp", "help", "menu", "meny"]):
+    if findTriggers(row, marvinHelp.triggers):
         msg = getString("menu")
 
     return msg
 
 
+@triggers("stats", "statistik", "ircstats")
+@deterministic
 def marvinStats(row):
     """
     Provide a link to the stats.
     """
     msg = None
-    if any(r in row for r in ["stats", "statistik", "ircstats"]):
+    if findTriggers(row, marvinStats.triggers):
         msg = getString("ircstats")
 
     return msg
 
 
+@triggers("irc", "irclog", "log", "irclogg", "logg", "historik")
+@deterministic
 def marvinIrcLog(row):
     """
     Provide a link to the irclog
     """
     msg = None
-    if any(r in row for r in ["irc", "irclog", "log", "irclogg", "logg", "historik"]):
+    if findTriggers(row, marvinIrcLog.triggers):
         msg = getString("irclog")
 
     return msg
 
 
+@triggers(
+    "snälla", "hej", "tjena", "morsning", "morrn", "mår", "hallå",
+    "halloj", "läget", "snäll", "duktig", "träna", "träning",
+    "utbildning", "tack", "tacka", "tackar", "tacksam"
+)
 def marvinSayHi(row):
     """
     Say hi with a nice message.
     """
     msg = None
-    if any(r in row for r in [
-            "snälla", "hej", "tjena", "morsning", "morrn", "mår", "hallå",
-            "halloj", "läget", "snäll", "duktig", "träna", "träning",
-            "utbildning", "tack", "tacka", "tackar", "tacksam"
-    ]):
+    if findTriggers(row, marvinSayHi.triggers):
         smile = getString("smile")
         hello = getString("hello")
         friendly = getString("friendly")
@@ -271,6 +325,7 @@ def marvinSayHi(row):
     return msg
 
 
+@triggers("lunch", "mat", "äta", "luncha")
 def marvinLunch(row):
     """
     Help decide where to eat.
@@ -283,7 +338,7 @@ def marvinLunch(row):
         'göteborg goteborg gbg': 'lunch-goteborg'
     }
 
-    if any(r in row for r in ["lunch", "mat", "äta", "luncha"]):
+    if findTriggers(row, marvinLunch.triggers):
         lunchStr = getString('lunch-message')
 
         for keys, value in lunchOptions.items():
@@ -295,12 +350,13 @@ def marvinLunch(row):
     return None
 
 
+@triggers("lyssna", "lyssnar", "musik")
 def marvinListen(row):
     """
     Return music last listened to.
     """
     msg = None
-    if any(r in row for r in ["lyssna", "lyssnar", "musik"]):
+    if findTriggers(row, marvinListen.triggers):
 
         if not CONFIG["lastfm"]:
             return getString("listen", "disabled")
@@ -308,47 +364,45 @@ def marvinListen(row):
         url = "http://ws.audioscrobbler.com/2.0/"
 
         try:
-            params = dict(
-                method="user.getrecenttracks",
-                user=CONFIG["lastfm"]["user"],
-                api_key=CONFIG["lastfm"]["apikey"],
-                format="json",
-                limit="1"
-            )
+            msg = fetchCached("listen", url, getListening)
+        except Exception:
+            msg = getString("listen", "failed")
 
-            resp = requests.get(url=url, params=params, timeout=5)
-            data = json.loads(resp.text)
+    return msg
 
-            artist = data["recenttracks"]["track"][0]["artist"]["#text"]
-            title = data["recenttracks"]["track"][0]["name"]
-            link = data["recenttracks"]["track"][0]["url"]
 
-            msg = getString("listen", "success").format(artist=artist, title=title, link=link)
+def getListening(url):
+    """
+    Retrieves the track last listened to from last.fm
+    """
+    params = dict(
+        method="user.getrecenttracks",
+        user=CONFIG["lastfm"]["user"],
+        api_key=CONFIG["lastfm"]["apikey"],
+        format="json",
+        limit="1"
+    )
 
-        except Exception:
-            msg = getString("listen", "failed")
+    resp = HTTP.get(url, params=params)
+    data = json.loads(resp.text)
 
-    return msg
+    artist = data["recenttracks"]["track"][0]["artist"]["#text"]
+    title = data["recenttracks"]["track"][0]["name"]
+    link = data["recenttracks"]["track"][0]["url"]
 
+    return getString("listen", "success").format(artist=artist, title=title, link=link)
 
+
+@triggers("sol", "solen", "solnedgång", "soluppgång", "sun")
 def marvinSun(row):
     """
     Check when the sun goes up and down.
     """
     msg = None
-    if any(r in row for r in ["sol", "solen", "solnedgång", "soluppgång", "sun"]):
+    if findTriggers(row, marvinSun.triggers):
         try:
             url = getString("sun", "url")
-            r = requests.get(url, timeout=5)
-            sundata = r.json()
-            # Formats the time from the response to HH:mm instead of hh:mm:ss
-            sunrise = sundata["results"]["sunrise"].split()[0][:-3]
-            sunset = sundata["results"]["sunset"].split()[0][:-3]
-            # The api uses AM/PM notation, this converts the sunset to 12 hour time
-            sunsetHour = int(sunset.split(":")[0]) + 12
-            sunset = str(sunsetHour) + sunset[-3:]
-            msg = getString("sun", "msg").format(sunrise, sunset)
-            return msg
+            return fetchCached("sun", url, getSun)
 
         except Exception:
             return getString("sun", "error")
@@ -356,20 +410,31 @@ def marvinSun(row):
     return msg
 
 
+def getSun(url):
+    """
+    Retrieves when the sun goes up and down
+    """
+    r = HTTP.get(url)
+    sundata = r.json()
+    # Formats the time from the response to HH:mm instead of hh:mm:ss
+    sunrise = sundata["results"]["sunrise"].split()[0][:-3]
+    sunset = sundata["results"]["sunset"].split()[0][:-3]
+    # The api uses AM/PM notation, this converts the sunset to 12 hour time
+    sunsetHour = int(sunset.split(":")[0]) + 12
+    sunset = str(sunsetHour) + sunset[-3:]
+    return getString("sun", "msg").format(sunrise, sunset)
+
+
+@triggers("väder", "vädret", "prognos", "prognosen", "smhi")
 def marvinWeather(row):
     """
     Check what the weather prognosis looks like.
     """
     msg = None
-    if any(r in row for r in ["väder", "vädret", "prognos", "prognosen", "smhi"]):
+    if findTriggers(row, marvinWeather.triggers):
         url = getString("smhi", "url")
         try:
-            soup = BeautifulSoup(urlopen(url))
-            msg = "{}. {}. {}".format(
-                soup.h1.text,
-                soup.h4.text,
-                soup.h4.findNextSibling("p").text
-            )
+            msg = fetchCached("smhi", url, getWeather)
 
         except Exception:
             msg = getString("smhi", "failed")
@@ -377,12 +442,26 @@ def marvinWeather(row):
     return msg
 
 
+def getWeather(url):
+    """
+    Retrieves the weather prognosis from SMHI
+    """
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    soup = BeautifulSoup(HTTP.get(url).content)
+    return "{}. {}. {}".format(
+        soup.h1.text,
+        soup.h4.text,
+        soup.h4.findNextSibling("p").text
+    )
+
+
+@triggers("strip", "comic", "nöje", "paus")
 def marvinStrip(row):
     """
     Get a comic strip.
     """
     msg = None
-    if any(r in row for r in ["strip", "comic", "nöje", "paus"]):
+    if findTriggers(row, marvinStrip.triggers):
         msg = commitStrip(randomize=any(r in row for r in ["rand", "random", "slump", "lucky"]))
     return msg
 
@@ -404,12 +483,13 @@ def commitStrip(randomize=False):
     return msg.format(url=url)
 
 
+@triggers("grilla", "grill", "grillcon", "bbq")
 def marvinTimeToBBQ(row):
     """
     Calcuate the time to next barbecue and print a appropriate msg
     """
     msg = None
-    if any(r in row for r in ["grilla", "grill", "grillcon", "bbq"]):
+    if findTriggers(row, marvinTimeToBBQ.triggers):
         url = getString("barbecue", "url")
         nextDate = nextBBQ()
         today = datetime.date.today()
@@ -463,78 +543,103 @@ def thirdFridayIn(y, m):
     return cal.monthdatescalendar(y, m)[THIRD][FRIDAY]
 
 
+@triggers("birthday", "födelsedag")
 def marvinBirthday(row):
     """
     Check birthday info
     """
     msg = None
-    if any(r in row for r in ["birthday", "födelsedag"]):
+    if findTriggers(row, marvinBirthday.triggers):
         try:
             url = getString("birthday", "url")
-            soup = BeautifulSoup(urlopen(url), "html.parser")
-            my_list = list()
-
-            for ana in soup.findAll('a'):
-                if ana.parent.name == 'strong':
-                    my_list.append(ana.getText())
-
-            my_list.pop()
-            my_strings = ', '.join(my_list)
-            if not my_strings:
-                msg = getString("birthday", "nobody")
-            else:
-                msg = getString("birthday", "somebody").format(my_strings)
+            msg = fetchCached("birthday", url, getBirthdays)
 
         except Exception:
             msg = getString("birthday", "error")
 
     return msg
 
+
+def getBirthdays(url):
+    """
+    Retrieves who has birthday today
+    """
+    from bs4 import BeautifulSoup  # pylint: disable=import-outside-toplevel
+    soup = BeautifulSoup(HTTP.get(url).content, "html.parser")
+    my_list = list()
+
+    for ana in soup.findAll('a'):
+        if ana.parent.name == 'strong':
+            my_list.append(ana.getText())
+
+    my_list.pop()
+    my_strings = ', '.join(my_list)
+    if not my_strings:
+        return getString("birthday", "nobody")
+    return getString("birthday", "somebody").format(my_strings)
+
+@triggers("nameday", "namnsdag")
 def marvinNameday(row):
     """
     Check current nameday
     """
     msg = None
-    if any(r in row for r in ["nameday", "namnsdag"]):
+    if findTriggers(row, marvinNameday.triggers):
         try:
-            now = datetime.datetime.now()
-            raw_url = "http://api.dryg.net/dagar/v2.1/{year}/{month}/{day}"
-            url = raw_url.format(year=now.year, month=now.month, day=now.day)
-            r = requests.get(url, timeout=5)
-            nameday_data = r.json()
-            names = nameday_data["dagar"][0]["namnsdag"]
-            if names:
-                msg = getString("nameday", "somebody").format(",".join(names))
-            else:
-                msg = getString("nameday", "nobody")
+            url = namedayUrl()
+            msg = fetchCached("nameday", url, getNameday)
         except Exception:
             msg = getString("nameday", "error")
     return msg
 
+def namedayUrl():
+    """
+    Return the url of the namedays of today
+    """
+    now = datetime.datetime.now()
+    raw_url = "http://api.dryg.net/dagar/v2.1/{year}/{month}/{day}"
+    return raw_url.format(year=now.year, month=now.month, day=now.day)
+
+def getNameday(url):
+    """
+    Retrieves who has nameday from api.dryg.net
+    """
+    r = HTTP.get(url)
+    nameday_data = r.json()
+    names = nameday_data["dagar"][0]["namnsdag"]
+    if names:
+        return getString("nameday", "somebody").format(",".join(names))
+    return getString("nameday", "nobody")
+
+@triggers("uptime")
+@deterministic
 def marvinUptime(row):
     """
     Display info about uptime tournament
     """
     msg = None
-    if "uptime" in row:
+    if findTriggers(row, marvinUptime.triggers):
         msg = getString("uptime", "info")
     return msg
 
+@triggers("stream", "streama", "ström", "strömma")
+@deterministic
 def marvinStream(row):
     """
     Display info about stream
     """
     msg = None
-    if any(r in row for r in ["stream", "streama", "ström", "strömma"]):
+    if findTriggers(row, marvinStream.triggers):
         msg = getString("stream", "info")
     return msg
 
+@triggers("principle", "princip", "principer")
 def marvinPrinciple(row):
     """
     Display one selected software principle, or provide one as random
     """
     msg = None
-    if any(r in row for r in ["principle", "princip", "principer"]):
+    if findTriggers(row, marvinPrinciple.triggers):
         principles = getString("principle")
         principleKeys = list(principles.keys())
         matchedKeys = [k for k in row if k in principleKeys]
@@ -550,18 +655,17 @@ def getJoke():
     """
     try:
         url = getString("joke", "url")
-        r = requests.get(url, timeout=5)
-        joke_data = r.json()
-        return joke_data["value"]
+        return BREAKERS["joke"].call(lambda: HTTP.get(url).json()["value"])
     except Exception:
         return getString("joke", "error")
 
+@triggers("joke", "skämt", "chuck norris", "chuck", "norris")
 def marvinJoke(row):
     """
     Display a random Chuck Norris joke
     """
     msg = None
-    if any(r in row for r in ["joke", "skämt", "chuck norris", "chuck", "norris"]):
+    if findTriggers(row, marvinJoke.triggers):
         msg = getJoke()
     return msg
 
@@ -571,18 +675,37 @@ def getCommit():
     """
     try:
         url = getString("commit", "url")
-        r = requests.get(url, timeout=5)
+        r = BREAKERS["commit"].call(HTTP.get, url)
         res = r.text.strip()
         msg = f"Använd detta meddelandet: '{res}'"
         return msg
     except Exception:
         return getString("commit", "error")
 
+@triggers("commit", "-m")
 def marvinCommit(row):
     """
     Display a random commit message
     """
     msg = None
-    if any(r in row for r in ["commit", "-m"]):
+    if findTriggers(row, marvinCommit.triggers):
         msg = getCommit()
     return msg
+
+
+def prefetch():
+    """
+    Fetch the responses describing today into the cache, so the actions
+    answer from memory instead of waiting for the upstream services.
+    """
+    targets = [
+        ("sun", getString("sun", "url"), getSun),
+        ("smhi", getString("smhi", "url"), getWeather),
+        ("birthday", getString("birthday", "url"), getBirthdays),
+        ("nameday", namedayUrl(), getNameday),
+    ]
+    for name, url, fetch in targets:
+        try:
+            CACHE.store(url, BREAKERS[name].call(fetch, url))
+        except Exception as err:
+            LOG.warning("Failed prefetching %s. %s", url, err)
@@ -5,12 +5,10 @@
 Make general actions for Marvin, one function for each action.
 """
 import datetime
-import json
 import random
 
-# Load all strings from file
-with open("marvin_strings.json", encoding="utf-8") as f:
-    STRINGS = json.load(f)
+from action_meta import findTriggers, triggers
+from string_store import STRINGS
 
 # Configuration loaded
 CONFIG = None
@@ -29,20 +27,7 @@ def getString(key, key1=None):
     """
     Get a string from the string database.
     """
-    data = STRINGS[key]
-    if isinstance(data, list):
-        res = data[random.randint(0, len(data) - 1)]
-    elif isinstance(data, dict):
-        if key1 is None:
-            res = data
-        else:
-            res = data[key1]
-            if isinstance(res, list):
-                res = res[random.randint(0, len(res) - 1)]
-    elif isinstance(data, str):
-        res = data
-
-    return res
+    return STRINGS.get(key, key1)
 
 
 def getAllGeneralActions():
@@ -54,19 +39,12 @@ def getAllGeneralActions():
     ]
 
 
+@triggers("morgon", "godmorgon", "god morgon", "morrn", "morn")
 def marvinMorning(row):
     """
     Marvin says Good morning after someone else says it
     """
     msg = None
-    phrases = [
-        "morgon",
-        "godmorgon",
-        "god morgon",
-        "morrn",
-        "morn"
-    ]
-
     morning_phrases = [
         "Godmorgon! :-)",
         "Morgon allesammans",
@@ -77,9 +55,8 @@ def marvinMorning(row):
 
     global lastDateGreeted
 
-    for phrase in phrases:
-        if phrase in row:
-            if lastDateGreeted != datetime.date.today():
-                lastDateGreeted = datetime.date.today()
-                msg = random.choice(morning_phrases)
+    if findTriggers(row, marvinMorning.triggers):
+        if lastDateGreeted != datetime.date.today():
+            lastDateGreeted = datetime.date.today()
+            msg = random.choice(morning_phrases)
     return msg
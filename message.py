@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the tokenized messages passed to the actions.
+
+A message is tokenized once into a Message, a tuple of its tokens that
+actions use like the list they always got. It also keeps the raw text,
+tests membership with a frozenset of the tokens and makes n-grams when
+first asked for them. The spans of trigger keywords found in it are kept
+by their keywords, so an action gets those its index already found.
+Lines seen lately, like greetings and bot commands, are kept in a small
+LRU cache and not tokenized again.
+"""
+
+from functools import lru_cache
+import re
+
+# Characters separating tokens like whitespace does
+SEPARATORS = re.compile("[,.?:]")
+
+
+def tokenize(text):
+    """Split a text into normalized tokens"""
+    return SEPARATORS.sub(" ", text).strip().lower().split()
+
+
+class Message(tuple):
+    """The tokens of a message, with its raw text, a set view, n-grams and spans found"""
+    def __new__(cls, raw, tokens=None):
+        message = super().__new__(cls, tokenize(raw) if tokens is None else tokens)
+        message.raw = raw
+        message.tokenSet = frozenset(message)
+        message.grams = {}
+        message.spans = {}
+        return message
+
+    def __getnewargs__(self):
+        return (self.raw, tuple(self))
+
+    def __contains__(self, token):
+        return token in self.tokenSet
+
+    def ngrams(self, n):
+        """Return the set of n-grams, tuples of n tokens in a row, made on first use"""
+        found = self.grams.get(n)
+        if found is None:
+            found = self.grams[n] = frozenset(zip(*(self[start:] for start in range(n))))
+        return found
+
+    def hasPhrase(self, phrase):
+        """Check if the words of the phrase are among the tokens, in a row"""
+        words = tuple(phrase.split())
+        if len(words) == 1:
+            return words[0] in self
+        return words in self.ngrams(len(words))
+
+
+@lru_cache(maxsize=1024)
+def parse(text):
+    """Return the Message of a text, the same one for a text seen lately"""
+    return Message(text)
@@ -0,0 +1,162 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for counting what the bot does and serving it to Prometheus.
+
+Counters and histograms are kept in memory, labelled by for example the
+action or the upstream host. Numbers already kept elsewhere, like the
+depth of the send queue, are read by collectors when scraped. The text
+format of Prometheus is served at /metrics by a small HTTP listener in a
+thread of its own.
+"""
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+
+LOG = logging.getLogger("marvin.metrics")
+
+# Upper bounds in seconds of the buckets of all histograms
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def labelKey(labels):
+    """Return the labels as a sorted tuple of pairs, usable as a dict key"""
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def formatLabels(key):
+    """Return the labels as written in the text format"""
+    if not key:
+        return ""
+    pairs = []
+    for name, value in key:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metrics():
+    """Counters, histograms and collectors rendered in the Prometheus text format"""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = {}
+
+    def inc(self, name, labels=None, value=1):
+        """Add value to a counter"""
+        key = labelKey(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """Record a value, usually seconds, in a histogram"""
+        key = labelKey(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def collect(self, name, kind, func):
+        """
+        Read a counter or gauge from func when scraped. func returns a list
+        of (labels, value) pairs. A collector replaces one of the same name.
+        """
+        with self.lock:
+            self.collectors[name] = (kind, func)
+
+    def render(self):
+        """Return all metrics in the Prometheus text format"""
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {
+                name: {key: list(counts) for key, counts in series.items()}
+                for name, series in self.histograms.items()
+            }
+            collectors = dict(self.collectors)
+
+        lines = []
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{name}{formatLabels(key)} {value}" for key, value in series.items()]
+
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, counts in series.items():
+                lines += self.renderHistogram(name, key, counts)
+
+        for name, (kind, func) in sorted(collectors.items()):
+            try:
+                values = func()
+            except Exception as err:
+                LOG.warning("Failed collecting %s. %s", name, err)
+                continue
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f"{name}{formatLabels(labelKey(labels))} {value}" for labels, value in values]
+
+        return "\n".join(lines) + "\n"
+
+    def renderHistogram(self, name, key, counts):
+        """Return the lines of one histogram, with cumulative buckets"""
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            total += count
+            lines.append(f"{name}_bucket{formatLabels(key + (('le', bound),))} {total}")
+        lines.append(f"{name}_sum{formatLabels(key)} {counts[-1]}")
+        lines.append(f"{name}_count{formatLabels(key)} {total}")
+        return lines
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answer GET /metrics with the metrics of the server"""
+    def do_GET(self):
+        """Send the metrics, or 404 for any other path"""
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Do not print every scrape"""
+
+
+class MetricsServer(threading.Thread):
+    """Serve metrics over HTTP in the background, the port is bound when created"""
+    def __init__(self, metrics, host="127.0.0.1", port=9100):
+        super().__init__(name="metrics", daemon=True)
+        self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.metrics = metrics
+
+    @property
+    def port(self):
+        """The port listened on"""
+        return self.httpd.server_address[1]
+
+    def run(self):
+        """Serve until stopped"""
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        if self.is_alive():
+            self.httpd.shutdown()
+            self.join()
+        self.httpd.server_close()
+
+
+# The metrics of the running bot
+METRICS = Metrics()
@@ -0,0 +1,58 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for refreshing content ahead of time in the background.
+
+The job runs delay seconds after the scheduler starts, then every
+interval seconds and also shortly after every midnight, when content
+describing "today" changes.
+"""
+
+import datetime
+import logging
+import threading
+
+LOG = logging.getLogger("marvin.prefetch")
+
+
+class PrefetchScheduler(threading.Thread):
+    """Run a job periodically and just after midnight, until stopped"""
+    def __init__(self, job, interval=1800, afterMidnight=30, now=datetime.datetime.now,
+                 delay=0):
+        super().__init__(name="prefetch", daemon=True)
+        self.job = job
+        self.interval = interval
+        self.delay = delay
+        self.afterMidnight = afterMidnight
+        self.now = now
+        self.stopped = threading.Event()
+
+    def secondsToNextRun(self):
+        """Return the seconds until the next interval or midnight, whichever comes first"""
+        now = self.now()
+        tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1),
+                                             datetime.time())
+        midnight = (tomorrow - now).total_seconds() + self.afterMidnight
+        return min(self.interval, midnight)
+
+    def runJob(self):
+        """Run the job once, it failing does not stop the scheduler"""
+        try:
+            self.job()
+        except Exception as err:
+            LOG.warning("Prefetching failed. %s", err)
+
+    def run(self):
+        """Run the job after the delay and then at every scheduled time until stopped"""
+        if self.stopped.wait(self.delay):
+            return
+        self.runJob()
+        while not self.stopped.wait(self.secondsToNextRun()):
+            self.runJob()
+
+    def stop(self):
+        """Stop running the job"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
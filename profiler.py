@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for profiling the running bot without restarting it.
+
+When a profile file is configured the profiler is armed, which costs a
+check of one attribute for each message and action. Sending SIGUSR1 to
+the process, or the profilestart option, opens a window. While it is
+open the thread dispatching the messages runs under cProfile and the
+time spent in each action is summed, in whatever thread it runs. The
+window closes on the first message after profileseconds have passed or
+profilemessages were handled, or on the next SIGUSR1. The profile is
+then written as a pstats file, to read with python3 -m pstats, and the
+time of the actions is logged.
+"""
+
+import cProfile
+import logging
+import signal
+import threading
+import time
+from types import SimpleNamespace
+
+LOG = logging.getLogger("marvin.profiler")
+
+# Options of the profiler and their defaults, part of the configuration of the bots
+OPTIONS = {
+    "profilefile": "",
+    "profileseconds": 60,
+    "profilemessages": 0,
+    "profilestart": 0,
+}
+
+
+class Profiler():
+    """Windows of cProfile over the dispatch loop, opened by a signal or an option"""
+    def __init__(self):
+        self.config = dict(OPTIONS)
+        self.requested = False
+        self.window = None
+        self.lock = threading.Lock()
+
+    def configure(self, config):
+        """
+        Arm the profiler when config has a profilefile, installing the signal
+        handler when possible. Return True when armed.
+        """
+        for key, value in OPTIONS.items():
+            self.config[key] = config.get(key) or value
+        if not self.config["profilefile"]:
+            return False
+
+        try:
+            signal.signal(signal.SIGUSR1, self.toggle)
+        except (AttributeError, ValueError) as err:
+            LOG.warning("Profiling only with the profilestart option, no signal handler. %s", err)
+        self.requested = bool(self.config["profilestart"])
+        LOG.info("Profiler armed, profiles are written to %s", self.config["profilefile"])
+        return True
+
+    def toggle(self, _signum=None, _frame=None):
+        """Open a window on the next message, or close the open one"""
+        self.requested = True
+
+    def tick(self):
+        """Called for each message by the thread dispatching them"""
+        if self.requested:
+            self.requested = False
+            if self.window is not None:
+                self.stop()
+                return
+            self.start()
+
+        window = self.window
+        if window is None:
+            return
+        window.messages += 1
+        limit = self.config["profilemessages"]
+        if (limit and window.messages > limit) or \
+                time.monotonic() - window.started >= self.config["profileseconds"]:
+            self.stop()
+
+    def record(self, name, seconds):
+        """Add the time of one run of an action to the open window"""
+        if self.window is None:
+            return
+        with self.lock:
+            window = self.window
+            if window is not None:
+                calls, total = window.actions.get(name, (0, 0.0))
+                window.actions[name] = (calls + 1, total + seconds)
+
+    def start(self):
+        """Open a window, profiling the calling thread"""
+        window = SimpleNamespace(
+            profile=cProfile.Profile(), started=time.monotonic(), messages=0, actions={}
+        )
+        with self.lock:
+            self.window = window
+        LOG.info("Profiling started")
+        window.profile.enable()
+
+    def stop(self):
+        """Close the window, write the profile and log the time of the actions"""
+        with self.lock:
+            window, self.window = self.window, None
+        if window is None:
+            return
+        window.profile.disable()
+        filename = self.config["profilefile"]
+        window.profile.dump_stats(filename)
+        LOG.info("Profiled %s messages in %.1f s, written to %s",
+                 window.messages, time.monotonic() - window.started, filename)
+        for name, (calls, total) in sorted(window.actions.items(), key=lambda item: -item[1][1]):
+            LOG.info(" - %s: %s calls, %.1f ms, %.0f us per call",
+                     name, calls, total * 1000, total / calls * 1e6)
+
+
+# The profiler of the running bot
+PROFILER = Profiler()
@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for keeping responses from upstream services in memory.
+
+A response is fresh for a number of seconds given by the caller. After
+that the old response is still returned at once while a background
+thread fetches a new one, and it is kept when the upstream fails. Only
+a caller asking for a response never fetched before waits for the
+upstream. The least recently used responses are evicted when the cache
+is full.
+"""
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+LOG = logging.getLogger("marvin.cache")
+
+
+class ResponseCache():
+    """In memory responses with a time to live, LRU eviction and stale-while-revalidate"""
+    def __init__(self, maxSize=128, clock=time.monotonic):
+        self.maxSize = maxSize
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.refreshing = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "errors": 0}
+
+    def get(self, key, ttl, fetch):
+        """
+        Return the response for key, calling fetch when there is none. A
+        response older than ttl seconds is returned while fetch refreshes it
+        in the background. Exceptions from fetch are only raised when there
+        is no response to return.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+                stored, value = entry
+                if self.clock() - stored < ttl:
+                    self.stats["hits"] += 1
+                else:
+                    self.stats["stale"] += 1
+                    self.refreshLater(key, fetch)
+                return value
+            self.stats["misses"] += 1
+
+        value = fetch()
+        self.store(key, value)
+        return value
+
+    def store(self, key, value):
+        """Store a fresh response, evicting the least recently used when full"""
+        with self.lock:
+            self.entries[key] = (self.clock(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def refreshLater(self, key, fetch):
+        """Start refreshing a response in the background, unless already started"""
+        if key in self.refreshing:
+            return
+        thread = threading.Thread(target=self.refresh, args=(key, fetch), daemon=True)
+        self.refreshing[key] = thread
+        thread.start()
+
+    def refresh(self, key, fetch):
+        """Fetch a response again, keeping the old one if the upstream fails"""
+        try:
+            self.store(key, fetch())
+        except Exception as err:
+            LOG.warning("Failed refreshing %s, keeping the old response. %s", key, err)
+            with self.lock:
+                self.stats["errors"] += 1
+        finally:
+            with self.lock:
+                self.refreshing.pop(key, None)
+
+    def wait(self):
+        """Wait for all background refreshes to finish"""
+        with self.lock:
+            pending = list(self.refreshing.values())
+        for thread in pending:
+            thread.join()
+
+    def clear(self):
+        """Forget all responses"""
+        self.wait()
+        with self.lock:
+            self.entries.clear()
+
+    def counters(self):
+        """Return how many lookups were fresh, stale or missing and how many refreshes failed"""
+        with self.lock:
+            return dict(self.stats)
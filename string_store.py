@@ -0,0 +1,115 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for the strings the actions respond with, shared by all action
+modules.
+
+The file is loaded once and every key is resolved into an entry that
+knows its own type, so a lookup is a dict access and, for a choice list,
+picking an index. The file is loaded again on the next lookup after its
+modification time has changed.
+
+While a function is installed with choosing, the current thread picks
+from the lists of strings with it instead, which lets a caller go
+through every string an action may pick.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import random
+import threading
+import time
+
+
+def randomIndex(count):
+    """Return a random index into a list of count items"""
+    return random.randint(0, count - 1)
+
+
+# The function picking from the lists of strings in each thread, if installed
+CHOOSING = threading.local()
+
+
+@contextmanager
+def choosing(choose):
+    """Pick from the lists of strings with choose in the current thread while in the block"""
+    previous = getattr(CHOOSING, "choose", None)
+    CHOOSING.choose = choose
+    try:
+        yield
+    finally:
+        CHOOSING.choose = previous
+
+
+# Kinds of entries, a value returned as it is, a list of values to pick one
+# from or a map of entries returned as a whole when no key is given
+FIXED, CHOICE, KEYED = "fixed", "choice", "keyed"
+
+
+def compileEntry(value, nested=False):
+    """
+    Return the entry, a (kind, value) tuple, for a value from the file.
+    Only the top level maps are keyed, a map inside one is returned as it is.
+    """
+    if isinstance(value, list):
+        return (CHOICE, tuple(value))
+    if isinstance(value, dict) and not nested:
+        return (KEYED, (value, {key: compileEntry(item, True) for key, item in value.items()}))
+    return (FIXED, value)
+
+
+class StringStore():
+    """
+    Strings loaded from a JSON file on first use. The modification time of
+    the file is checked at most once every checkInterval seconds.
+    """
+    def __init__(self, filename, checkInterval=1.0, clock=time.monotonic):
+        self.filename = filename
+        self.checkInterval = checkInterval
+        self.clock = clock
+        self.entries = None
+        self.mtime = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load the file and resolve every key into an entry"""
+        mtime = os.stat(self.filename).st_mtime_ns
+        with open(self.filename, encoding="utf-8") as f:
+            data = json.load(f)
+        self.entries = {key: compileEntry(value) for key, value in data.items()}
+        self.mtime = mtime
+
+    def reloadIfChanged(self):
+        """Load the file if it is not loaded or has changed since it was"""
+        now = self.clock()
+        if self.entries is not None and now - self.checked < self.checkInterval:
+            return
+        with self.lock:
+            self.checked = now
+            if self.entries is None or os.stat(self.filename).st_mtime_ns != self.mtime:
+                self.load()
+
+    def get(self, key, key1=None, choose=randomIndex):
+        """
+        Return the string for key, or for key1 within key. An entry with a
+        list of strings returns the one at the index picked by choose, or
+        by the function installed with choosing.
+        """
+        self.reloadIfChanged()
+        kind, value = self.entries[key]
+        if kind == KEYED:
+            whole, entries = value
+            if key1 is None:
+                return whole
+            kind, value = entries[key1]
+        if kind == CHOICE:
+            choose = getattr(CHOOSING, "choose", None) or choose
+            return value[choose(len(value))]
+        return value
+
+
+# The strings of all action modules
+STRINGS = StringStore("marvin_strings.json")
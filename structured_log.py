@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Module for logging what the bot does without waiting for stdout.
+
+Records go to loggers below "marvin" with structured fields, like the
+channel, nick, action and latency, passed with fields() and written as
+key=value pairs after the message. Once set up, records are put in a
+queue and written to stdout by a background thread, so a slow pipe, as
+under Docker or systemd, never holds up the thread handling messages.
+The raw lines read from the server are sampled, at most lograwrate of
+them are logged each second and the number skipped is logged with the
+next one.
+"""
+
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import sys
+import time
+
+# Options for logging and their defaults, part of the configuration of the bots
+OPTIONS = {
+    "loglevel": "INFO",
+    "lograwrate": 100,
+}
+
+LOG = logging.getLogger("marvin")
+
+# Raw lines read, sampled with logRaw
+RAW_LOG = logging.getLogger("marvin.raw")
+
+# Writes the queued records to stdout, once set up
+LISTENER = None
+
+
+def fields(**values):
+    """Return the structured fields of a record, to pass as extra"""
+    return {"fields": values}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Format records with their structured fields as key=value pairs"""
+    def format(self, record):
+        line = super().format(record)
+        values = getattr(record, "fields", None)
+        if values:
+            line += " " + " ".join(f"{key}={value}" for key, value in values.items())
+        return line
+
+
+class Sampler():
+    """Let at most rate events through each second, counting the rest"""
+    def __init__(self, rate, clock=time.monotonic):
+        self.rate = rate
+        self.clock = clock
+        self.second = None
+        self.taken = 0
+        self.skipped = 0
+
+    def configure(self, rate):
+        """Let rate events through each second from now on, 0 for all"""
+        self.rate = rate
+        self.second = None
+        self.skipped = 0
+
+    def take(self):
+        """
+        Return None when the event is skipped, otherwise the number of
+        events skipped since the last one let through.
+        """
+        second = int(self.clock())
+        if second != self.second:
+            self.second = second
+            self.taken = 0
+        if self.rate and self.taken >= self.rate:
+            self.skipped += 1
+            return None
+        self.taken += 1
+        skipped, self.skipped = self.skipped, 0
+        return skipped
+
+
+# Sampling of the raw lines
+SAMPLER = Sampler(OPTIONS["lograwrate"])
+
+
+def logRaw(line, **values):
+    """Log a raw line read from the server, unless skipped by the sampling"""
+    if not RAW_LOG.isEnabledFor(logging.INFO):
+        return
+    skipped = SAMPLER.take()
+    if skipped is None:
+        return
+    if skipped:
+        values["skipped"] = skipped
+    RAW_LOG.info("%s", line, extra={"fields": values})
+
+
+def setupLogging(config, stream=None):
+    """
+    Send the records of the marvin loggers through a queue to a thread
+    writing them to stream, stdout by default. Return the listener.
+    """
+    global LISTENER
+    stopLogging()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(StructuredFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    records = queue.SimpleQueue()
+    LISTENER = QueueListener(records, handler)
+
+    LOG.handlers = [QueueHandler(records)]
+    LOG.setLevel(str(config.get("loglevel") or OPTIONS["loglevel"]).upper())
+    LOG.propagate = False
+    SAMPLER.configure(config.get("lograwrate", OPTIONS["lograwrate"]))
+
+    LISTENER.start()
+    atexit.unregister(stopLogging)
+    atexit.register(stopLogging)
+    return LISTENER
+
+
+def stopLogging():
+    """Write the records still queued, stop the thread writing them and undo the setup"""
+    global LISTENER
+    if LISTENER:
+        LOG.handlers = []
+        LOG.setLevel(logging.NOTSET)
+        LOG.propagate = True
+        LISTENER.stop()
+        LISTENER = None
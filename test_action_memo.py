@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for remembering the responses of actions
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock, TestCase
+
+from action_memo import ActionMemo
+from action_meta import deterministic, randomChoice
+from string_store import StringStore
+
+
+class ActionMemoTest(TestCase):
+    """Test remembering, picking and forgetting responses"""
+
+    def setUp(self):
+        """Write a strings file, a store reading it and a memo following the store"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.strings = StringStore(os.path.join(tmp, "strings.json"), checkInterval=0)
+        self.write({"menu": "the menu", "quote": ["a", "b", "c"], "hello": ["hi", "hey"]})
+        self.memo = ActionMemo(self.strings, maxSize=2)
+        self.calls = []
+
+        @deterministic
+        def actionMenu(row):
+            self.calls.append(row)
+            return self.strings.get("menu") if "menu" in row else None
+
+        @randomChoice
+        def actionQuote(row):
+            self.calls.append(row)
+            return self.strings.get("quote") + " " + row[-1]
+
+        @randomChoice
+        def actionTwice(row):
+            self.calls.append(row)
+            return self.strings.get("quote") + self.strings.get("hello")
+
+        def actionPlain(row):
+            self.calls.append(row)
+            return "plain"
+
+        self.actionMenu = actionMenu
+        self.actionQuote = actionQuote
+        self.actionTwice = actionTwice
+        self.actionPlain = actionPlain
+
+    def write(self, data):
+        """Write the strings file, with a new modification time"""
+        filename = self.strings.filename
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        stat = os.stat(filename)
+        os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    def testDeterministicRemembered(self):
+        """A deterministic action runs once for the same tokens"""
+        self.assertEqual(self.memo.run(self.actionMenu, ["marvin", "menu"]), "the menu")
+        self.assertEqual(self.memo.run(self.actionMenu, ("marvin", "menu")), "the menu")
+        self.assertIsNone(self.memo.run(self.actionMenu, ["marvin"]))
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.memo.counters(), {"hits": 1, "misses": 2})
+
+    def testRandomChoicePool(self):
+        """A random choice action makes every response once and one is picked each call"""
+        with mock.patch("action_memo.randomIndex", side_effect=[2, 0, 1]):
+            picked = [self.memo.run(self.actionQuote, ["citat", "x"]) for _ in range(3)]
+        self.assertEqual(picked, ["c x", "a x", "b x"])
+        self.assertEqual(len(self.calls), 3)
+
+    def testPickingFromSeveralListsNotRemembered(self):
+        """An action picking from more than one list is run every time"""
+        for _ in range(2):
+            self.assertIn(self.memo.run(self.actionTwice, ["x"]),
+                          {q + h for q in "abc" for h in ("hi", "hey")})
+        self.assertEqual(len(self.calls), 4)
+
+    def testPlainRunEveryTime(self):
+        """Actions not declared are run every time"""
+        self.memo.run(self.actionPlain, ["x"])
+        self.memo.run(self.actionPlain, ["x"])
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.memo.counters(), {"hits": 0, "misses": 0})
+
+    def testForgottenWhenStringsReloaded(self):
+        """Changing the strings file forgets the remembered responses"""
+        self.assertEqual(self.memo.run(self.actionMenu, ["menu"]), "the menu")
+        self.write({"menu": "new menu", "quote": ["a"], "hello": ["hi"]})
+        self.assertEqual(self.memo.run(self.actionMenu, ["menu"]), "new menu")
+        self.assertEqual(len(self.calls), 2)
+
+    def testLeastRecentlyUsedEvicted(self):
+        """The least recently used responses are forgotten when full"""
+        self.memo.run(self.actionMenu, ["menu", "1"])
+        self.memo.run(self.actionMenu, ["menu", "2"])
+        self.memo.run(self.actionMenu, ["menu", "1"])
+        self.memo.run(self.actionMenu, ["menu", "3"])
+        self.memo.run(self.actionMenu, ["menu", "1"])
+        self.assertEqual(len(self.calls), 3)
+        self.memo.run(self.actionMenu, ["menu", "2"])
+        self.assertEqual(len(self.calls), 4)
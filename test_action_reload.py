@@ -0,0 +1,127 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for reloading the actions of a running bot
+"""
+
+import os
+import shutil
+import signal
+import sys
+import tempfile
+from unittest import TestCase
+
+from action_reload import ActionReloader
+from bot import Bot
+
+ACTIONS = '''
+from action_meta import triggers
+
+CONFIG = None
+
+
+def setConfig(config):
+    global CONFIG
+    CONFIG = config
+
+
+@triggers("{word}")
+def actionWord(row):
+    return "{word}"
+
+
+def getAllActions():
+    return [actionWord]
+'''
+
+GENERAL_ACTIONS = '''
+def setConfig(config):
+    pass
+
+
+def actionAnything(row):
+    return "{word}"
+
+
+def getAllGeneralActions():
+    return [actionAnything]
+'''
+
+
+class ActionReloaderTest(TestCase):
+    """Test replacing the actions, all or nothing"""
+
+    def setUp(self):
+        """Write two modules of actions, import them and register their actions"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.tmp = tmp
+        sys.path.insert(0, tmp)
+        self.addCleanup(sys.path.remove, tmp)
+        for name in ("reload_actions", "reload_general_actions"):
+            self.addCleanup(sys.modules.pop, name, None)
+        self.write("hello")
+
+        # pylint: disable=import-outside-toplevel,import-error
+        import reload_actions
+        import reload_general_actions
+
+        self.bot = Bot()
+        self.bot.CONFIG = {"nick": "marvin"}
+        self.bot.registerActions(reload_actions.getAllActions())
+        self.bot.registerGeneralActions(reload_general_actions.getAllGeneralActions())
+        self.reloader = ActionReloader((
+            ("reload_actions", "getAllActions", "ACTIONS"),
+            ("reload_general_actions", "getAllGeneralActions", "GENERAL_ACTIONS"),
+        ))
+        self.reloader.bot = self.bot
+
+    def write(self, word, broken=False):
+        """Write the modules answering word, the general one failing to import if broken"""
+        with open(os.path.join(self.tmp, "reload_actions.py"), "w", encoding="utf-8") as f:
+            f.write(ACTIONS.format(word=word))
+        general = GENERAL_ACTIONS.format(word=word) + ("\nraise ImportError('broken')\n"
+                                                       if broken else "")
+        with open(os.path.join(self.tmp, "reload_general_actions.py"), "w",
+                  encoding="utf-8") as f:
+            f.write(general)
+
+    def answers(self, message):
+        """Return what the registered actions answer the message"""
+        row = Bot.tokenize(message)
+        actions = self.bot.actionsFor(row) + self.bot.generalActionsFor(row)
+        return [action(row) for action in actions]
+
+    def testReloadReplacesActions(self):
+        """New actions are registered and indexed, and the modules swapped"""
+        self.assertEqual(self.answers("hello goodbye"), ["hello", "hello"])
+        self.write("goodbye")
+        self.assertTrue(self.reloader.reload())
+        self.assertEqual(self.answers("hello goodbye"), ["goodbye", "goodbye"])
+        self.assertEqual(self.answers("hello"), ["goodbye"])
+        self.assertIs(sys.modules["reload_actions"].actionWord, self.bot.ACTIONS[0])
+        self.assertIs(sys.modules["reload_actions"].CONFIG, self.bot.CONFIG)
+
+    def testFailedReloadKeepsEverything(self):
+        """When one module fails to load nothing is replaced"""
+        modules = (sys.modules["reload_actions"], sys.modules["reload_general_actions"])
+        actions = list(self.bot.ACTIONS)
+        self.write("goodbye", broken=True)
+        with self.assertLogs("marvin.reload", "ERROR"):
+            self.assertFalse(self.reloader.reload())
+        self.assertEqual(self.bot.ACTIONS, actions)
+        self.assertEqual(self.answers("hello"), ["hello", "hello"])
+        self.assertIs(sys.modules["reload_actions"], modules[0])
+        self.assertIs(sys.modules["reload_general_actions"], modules[1])
+
+    def testSignalReloadsOnNextMessage(self):
+        """SIGHUP reloads on the next tick of the dispatching thread"""
+        previous = signal.getsignal(signal.SIGHUP)
+        self.addCleanup(signal.signal, signal.SIGHUP, previous)
+        self.reloader.arm(self.bot)
+        self.write("goodbye")
+        os.kill(os.getpid(), signal.SIGHUP)
+        self.assertEqual(self.answers("hello"), ["hello", "hello"])
+        self.reloader.tick()
+        self.assertEqual(self.answers("goodbye"), ["goodbye", "goodbye"])
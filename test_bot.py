@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the common bot base class
+"""
+
+import threading
+from unittest import mock, TestCase
+
+from action_meta import findTriggers, triggers, TriggerMatcher
+from bot import Bot
+from metrics import Metrics
+import marvin_actions
+import marvin_general_actions
+
+
+@triggers("hello", "hi")
+def actionHello(row):
+    """Respond to greetings"""
+    return "hello" if any(r in row for r in ["hello", "hi"]) else None
+
+
+@triggers("bye")
+def actionBye(row):
+    """Respond to goodbyes"""
+    return "bye" if "bye" in row else None
+
+
+@triggers("god morgon", "chuck norris")
+def actionPhrase(row):
+    """Respond to triggers of several words"""
+    return "phrase" if findTriggers(row, actionPhrase.triggers) else None
+
+
+def actionAnything(row):
+    """Respond to everything, declares no triggers"""
+    return "anything"
+
+
+class ActionIndexTest(TestCase):
+    """Test the keyword index used to dispatch actions"""
+
+    def setUp(self):
+        self.bot = Bot()
+        self.bot.registerActions([actionHello, actionBye])
+
+    def testOnlyTriggeredActionsAreCandidates(self):
+        """Only actions whose triggers are in the message are returned"""
+        self.assertEqual(self.bot.actionsFor(["say", "hi"]), [actionHello])
+        self.assertEqual(self.bot.actionsFor(["bye", "hello"]), [actionHello, actionBye])
+        self.assertEqual(self.bot.actionsFor(["nothing"]), [])
+
+    def testActionsWithoutTriggersAlwaysCandidates(self):
+        """Actions that declare no triggers are tried for every message"""
+        self.bot.registerActions([actionAnything])
+        self.assertEqual(self.bot.actionsFor(["nothing"]), [actionAnything])
+        self.assertEqual(self.bot.actionsFor(["bye"]), [actionBye, actionAnything])
+
+    def testActionsAddedAtRuntime(self):
+        """Actions appended after registration are indexed on the next lookup"""
+        self.bot.ACTIONS.insert(0, actionAnything)
+        self.assertEqual(self.bot.actionsFor(["bye"]), [actionAnything, actionBye])
+        self.bot.ACTIONS.append(actionAnything)
+        self.assertEqual(
+            self.bot.actionsFor(["hi"]),
+            [actionAnything, actionHello, actionAnything])
+        del self.bot.ACTIONS[1:]
+        self.assertEqual(self.bot.actionsFor(["hi"]), [actionAnything])
+
+    def testActionReplacedInPlace(self):
+        """Replacing an action in the list indexes it on its own triggers"""
+        self.assertEqual(self.bot.actionsFor(["hi"]), [actionHello])
+        self.bot.ACTIONS[0] = actionBye
+        self.assertEqual(self.bot.actionsFor(["hi"]), [])
+        self.assertEqual(self.bot.actionsFor(["bye"]), [actionBye, actionBye])
+
+    def testLookupWhileReplaced(self):
+        """Lookups in one thread see whole indexes while another thread replaces the actions"""
+        lists = ([actionHello, actionBye, actionAnything], [actionBye])
+        stop = threading.Event()
+
+        def replace():
+            while not stop.is_set():
+                for actions in lists:
+                    self.bot.ACTIONS[:] = actions
+                    self.bot.ACTION_INDEX.rebuild()
+
+        thread = threading.Thread(target=replace)
+        thread.start()
+        try:
+            for _ in range(2000):
+                self.assertIn(self.bot.actionsFor(["hi", "bye"]), (
+                    [actionHello, actionBye, actionAnything], [actionBye]
+                ))
+        finally:
+            stop.set()
+            thread.join()
+
+    def testGeneralActionsIndexedSeparately(self):
+        """General actions have an index of their own"""
+        self.bot.registerGeneralActions([actionBye])
+        self.assertEqual(self.bot.generalActionsFor(["bye"]), [actionBye])
+        self.assertEqual(self.bot.generalActionsFor(["hi"]), [])
+
+    def testTriggersOfSeveralWords(self):
+        """Triggers of several words match only those words in a row"""
+        self.bot.registerActions([actionPhrase])
+        self.assertEqual(self.bot.actionsFor(["god", "morgon", "alla"]), [actionPhrase])
+        self.assertEqual(self.bot.actionsFor(["god", "kväll", "morgon"]), [])
+        self.assertEqual(actionPhrase(["hej", "chuck", "norris"]), "phrase")
+        self.assertIsNone(actionPhrase(["chuck", "berry"]))
+
+    def testMatchesReturnSpans(self):
+        """Every matched action is returned with where its keywords were found"""
+        self.bot.registerActions([actionPhrase, actionAnything])
+        self.assertEqual(self.bot.ACTION_INDEX.matches(["hi", "god", "morgon", "hi"]), [
+            (actionHello, [(0, 1), (3, 4)]),
+            (actionPhrase, [(1, 3)]),
+            (actionAnything, []),
+        ])
+
+    def testTriggerMatcher(self):
+        """The matcher finds all keys in one pass, overlapping keywords included"""
+        matcher = TriggerMatcher()
+        matcher.add("joke", ["chuck", "chuck norris"])
+        matcher.add("name", ["norris"])
+        self.assertEqual(matcher.scan(["chuck", "norris", "joke"]), {
+            "joke": [(0, 1), (0, 2)],
+            "name": [(1, 2)],
+        })
+        self.assertEqual(findTriggers(["x", "chuck", "norris"], ("chuck norris",)), [(1, 3)])
+
+    def testAllActionsDeclareTriggers(self):
+        """All of Marvins actions should declare their triggers"""
+        actions = marvin_actions.getAllActions() + marvin_general_actions.getAllGeneralActions()
+        for action in actions:
+            self.assertTrue(getattr(action, "triggers", None), action.__name__)
+
+    def testIndexKeepsFirstMatch(self):
+        """The index should pick the same response as trying every action in order"""
+        messages = [
+            "marvin hjälp", "marvin le lite", "marvin vem är du", "marvin citat",
+            "marvin budord 3", "marvin googla något", "marvin explain ls -l",
+            "marvin source", "marvin stats", "marvin irclog", "marvin hej", "marvin lunch malmö",
+            "marvin dagens video", "marvin strip", "marvin princip dry", "marvin uptime",
+            "marvin stream", "marvin grilla", "marvin ingenting alls", "marvin tack för hjälp"
+        ]
+        bot = Bot()
+        bot.registerActions(marvin_actions.getAllActions())
+        for message in messages:
+            row = Bot.tokenize(message)
+            with mock.patch("string_store.random") as strings, \
+                    mock.patch("marvin_actions.random") as actions:
+                strings.randint.return_value = 0
+                actions.choice.side_effect = lambda seq: seq[0]
+                expected = next(filter(None, (a(row) for a in bot.ACTIONS)), None)
+                actual = next(filter(None, (a(row) for a in bot.actionsFor(row))), None)
+            self.assertEqual(actual, expected, message)
+
+    def testRunActionCounted(self):
+        """Running an action counts the call, whether it answered and whether it failed"""
+        def actionBroken(row):
+            raise ValueError(row)
+
+        metrics = Metrics()
+        with mock.patch("bot.METRICS", metrics):
+            self.assertEqual(Bot.runAction(actionHello, ["hi"]), "hello")
+            self.assertIsNone(Bot.runAction(actionHello, ["what"]))
+            with self.assertRaises(ValueError):
+                Bot.runAction(actionBroken, ["oops"])
+        text = metrics.render()
+        self.assertIn('marvin_action_calls_total{action="actionHello"} 2\n', text)
+        self.assertIn('marvin_action_hits_total{action="actionHello"} 1\n', text)
+        self.assertIn('marvin_action_errors_total{action="actionBroken"} 1\n', text)
+        self.assertIn('marvin_action_seconds_count{action="actionHello"} 2\n', text)
@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the deadlines and circuit breakers of upstream services
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from unittest import mock, TestCase
+
+from circuit_breaker import CircuitBreaker, CircuitOpen, RUNNING
+
+
+class CircuitBreakerTest(TestCase):
+    """Test failing fast and probing again"""
+
+    def testDeadline(self):
+        """A call taking longer than the deadline raises TimeoutError at the deadline"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        breaker = CircuitBreaker("slow", deadline=0.1)
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            breaker.call(release.wait, 5)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def testConcurrencyLimit(self):
+        """Calls still running after the deadline hold back new ones, queued ones are cancelled"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        breaker = CircuitBreaker("hanging", failures=10, deadline=0.05)
+        func = mock.Mock(side_effect=release.wait)
+        for _ in range(3):
+            with self.assertRaises(TimeoutError):
+                breaker.call(func, 5)
+        self.assertEqual(func.call_count, 2)
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while RUNNING["hanging"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        func.side_effect = None
+        func.return_value = "up"
+        self.assertEqual(breaker.call(func), "up")
+
+    def testCancelQueued(self):
+        """A call given up on before it started is never run"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        breaker = CircuitBreaker("queued", deadline=0.05)
+        func = mock.Mock()
+        with mock.patch("circuit_breaker.EXECUTOR", ThreadPoolExecutor(max_workers=1)) as pool:
+            self.addCleanup(pool.shutdown)
+            pool.submit(release.wait, 5)
+            with self.assertRaises(TimeoutError):
+                breaker.call(func)
+            release.set()
+        pool.shutdown()
+        func.assert_not_called()
+        self.assertEqual(RUNNING["queued"], 0)
+
+    def testOpensAfterFailures(self):
+        """After failures in a row the upstream is not called until the circuit is reset"""
+        breaker = CircuitBreaker("down", failures=2, resetAfter=60)
+        func = mock.Mock(side_effect=OSError("down"))
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                breaker.call(func)
+        with self.assertRaises(CircuitOpen):
+            breaker.call(func)
+        self.assertEqual(func.call_count, 2)
+        self.assertTrue(breaker.isOpen())
+
+        breaker.reset()
+        func.side_effect = None
+        func.return_value = "up"
+        self.assertEqual(breaker.call(func), "up")
+
+    def testSuccessResetsFailures(self):
+        """Only failures in a row open the circuit"""
+        breaker = CircuitBreaker("flaky", failures=2)
+        func = mock.Mock(side_effect=[OSError("down"), "up", OSError("down"), "up"])
+        for expected in (OSError, "up", OSError, "up"):
+            if expected is OSError:
+                with self.assertRaises(OSError):
+                    breaker.call(func)
+            else:
+                self.assertEqual(breaker.call(func), expected)
+        self.assertFalse(breaker.isOpen())
+
+    def testProbeClosesCircuit(self):
+        """An open circuit probes in the background and closes when the upstream answers"""
+        breaker = CircuitBreaker("back", failures=1, resetAfter=0)
+        func = mock.Mock(side_effect=OSError("down"))
+        with self.assertRaises(OSError):
+            breaker.call(func)
+
+        func.side_effect = None
+        func.return_value = "up"
+        with self.assertRaises(CircuitOpen):
+            breaker.call(func)
+        deadline = time.monotonic() + 5
+        while breaker.isOpen() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(breaker.isOpen())
+        self.assertEqual(breaker.call(func), "up")
@@ -0,0 +1,100 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the Discord bot
+"""
+
+import asyncio
+import threading
+import time
+from unittest import IsolatedAsyncioTestCase, mock
+
+from action_meta import triggers
+from discord_bot import DiscordBot
+
+RELEASE = threading.Event()
+
+
+@triggers("marvin")
+def actionSlow(row):
+    """Answer after a while, like an action waiting on a slow upstream"""
+    time.sleep(0.3)
+    return "slow" if "marvin" in row else None
+
+
+@triggers("marvin")
+def actionFast(row):
+    """Answer at once"""
+    return "fast" if "marvin" in row else None
+
+
+@triggers("marvin")
+def actionHung(row):
+    """Never answer in time"""
+    RELEASE.wait(5)
+    return "hung"
+
+
+@triggers("marvin")
+def actionBroken(row):
+    """Fail"""
+    raise ValueError("broken")
+
+
+class DiscordBotTest(IsolatedAsyncioTestCase):
+    """Test executing actions without blocking the event loop"""
+
+    async def asyncSetUp(self):
+        RELEASE.clear()
+        self.addCleanup(RELEASE.set)
+        self.bot = DiscordBot()
+        self.bot.CONFIG["actiontimeout"] = 0.5
+        self.message = mock.Mock()
+        self.message.content = "marvin hej"
+        self.message.channel.send = mock.AsyncMock()
+        user = mock.Mock()
+        user.name = "Marvin"
+        patcher = mock.patch.object(DiscordBot, "user", new_callable=mock.PropertyMock)
+        patcher.start().return_value = user
+        self.addCleanup(patcher.stop)
+
+    def sent(self):
+        """Return the responses sent to the channel"""
+        return [call.args[0] for call in self.message.channel.send.call_args_list]
+
+    async def testRepliesInRegistrationOrder(self):
+        """Actions run concurrently and their replies keep the registration order"""
+        self.bot.registerActions([actionSlow, actionSlow, actionFast])
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        start = time.monotonic()
+        await self.bot.checkMarvinActions(self.message)
+        ticker.cancel()
+
+        self.assertEqual(self.sent(), ["slow", "slow", "fast"])
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertGreater(ticks, 10)
+
+    async def testTimeoutAndFailure(self):
+        """A hung or failing action is skipped without holding up the others"""
+        self.bot.registerActions([actionHung, actionBroken, actionFast])
+        start = time.monotonic()
+        await self.bot.checkMarvinActions(self.message)
+        self.assertEqual(self.sent(), ["fast"])
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    async def testOneDeadlineForAllActions(self):
+        """Hung actions together wait no longer than actiontimeout"""
+        self.bot.registerActions([actionHung, actionHung, actionFast])
+        start = time.monotonic()
+        await self.bot.checkMarvinActions(self.message)
+        self.assertEqual(self.sent(), ["fast"])
+        self.assertLess(time.monotonic() - start, 0.9)
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the HTTP client shared by the actions
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from unittest import mock, TestCase
+
+import requests
+
+from http_client import HttpClient
+import marvin_actions
+from metrics import METRICS
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answer with keep-alive, failing the paths asked to fail once"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """Answer a GET request"""
+        status = 200
+        if self.path in self.server.failOnce:
+            self.server.failOnce.remove(self.path)
+            status = 503
+        if self.path == "/missing":
+            status = 404
+        body = self.path.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Keep the test output quiet"""
+
+
+class HttpClientTest(TestCase):
+    """Test pooled sessions against a local server"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.failOnce = set()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = HttpClient()
+        self.addCleanup(self.client.close)
+
+    def testConnectionIsReused(self):
+        """Requests to the same host share one kept alive connection"""
+        for path in ["/a", "/b", "/c"]:
+            self.assertEqual(self.client.get(self.url + path).text, path)
+        counters = self.client.counters()
+        self.assertEqual(counters["hosts"], 1)
+        self.assertEqual(counters["requests"], 3)
+        self.assertEqual(counters["connections"], 1)
+        self.assertEqual(counters["reused"], 2)
+
+    def testConnectionMetrics(self):
+        """The connections opened and reused by the actions are collected as metrics"""
+        with mock.patch.object(marvin_actions, "HTTP", self.client):
+            for path in ["/a", "/b"]:
+                self.client.get(self.url + path)
+            text = METRICS.render()
+        self.assertIn('marvin_http_connections_total{state="opened"} 1', text)
+        self.assertIn('marvin_http_connections_total{state="reused"} 1', text)
+
+    def testRetryAndErrors(self):
+        """Temporary errors are retried and other errors raised"""
+        self.server.failOnce.add("/flaky")
+        self.assertEqual(self.client.get(self.url + "/flaky").text, "/flaky")
+        with self.assertRaises(requests.HTTPError):
+            self.client.get(self.url + "/missing")
@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for watching the incoming directory
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock, TestCase
+
+from incoming_watcher import IncomingWatcher
+
+
+class IncomingWatcherTest(TestCase):
+    """Test watching the incoming directory"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.incoming = os.path.join(self.tmp, "incoming")
+        self.done = os.path.join(self.tmp, "done")
+        os.mkdir(self.incoming)
+        os.mkdir(self.done)
+        self.batches = []
+
+    def writeFile(self, name, content):
+        """Write a file to the incoming directory"""
+        with open(os.path.join(self.incoming, name), "w", encoding="UTF-8") as f:
+            f.write(content)
+
+    def waitForBatches(self, count):
+        """Wait until the watcher has delivered count batches"""
+        for _ in range(200):
+            if len(self.batches) >= count:
+                return
+            time.sleep(0.01)
+        self.fail(f"Got {len(self.batches)} batches, expected {count}")
+
+    def assertWatches(self, mode):
+        """New and existing files are handed over by a watcher in mode"""
+        self.writeFile("old", "before")
+        watcher = IncomingWatcher(self.incoming, self.batches.append, interval=0.05)
+        watcher.start()
+        try:
+            self.waitForBatches(1)
+            self.assertEqual(self.batches[0], [os.path.join(self.incoming, "old")])
+            os.remove(self.batches[0][0])
+
+            self.writeFile("new", "after")
+            self.waitForBatches(2)
+            self.assertEqual(self.batches[1], [os.path.join(self.incoming, "new")])
+            self.assertEqual(watcher.mode, mode)
+        finally:
+            watcher.stop()
+
+    def testInotify(self):
+        """Files are handed over when inotify reports them"""
+        self.assertWatches("inotify")
+
+    def testPollingFallback(self):
+        """Files are found by polling when inotify is not available"""
+        with mock.patch("incoming_watcher.loadInotify", return_value=None):
+            self.assertWatches("polling")
+
+    def testInotifyRetriesLeftFiles(self):
+        """Files left after a failed batch are handed over again after the interval"""
+        def failOnce(paths):
+            self.batches.append(paths)
+            if len(self.batches) > 1:
+                for path in paths:
+                    os.remove(path)
+
+        watcher = IncomingWatcher(self.incoming, failOnce, interval=0.05)
+        watcher.start()
+        try:
+            self.writeFile("retry", "again")
+            self.waitForBatches(2)
+            self.assertEqual(self.batches[0], self.batches[1])
+            self.assertEqual(os.listdir(self.incoming), [])
+        finally:
+            watcher.stop()
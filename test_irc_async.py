@@ -0,0 +1,115 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for running the IRC bot on asyncio streams
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from action_meta import triggers
+from irc_async import AsyncIrcTransport
+from irc_bot import IrcBot
+
+
+@triggers("slow")
+def actionSlow(row):
+    """Answer after a while, like an action waiting on a slow upstream"""
+    if "slow" in row:
+        time.sleep(0.5)
+        return "finally"
+    return None
+
+
+class AsyncTransportTest(IsolatedAsyncioTestCase):
+    """Test running the IRC bot on asyncio streams"""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.received = asyncio.Queue()
+        self.client = None
+        self.server = await asyncio.start_server(self.handleClient, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+
+        self.bot = IrcBot()
+        self.bot.CONFIG.update({
+            "server": "127.0.0.1",
+            "port": port,
+            "channel": "#marvin",
+            "irclogfile": os.path.join(self.tmp, "irclog.txt"),
+            "dirIncoming": os.path.join(self.tmp, "incoming"),
+        })
+        self.bot.registerActions([actionSlow])
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handleClient(self, reader, writer):
+        """Collect every line the bot sends"""
+        self.client = writer
+        while line := await reader.readline():
+            await self.received.put(line.decode().strip())
+
+    async def expectLine(self, prefix, timeout=2):
+        """Wait for a line from the bot starting with prefix"""
+        while True:
+            line = await asyncio.wait_for(self.received.get(), timeout)
+            if line.startswith(prefix):
+                return line
+
+    async def testPongWhileActionIsSlow(self):
+        """PING is answered while a slow action is still running"""
+        task = asyncio.create_task(AsyncIrcTransport(self.bot).run())
+        await self.expectLine("JOIN #marvin")
+
+        self.client.write(b":mos!u@host PRIVMSG #marvin :marvin slow\r\nPING :abc\r\n")
+        start = time.monotonic()
+        await self.expectLine("PONG :abc")
+        self.assertLess(time.monotonic() - start, 0.4)
+
+        reply = await self.expectLine("PRIVMSG #marvin")
+        self.assertEqual(reply, "PRIVMSG #marvin :finally")
+        # The reply is logged once queued, the writer may send it before that
+        for _ in range(100):
+            if len(self.bot.IRCLOG) == 2:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual([entry["msg"] for entry in self.bot.IRCLOG], ["marvin slow", "finally"])
+
+        self.client.close()
+        await asyncio.wait_for(task, 2)
+        with open(self.bot.CONFIG["irclogfile"], encoding="UTF-8") as f:
+            self.assertEqual(len(json.load(f)), 2)
+
+    async def testPingStorm(self):
+        """Every PING in a read is answered, even more than the send queue holds"""
+        self.bot.CONFIG["sendqueuemax"] = 5
+        task = asyncio.create_task(AsyncIrcTransport(self.bot).run())
+        await self.expectLine("JOIN #marvin")
+
+        self.client.write(b"".join(f"PING :{n}\r\n".encode() for n in range(50)))
+        for n in range(50):
+            self.assertEqual(await self.expectLine("PONG"), f"PONG :{n}")
+
+        self.client.close()
+        await asyncio.wait_for(task, 2)
+
+    async def testOversizedLineDoesNotEndTransport(self):
+        """A line longer than the stream limit is framed and the bot keeps running"""
+        task = asyncio.create_task(AsyncIrcTransport(self.bot).run())
+        await self.expectLine("JOIN #marvin")
+
+        self.client.write(b":mos!u@host PRIVMSG #marvin :" + b"x" * 100000 + b"\r\nPING :abc\r\n")
+        await self.expectLine("PONG :abc")
+        self.assertFalse(task.done())
+
+        self.client.close()
+        await asyncio.wait_for(task, 2)
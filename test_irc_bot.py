@@ -0,0 +1,178 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the IRC bot
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock, TestCase
+
+from irc_bot import IrcBot
+
+
+class IrcBotTest(TestCase):
+    """Test reading, sending and incoming files of the IRC bot"""
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.incoming = os.path.join(tmp, "incoming")
+        self.done = os.path.join(tmp, "done")
+        os.mkdir(self.incoming)
+        os.mkdir(self.done)
+
+    def writeFile(self, name, content):
+        """Write a file to the incoming directory"""
+        with open(os.path.join(self.incoming, name), "w", encoding="UTF-8") as f:
+            f.write(content)
+
+    def testReceive(self):
+        """The bot returns decoded complete lines and None on a closed connection"""
+        bot = IrcBot()
+        bot.SOCKET = mock.Mock()
+        bot.SOCKET.recv.side_effect = [":mos PRIVMSG #c :hall".encode(), "å\r\n".encode(), b""]
+        self.assertEqual(bot.receive(), [])
+        self.assertEqual(bot.receive(), [":mos PRIVMSG #c :hallå"])
+        self.assertIsNone(bot.receive())
+
+    def testCaptureRawTraffic(self):
+        """With a capture file set, everything read is appended to it as it was received"""
+        capture = os.path.join(self.done, "capture.raw")
+        bot = IrcBot()
+        bot.CONFIG.update({
+            "capturefile": capture,
+            "irclogfile": os.path.join(self.done, "irclog.txt"),
+            "dirIncoming": self.incoming,
+        })
+        bot.SOCKET = mock.Mock()
+        bot.SOCKET.recv.side_effect = [b"PING :a\r\n:mos PRIVMSG #c :hall", "å\r\n".encode(), b""]
+        with mock.patch.object(bot, "checkIrcActions"):
+            bot.mainLoop()
+        self.assertIsNone(bot.CAPTURE)
+        with open(capture, "rb") as f:
+            self.assertEqual(f.read(), "PING :a\r\n:mos PRIVMSG #c :hallå\r\n".encode())
+
+    def testMainLoopEndsOnConnectionError(self):
+        """A lost connection ends the main loop instead of reading forever"""
+        bot = IrcBot()
+        bot.SOCKET = mock.Mock()
+        bot.SOCKET.recv.side_effect = ConnectionResetError("reset")
+        with mock.patch.object(bot, "startWorkers"), \
+                mock.patch.object(bot, "stopWorkers") as stopWorkers:
+            bot.mainLoop()
+        self.assertEqual(bot.SOCKET.recv.call_count, 1)
+        stopWorkers.assert_called_once()
+
+    def testSendIncoming(self):
+        """The bot sends every line of the files and moves them to done"""
+        self.writeFile("forum1", "first\n")
+        self.writeFile("forum2", "second\n")
+        bot = IrcBot()
+        bot.CONFIG.update({
+            "channel": "#marvin",
+            "dirIncoming": self.incoming,
+            "dirDone": self.done,
+        })
+        bot.SOCKET = mock.Mock()
+        bot.IRCLOG = []
+        bot.readincoming()
+        sent = sorted(call.args[0] for call in bot.SOCKET.sendall.call_args_list)
+        self.assertEqual(
+            sent, [b"PRIVMSG #marvin :first\n\r\n", b"PRIVMSG #marvin :second\n\r\n"])
+        self.assertEqual(os.listdir(self.incoming), [])
+        self.assertEqual(sorted(os.listdir(self.done)), ["forum1", "forum2"])
+
+    def testBadIncomingFileMovedAside(self):
+        """A file that is not UTF-8 is moved aside and the other files are still sent"""
+        with open(os.path.join(self.incoming, "bad"), "wb") as f:
+            f.write(b"\xff\xfe broken\n")
+        self.writeFile("good", "fine\n")
+        bot = IrcBot()
+        bot.CONFIG.update({
+            "channel": "#marvin",
+            "dirIncoming": self.incoming,
+            "dirDone": self.done,
+        })
+        bot.SOCKET = mock.Mock()
+        bot.IRCLOG = []
+        bot.sendIncoming([os.path.join(self.incoming, name) for name in ["bad", "good"]])
+        bot.SOCKET.sendall.assert_called_once_with(b"PRIVMSG #marvin :fine\n\r\n")
+        self.assertEqual(os.listdir(self.incoming), [])
+        self.assertEqual(sorted(os.listdir(self.done)), ["bad.failed", "good"])
+
+    def testWriterUsesSendall(self):
+        """The writer thread passes everything to sendall until stopped"""
+        bot = IrcBot()
+        bot.CONFIG["floodrate"] = 0
+        bot.SOCKET = mock.Mock()
+        bot.startSending()
+        bot.sendMsg("PRIVMSG #marvin :hej\r\n")
+        bot.sendMsg("PONG :abc\r\n")
+        for _ in range(100):
+            if bot.WORKERS["send"].depth() == 0 and bot.SOCKET.sendall.call_count == 2:
+                break
+            time.sleep(0.01)
+        bot.stopWorkers()
+        self.assertEqual(
+            sorted(call.args[0] for call in bot.SOCKET.sendall.call_args_list),
+            [b"PONG :abc\r\n", b"PRIVMSG #marvin :hej\r\n"])
+        bot.SOCKET.send.assert_not_called()
+
+    def testDroppedMessages(self):
+        """Messages the full queue drops are reported and their file is left in incoming"""
+        self.writeFile("forum", "first\nsecond\n")
+        bot = IrcBot()
+        bot.CONFIG.update({
+            "channel": "#marvin",
+            "dirIncoming": self.incoming,
+            "dirDone": self.done,
+            "sendqueuemax": 1,
+            "sendtimeout": 0,
+        })
+        bot.IRCLOG = []
+        queue = bot.openSendQueue()
+        bot.readincoming()
+        self.assertEqual(queue.depth(), 1)
+        self.assertEqual(os.listdir(self.incoming), ["forum"])
+        self.assertEqual([entry["msg"] for entry in bot.IRCLOG], ["first\n"])
+        self.assertFalse(bot.sendMsg("PRIVMSG #marvin :more\r\n"))
+        self.assertTrue(bot.sendMsg("PONG :abc\r\n"))
+
+    def testDroppedMessagesRetried(self):
+        """A file partly sent keeps only the messages the queue dropped"""
+        self.writeFile("forum", "first\nsecond\n")
+        bot = IrcBot()
+        bot.CONFIG.update({
+            "channel": "#marvin",
+            "dirIncoming": self.incoming,
+            "dirDone": self.done,
+            "sendqueuemax": 1,
+            "sendtimeout": 0,
+        })
+        bot.IRCLOG = []
+        queue = bot.openSendQueue()
+        for _ in range(3):
+            bot.readincoming()
+            if queue.depth():
+                queue.get()
+        self.assertEqual([entry["msg"] for entry in bot.IRCLOG], ["first\n", "second\n"])
+        self.assertEqual(os.listdir(self.incoming), [])
+        self.assertEqual(os.listdir(self.done), ["forum"])
+
+    def testNoWaitOnEventLoop(self):
+        """On the thread of an event loop, a full queue drops the message at once"""
+        bot = IrcBot()
+        bot.CONFIG["sendqueuemax"] = 1
+        bot.openSendQueue()
+
+        async def send():
+            return [bot.sendMsg(f"PRIVMSG #marvin :{i}\r\n") for i in range(2)]
+
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(send()), [True, False])
+        self.assertLess(time.monotonic() - start, 1)
@@ -0,0 +1,56 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for decoding lines from the IRC server
+"""
+
+from unittest import mock, TestCase
+
+from irc_decode import Decoder, senderOf
+
+
+class DecoderTest(TestCase):
+    """Test decoding lines and remembering the encoding of senders"""
+
+    def testSenderOf(self):
+        """The sender is the user@host of the prefix, also on a line with only a prefix"""
+        self.assertEqual(senderOf(b":nick!u@host PRIVMSG #c :hej"), b"u@host")
+        self.assertEqual(senderOf(b":nick!u@host"), b"u@host")
+        self.assertEqual(senderOf(b":irc.server NOTICE"), b"irc.server")
+        self.assertIsNone(senderOf(b"PING :abc"))
+
+    def testFastPaths(self):
+        """ASCII and UTF-8 are decoded directly without detection"""
+        decoder = Decoder()
+        with mock.patch("chardet.detect") as detect:
+            self.assertEqual(decoder.decode(b":a!b@c PRIVMSG #c :hej"), ":a!b@c PRIVMSG #c :hej")
+            line = ":a!b@c PRIVMSG #c :smörgås 😀"
+            self.assertEqual(decoder.decode(line.encode()), line)
+            decoder.wait()
+            detect.assert_not_called()
+        self.assertEqual(decoder.counters()["ascii"], 1)
+        self.assertEqual(decoder.counters()["utf8"], 1)
+
+    def testFallbackAndLearnedEncoding(self):
+        """Unknown senders get the fallback now and their detected encoding later"""
+        decoder = Decoder()
+        line = ":a!b@c PRIVMSG #c :привет"
+        raw = line.encode("CP1251")
+        with mock.patch("chardet.detect", return_value={"encoding": "windows-1251"}) as detect:
+            self.assertEqual(decoder.decode(raw), raw.decode("CP1252"))
+            decoder.wait()
+            self.assertEqual(decoder.decode(raw), line)
+            self.assertEqual(
+                decoder.decode(b":x!b@c PRIVMSG #c :\xe5"), ":x!b@c PRIVMSG #c :\u0435")
+            detect.assert_called_once_with(raw)
+        self.assertEqual(decoder.counters()["fallback"], 1)
+        self.assertEqual(decoder.counters()["detected"], 1)
+        self.assertEqual(decoder.counters()["sender"], 2)
+
+    def testLatin1LastResort(self):
+        """Bytes undefined in CP1252 are decoded as ISO-8859-1"""
+        decoder = Decoder()
+        with mock.patch("chardet.detect", return_value={"encoding": None}):
+            self.assertEqual(decoder.decode(b"PING :\x81"), "PING :\x81")
+        self.assertEqual(decoder.counters()["latin1"], 1)
@@ -0,0 +1,42 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for splitting the byte stream from the IRC server into lines
+"""
+
+from unittest import TestCase
+
+from irc_framer import LineFramer
+
+
+class LineFramerTest(TestCase):
+    """Test splitting the byte stream into lines"""
+
+    def testPartialLinesAreKept(self):
+        """A line split over several reads is returned once it is complete"""
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b"PING :a\r\nPRIVMSG #c"), [b"PING :a"])
+        self.assertEqual(framer.feed(b"han :hej"), [])
+        self.assertEqual(framer.pending(), 18)
+        self.assertEqual(framer.feed(b" da\r"), [])
+        self.assertEqual(framer.feed(b"\nPING :b\r\n"), [b"PRIVMSG #chan :hej da", b"PING :b"])
+        self.assertEqual(framer.pending(), 0)
+
+    def testBareLineFeed(self):
+        """Lines ending with only LF are split too, empty lines are skipped"""
+        framer = LineFramer()
+        self.assertEqual(framer.feed(b"one\n\r\ntwo\r\n\nthree"), [b"one", b"two"])
+
+    def testMultibyteCharacterSplitOverReads(self):
+        """A multibyte character split between reads is decoded as a whole"""
+        data = "PRIVMSG #c :smörgåstårta\r\n".encode()
+        framer = LineFramer()
+        self.assertEqual(framer.feed(data[:15]), [])
+        self.assertEqual(framer.feed(data[15:]), ["PRIVMSG #c :smörgåstårta".encode()])
+
+    def testOverlongLineIsPassedOn(self):
+        """A line without end longer than the limit is not buffered forever"""
+        framer = LineFramer(maxLength=8)
+        self.assertEqual(framer.feed(b"0123456789"), [b"0123456789"])
+        self.assertEqual(framer.pending(), 0)
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the append only channel history
+"""
+
+from datetime import date
+import os
+import shutil
+import tempfile
+from unittest import mock, TestCase
+
+from irc_history import HistoryStore
+
+
+class HistoryStoreTest(TestCase):
+    """Test the append only channel history"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.filename = os.path.join(self.tmp, "history.jsonl")
+
+    def testTailOverRotatedFiles(self):
+        """The latest entries are read from the current and the rotated files"""
+        store = HistoryStore(self.filename, maxBytes=100)
+        for i in range(20):
+            store.append({"user": "mos", "msg": str(i)})
+
+        self.assertGreater(len(store.rotatedFiles()), 3)
+        self.assertEqual([e["msg"] for e in store.tail(3)], ["17", "18", "19"])
+        self.assertEqual([e["msg"] for e in store.tail(100)], [str(i) for i in range(20)])
+        self.assertEqual(store.tail(0), [])
+        store.close()
+
+    def testOffsetIndex(self):
+        """Entries are found and counted through the offset index after reopening"""
+        with mock.patch("irc_history.INDEX_STRIDE", 3):
+            store = HistoryStore(self.filename)
+            for i in range(10):
+                store.append({"msg": str(i)})
+            store.close()
+
+            with open(self.filename + ".idx", encoding="UTF-8") as f:
+                self.assertEqual(len(f.readlines()), 4)
+
+            store = HistoryStore(self.filename)
+            store.append({"msg": "10"})
+            self.assertEqual(store.count, 11)
+            self.assertEqual(store.entry(7), {"msg": "7"})
+            self.assertEqual(store.entry(10), {"msg": "10"})
+            self.assertIsNone(store.entry(11))
+            store.close()
+
+    def testDailyRotation(self):
+        """With daily rotation, a new file is started when the date changes"""
+        with mock.patch("irc_history.date") as d:
+            d.today.return_value = date(2024, 5, 17)
+            store = HistoryStore(self.filename, rotate="daily")
+            store.append({"msg": "friday"})
+            store.append({"msg": "still friday"})
+            d.today.return_value = date(2024, 5, 18)
+            store.append({"msg": "saturday"})
+            store.close()
+
+        rotated = store.rotatedFiles()
+        self.assertEqual([os.path.basename(name) for name in rotated],
+                         ["history.20240517.0001.jsonl"])
+        self.assertEqual(HistoryStore.tailFile(self.filename, 5), [{"msg": "saturday"}])
+        self.assertEqual([e["msg"] for e in store.tail(5)], ["friday", "still friday", "saturday"])
+
+    def testTornLastLine(self):
+        """A last line without its line end is skipped when reading and cut when reopening"""
+        store = HistoryStore(self.filename)
+        store.append({"msg": "whole"})
+        store.close()
+        with open(self.filename, "ab") as f:
+            f.write(b'{"msg": "to')
+
+        self.assertEqual(HistoryStore.tailFile(self.filename, 1), [{"msg": "whole"}])
+        self.assertEqual(HistoryStore.tailFile(self.filename, 5), [{"msg": "whole"}])
+
+        store = HistoryStore(self.filename)
+        store.append({"msg": "next"})
+        store.close()
+        self.assertEqual(store.count, 2)
+        self.assertEqual(store.tail(5), [{"msg": "whole"}, {"msg": "next"}])
@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for writing the irclog in the background
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from irc_history import HistoryStore
+from irc_log import IrcLogWriter
+
+
+class IrcLogWriterTest(TestCase):
+    """Test writing the irclog to file in the background"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.filename = os.path.join(self.tmp, "irclog.txt")
+        self.entries = []
+
+    def readLog(self):
+        """Return the entries in the written file"""
+        with open(self.filename, encoding="UTF-8") as f:
+            return json.load(f)
+
+    def testWritesOnlyWhenDirty(self):
+        """The file is only written when the log has changed"""
+        writer = IrcLogWriter(self.filename, 60, lambda: list(self.entries))
+        self.assertTrue(writer.flush())
+        self.assertFalse(writer.flush())
+        self.entries.append({"user": "mos", "msg": "hej"})
+        writer.markDirty()
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.readLog(), self.entries)
+        self.assertEqual(os.listdir(self.tmp), ["irclog.txt"])
+
+    def testBackgroundWrite(self):
+        """Changes are written by the background thread and when closing"""
+        writer = IrcLogWriter(self.filename, 0.01, lambda: list(self.entries))
+        writer.start()
+        for _ in range(100):
+            if os.path.exists(self.filename):
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.readLog(), [])
+
+        self.entries.append({"user": "mos", "msg": "hej"})
+        writer.markDirty()
+        writer.close()
+        self.assertEqual(self.readLog(), self.entries)
+
+    def testHistoryWrittenByWriter(self):
+        """Recorded entries are appended to the history by the writer, not the caller"""
+        history = HistoryStore(os.path.join(self.tmp, "history.jsonl"))
+        writer = IrcLogWriter(self.filename, 60, lambda: list(self.entries), history)
+        writer.record({"user": "mos", "msg": "hej"})
+        self.assertEqual(history.tail(1), [])
+        writer.close()
+        self.assertEqual(history.tail(1), [{"user": "mos", "msg": "hej"}])
+        self.assertIsNone(history.file)
+
+    def testRecordWithoutHistory(self):
+        """Nothing is queued when there is no history"""
+        writer = IrcLogWriter(self.filename, 60, lambda: list(self.entries))
+        writer.record({"user": "mos", "msg": "hej"})
+        self.assertEqual(len(writer.pending), 0)
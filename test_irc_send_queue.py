@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the queue of messages to send to the IRC server
+"""
+
+from unittest import TestCase
+
+from irc_send_queue import SendQueue, TokenBucket
+
+
+class SendQueueTest(TestCase):
+    """Test the queue of outgoing messages and its flood control"""
+
+    def setUp(self):
+        self.now = 100.0
+
+    def clock(self):
+        """A clock the tests control"""
+        return self.now
+
+    def testTokenBucket(self):
+        """A burst is allowed at once, then messages are paced by the rate"""
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        self.assertEqual([bucket.take(0) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(bucket.take(0), 0.5)
+        self.assertEqual(bucket.take(0.25), 0.25)
+        self.assertEqual(bucket.take(0.5), 0)
+        self.assertEqual(TokenBucket(rate=0, burst=1, now=0).take(0), 0)
+
+    def testPongBeforeChannel(self):
+        """PONG is sent before waiting channel messages, even without tokens"""
+        queue = SendQueue(rate=1, burst=1, clock=self.clock)
+        queue.put(b"one")
+        queue.put(b"two")
+        self.assertEqual(queue.get(), b"one")
+        queue.put(b"PONG :x", "pong")
+        self.assertEqual(queue.get(), b"PONG :x")
+        self.now += 1
+        self.assertEqual(queue.get(), b"two")
+
+    def testBoundedQueue(self):
+        """Data is dropped when the lane stays full"""
+        queue = SendQueue(maxSize=2, clock=self.clock)
+        self.assertTrue(queue.put(b"one", timeout=0))
+        self.assertTrue(queue.put(b"two", timeout=0))
+        self.assertFalse(queue.put(b"three", timeout=0))
+        self.assertTrue(queue.put(b"PONG :x", "pong", timeout=0))
+        self.assertEqual(queue.depth(), 3)
+        self.assertEqual(queue.metrics()["channel"]["dropped"], 1)
+
+    def testMetrics(self):
+        """Depth and time waited in the queue are recorded per lane"""
+        queue = SendQueue(rate=2, burst=1, clock=self.clock)
+        queue.put(b"one")
+        queue.put(b"two")
+        self.now += 0.5
+        queue.get()
+        self.now += 0.5
+        metrics = queue.metrics()["channel"]
+        self.assertEqual(metrics["depth"], 1)
+        self.assertEqual(metrics["sent"], 1)
+        self.assertEqual(metrics["waitMax"], 0.5)
+        queue.get()
+        self.assertEqual(queue.metrics()["channel"]["waitAvg"], 0.75)
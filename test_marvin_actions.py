@@ -26,6 +26,13 @@ class ActionTest(TestCase):
             cls.strings = json.load(f)
 
 
+    def setUp(self):
+        """Do not let responses cached or failures counted by one test affect the next"""
+        marvin_actions.CACHE.clear()
+        for breaker in marvin_actions.BREAKERS.values():
+            breaker.reset()
+
+
     def executeAction(self, action, message):
         """Execute an action for a message and return the response"""
         return action(Bot.tokenize(message))
@@ -65,7 +72,7 @@ class ActionTest(TestCase):
 
         with mock.patch("marvin_actions.datetime") as d:
             d.date.today.return_value = todaysDate
-            with mock.patch("marvin_actions.random") as r:
+            with mock.patch("string_store.random") as r:
                 r.randint.return_value = 1
                 expected = f"{url}. {message}"
                 self.assertActionOutput(marvin_actions.marvinTimeToBBQ, "dags att grilla", expected)
@@ -73,10 +80,11 @@ class ActionTest(TestCase):
 
     def assertNameDayOutput(self, exampleFile, expectedOutput):
         """Assert that the proper nameday message is returned, given an inputfile"""
+        marvin_actions.CACHE.clear()
         with open(f"namedayFiles/{exampleFile}.json", "r", encoding="UTF-8") as f:
             response = requests.models.Response()
             response._content = str.encode(json.dumps(json.load(f)))
-            with mock.patch("marvin_actions.requests") as r:
+            with mock.patch("marvin_actions.HTTP") as r:
                 r.get.return_value = response
                 self.assertActionOutput(marvin_actions.marvinNameday, "nameday", expectedOutput)
 
@@ -85,7 +93,7 @@ class ActionTest(TestCase):
         with open(f"jokeFiles/{exampleFile}.json", "r", encoding="UTF-8") as f:
             response = requests.models.Response()
             response._content = str.encode(json.dumps(json.load(f)))
-            with mock.patch("marvin_actions.requests") as r:
+            with mock.patch("marvin_actions.HTTP") as r:
                 r.get.return_value = response
                 self.assertActionOutput(marvin_actions.marvinJoke, "joke", expectedOutput)
 
@@ -94,14 +102,14 @@ class ActionTest(TestCase):
         with open("sunFiles/sun.json", "r", encoding="UTF-8") as f:
             response = requests.models.Response()
             response._content = str.encode(json.dumps(json.load(f)))
-            with mock.patch("marvin_actions.requests") as r:
+            with mock.patch("marvin_actions.HTTP") as r:
                 r.get.return_value = response
                 print(response)
                 self.assertActionOutput(marvin_actions.marvinSun, "sol", expectedOutput)
 
     def testSmile(self):
         """Test that marvin can smile"""
-        with mock.patch("marvin_actions.random") as r:
+        with mock.patch("string_store.random") as r:
             r.randint.return_value = 1
             self.assertStringsOutput(marvin_actions.marvinSmile, "le lite?", "smile", 1)
         self.assertActionSilent(marvin_actions.marvinSmile, "sur idag?")
@@ -113,7 +121,7 @@ class ActionTest(TestCase):
 
     def testGoogle(self):
         """Test that marvin can help google stuff"""
-        with mock.patch("marvin_actions.random") as r:
+        with mock.patch("string_store.random") as r:
             r.randint.return_value = 1
             self.assertActionOutput(
                 marvin_actions.marvinGoogle,
@@ -154,7 +162,7 @@ class ActionTest(TestCase):
 
     def testQuote(self):
         """Test that marvin can quote The Hitchhikers Guide to the Galaxy"""
-        with mock.patch("marvin_actions.random") as r:
+        with mock.patch("string_store.random") as r:
             r.randint.return_value = 1
             self.assertStringsOutput(marvin_actions.marvinQuote, "ge os ett citat", "hitchhiker", 1)
             self.assertStringsOutput(marvin_actions.marvinQuote, "filosofi", "hitchhiker", 1)
@@ -193,7 +201,7 @@ class ActionTest(TestCase):
 
     def testSayHi(self):
         """Test that marvin responds to greetings"""
-        with mock.patch("marvin_actions.random") as r:
+        with mock.patch("string_store.random") as r:
             for skey, s in enumerate(self.strings.get("smile")):
                 for hkey, h in enumerate(self.strings.get("hello")):
                     for fkey, f in enumerate(self.strings.get("friendly")):
@@ -204,7 +212,7 @@ class ActionTest(TestCase):
     def testLunchLocations(self):
         """Test that marvin can provide lunch suggestions for certain places"""
         locations = ["karlskrona", "goteborg", "angelholm", "hassleholm", "malmo"]
-        with mock.patch("marvin_actions.random") as r:
+        with mock.patch("string_store.random") as r:
             for location in locations:
                 for index, place in enumerate(self.strings.get(f"lunch-{location}")):
                     r.randint.side_effect = [0, index]
@@ -249,7 +257,7 @@ class ActionTest(TestCase):
 
     def testNameDayRequest(self):
         """Test that marvin sends a proper request for nameday info"""
-        with mock.patch("marvin_actions.requests") as r:
+        with mock.patch("marvin_actions.HTTP") as r:
             with mock.patch("marvin_actions.datetime") as d:
                 d.datetime.now.return_value = date(2024, 1, 2)
                 self.executeAction(marvin_actions.marvinNameday, "namnsdag")
@@ -263,7 +271,7 @@ class ActionTest(TestCase):
 
     def testNameDayError(self):
         """Tests that marvin returns the proper error message when nameday API is down"""
-        with mock.patch("marvin_actions.requests.get", side_effect=Exception("API Down!")):
+        with mock.patch("marvin_actions.HTTP.get", side_effect=Exception("API Down!")):
             self.assertStringsOutput(
                 marvin_actions.marvinNameday,
                 "har någon namnsdag idag?",
@@ -272,7 +280,7 @@ class ActionTest(TestCase):
 
     def testJokeRequest(self):
         """Test that marvin sends a proper request for a joke"""
-        with mock.patch("marvin_actions.requests") as r:
+        with mock.patch("marvin_actions.HTTP") as r:
             self.executeAction(marvin_actions.marvinJoke, "joke")
             self.assertEqual(
                 r.get.call_args.args[0],
@@ -284,7 +292,7 @@ class ActionTest(TestCase):
 
     def testJokeError(self):
         """Tests that marvin returns the proper error message when joke API is down"""
-        with mock.patch("marvin_actions.requests.get", side_effect=Exception("API Down!")):
+        with mock.patch("marvin_actions.HTTP.get", side_effect=Exception("API Down!")):
             self.assertStringsOutput(marvin_actions.marvinJoke, "kör ett skämt", "joke", "error")
 
     def testSun(self):
@@ -294,9 +302,45 @@ class ActionTest(TestCase):
 
     def testSunError(self):
         """Tests that marvin returns the proper error message when joke API is down"""
-        with mock.patch("marvin_actions.requests.get", side_effect=Exception("API Down!")):
+        with mock.patch("marvin_actions.HTTP.get", side_effect=Exception("API Down!")):
             self.assertStringsOutput(marvin_actions.marvinSun, "när går solen ner?", "sun", "error")
 
+    def testSunCached(self):
+        """Test that marvin answers from the cache while the sun API is down"""
+        self.assertSunOutput(
+            "Idag går solen upp 7:12 och ner 18:21. Iallafall i trakterna kring BTH.")
+        with mock.patch("marvin_actions.HTTP.get", side_effect=Exception("API Down!")) as get:
+            self.assertActionOutput(
+                marvin_actions.marvinSun,
+                "sol",
+                "Idag går solen upp 7:12 och ner 18:21. Iallafall i trakterna kring BTH.")
+            get.assert_not_called()
+
+    def testWeather(self):
+        """Test that marvin reads the weather prognosis with the shared HTTP client"""
+        response = requests.models.Response()
+        response._content = b"<h1>Karlskrona</h1><h4>Idag</h4><p>Regn</p>"
+        with mock.patch("marvin_actions.HTTP") as h:
+            h.get.return_value = response
+            self.assertActionOutput(marvin_actions.marvinWeather, "väder", "Karlskrona. Idag. Regn")
+            self.assertEqual(h.get.call_args.args[0], self.strings["smhi"]["url"])
+
+    def testPrefetch(self):
+        """Test that prefetched responses are answered without asking the upstream"""
+        with open("sunFiles/sun.json", "r", encoding="UTF-8") as f:
+            response = requests.models.Response()
+            response._content = str.encode(json.dumps(json.load(f)))
+        with mock.patch("marvin_actions.HTTP") as h:
+            h.get.return_value = response
+            marvin_actions.prefetch()
+            self.assertIn(self.strings["sun"]["url"], [c.args[0] for c in h.get.call_args_list])
+        with mock.patch("marvin_actions.HTTP.get", side_effect=Exception("API Down!")) as get:
+            self.assertActionOutput(
+                marvin_actions.marvinSun,
+                "sol",
+                "Idag går solen upp 7:12 och ner 18:21. Iallafall i trakterna kring BTH.")
+            get.assert_not_called()
+
     def testUptime(self):
         """Test that marvin can provide the link to the uptime tournament"""
         self.assertStringsOutput(marvin_actions.marvinUptime, "visa lite uptime", "uptime", "info")
@@ -319,7 +363,7 @@ class ActionTest(TestCase):
 
     def testCommitRequest(self):
         """Test that marvin sends proper requests when generating commit messages"""
-        with mock.patch("marvin_actions.requests") as r:
+        with mock.patch("marvin_actions.HTTP") as r:
             self.executeAction(marvin_actions.marvinCommit, "vad skriver man efter commit -m?")
             self.assertEqual(r.get.call_args.args[0], "http://whatthecommit.com/index.txt")
 
@@ -328,20 +372,27 @@ class ActionTest(TestCase):
         message = "Secret sauce #9"
         response = requests.models.Response()
         response._content = str.encode(message)
-        with mock.patch("marvin_actions.requests") as r:
+        with mock.patch("marvin_actions.HTTP") as r:
             r.get.return_value = response
             expected = f"Använd detta meddelandet: '{message}'"
             self.assertActionOutput(marvin_actions.marvinCommit, "commit", expected)
 
     def testCommitError(self):
         """Tests that marvin sends the proper message when get commit fails"""
-        with mock.patch("marvin_actions.requests.get", side_effect=Exception('API Down!')):
+        with mock.patch("marvin_actions.HTTP.get", side_effect=Exception('API Down!')):
             self.assertStringsOutput(
                 marvin_actions.marvinCommit,
                 "vad skriver man efter commit -m?",
                 "commit",
                 "error")
 
+    def testCommitFailsFastWhenDown(self):
+        """Tests that marvin stops asking an upstream that keeps failing"""
+        with mock.patch("marvin_actions.HTTP.get", side_effect=Exception('API Down!')) as get:
+            for _ in range(4):
+                self.assertStringsOutput(marvin_actions.marvinCommit, "commit", "commit", "error")
+            self.assertEqual(get.call_count, 3)
+
     def testMorning(self):
         """Test that marvin wishes good morning, at most once per day"""
         marvin_general_actions.lastDateGreeted = None
@@ -355,3 +406,7 @@ class ActionTest(TestCase):
                 # Should greet again tomorrow
                 d.date.today.return_value = date(2024, 5, 18)
                 self.assertActionOutput(marvin_general_actions.marvinMorning, "godmorgon", "Morgon")
+                # Triggers of two words
+                d.date.today.return_value = date(2024, 5, 19)
+                self.assertActionOutput(
+                    marvin_general_actions.marvinMorning, "god morgon allihop", "Morgon")
@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the tokenized messages passed to the actions
+"""
+
+import copy
+import pickle
+from unittest import TestCase
+
+from action_meta import ActionIndex, findTriggers, triggers
+from bot import Bot
+from message import Message, parse
+
+
+@triggers("morgon", "god morgon")
+def actionMorning(row):
+    """Stand in for an action with triggers"""
+    return findTriggers(row, actionMorning.triggers)
+
+
+class MessageTest(TestCase):
+    """Test tokenizing messages and looking at their tokens"""
+
+    def testTokens(self):
+        """The tokens are normalized like before and the raw text is kept"""
+        message = Message("Marvin: kan du Googla, python?")
+        self.assertEqual(list(message), ["marvin", "kan", "du", "googla", "python"])
+        self.assertEqual(message.raw, "Marvin: kan du Googla, python?")
+        self.assertEqual(message[0], "marvin")
+        self.assertEqual(message[3:], ("googla", "python"))
+        self.assertEqual(" ".join(message), "marvin kan du googla python")
+
+    def testMembership(self):
+        """Membership is tested on whole tokens"""
+        message = Message("hej marvin")
+        self.assertIn("marvin", message)
+        self.assertNotIn("marv", message)
+        self.assertNotIn("hej marvin", message)
+        self.assertEqual(message.tokenSet, frozenset(["hej", "marvin"]))
+
+    def testNgrams(self):
+        """N-grams are made on first use and phrases are found among them"""
+        message = Message("ja god morgon allihop")
+        self.assertEqual(message.ngrams(2), {
+            ("ja", "god"), ("god", "morgon"), ("morgon", "allihop")
+        })
+        self.assertIs(message.ngrams(2), message.ngrams(2))
+        self.assertEqual(message.ngrams(5), frozenset())
+        self.assertTrue(message.hasPhrase("god morgon"))
+        self.assertTrue(message.hasPhrase("allihop"))
+        self.assertFalse(message.hasPhrase("morgon god"))
+        self.assertFalse(message.hasPhrase(""))
+
+    def testCopy(self):
+        """A message survives copying and pickling"""
+        message = Message("Hej, marvin")
+        for other in (copy.copy(message), pickle.loads(pickle.dumps(message))):
+            self.assertEqual(other, message)
+            self.assertEqual(other.raw, "Hej, marvin")
+            self.assertIn("marvin", other)
+
+    def testParseCached(self):
+        """A line seen lately is not tokenized again"""
+        parse.cache_clear()
+        self.assertIs(parse("marvin citat"), parse("marvin citat"))
+        self.assertIs(Bot.tokenize("marvin citat"), parse("marvin citat"))
+        self.assertEqual(parse.cache_info().misses, 1)
+
+    def testFindTriggers(self):
+        """Triggers are found in a message like in a list of words"""
+        message = Message("marvin säg god morgon")
+        self.assertEqual(findTriggers(message, ("morgon", "god morgon")), [(2, 4), (3, 4)])
+        self.assertEqual(findTriggers(message, ("kväll", "god kväll")), [])
+        self.assertEqual(message.spans[("kväll", "god kväll")], [])
+
+    def testSpansFromIndex(self):
+        """The spans found by the index are those the action finds, without scanning again"""
+        message = Message("god morgon och god morgon")
+        self.assertEqual(ActionIndex([actionMorning]).matches(message), [
+            (actionMorning, [(0, 2), (1, 2), (3, 5), (4, 5)])
+        ])
+        self.assertIs(actionMorning(message), message.spans[actionMorning.triggers])
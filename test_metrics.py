@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the metrics and the listener serving them
+"""
+
+from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from metrics import Metrics, MetricsServer
+
+
+class MetricsTest(TestCase):
+    """Test rendering and serving metrics"""
+
+    def testCounters(self):
+        """Counters add up by labels and label values are escaped"""
+        metrics = Metrics()
+        metrics.inc("calls_total", {"action": "sun"})
+        metrics.inc("calls_total", {"action": "sun"}, 2)
+        metrics.inc("calls_total", {"action": 'say "hi"'})
+        text = metrics.render()
+        self.assertIn("# TYPE calls_total counter\n", text)
+        self.assertIn('calls_total{action="sun"} 3\n', text)
+        self.assertIn('calls_total{action="say \\"hi\\""} 1\n', text)
+
+    def testHistogram(self):
+        """Histogram buckets are cumulative and end with +Inf, sum and count"""
+        metrics = Metrics(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 0.5, 3):
+            metrics.observe("latency_seconds", seconds)
+        self.assertEqual(metrics.render().splitlines(), [
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1.0"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            "latency_seconds_sum 4.05",
+            "latency_seconds_count 4",
+        ])
+
+    def testCollectors(self):
+        """Collectors are read when rendering, one failing does not hide the others"""
+        metrics = Metrics()
+        depth = [3]
+        metrics.collect("queue_depth", "gauge", lambda: [({"lane": "pong"}, depth[0])])
+        metrics.collect("broken", "gauge", lambda: 1 / 0)
+        depth[0] = 5
+        text = metrics.render()
+        self.assertIn('# TYPE queue_depth gauge\nqueue_depth{lane="pong"} 5\n', text)
+        self.assertNotIn("broken", text)
+
+    def testServer(self):
+        """The listener serves the text format at /metrics and nothing else"""
+        metrics = Metrics()
+        metrics.inc("received_total")
+        server = MetricsServer(metrics, port=0)
+        server.start()
+        self.addCleanup(server.stop)
+
+        url = f"http://127.0.0.1:{server.port}"
+        with urlopen(url + "/metrics", timeout=5) as response:
+            self.assertIn("text/plain", response.headers["Content-Type"])
+            self.assertIn(b"received_total 1\n", response.read())
+        with self.assertRaises(HTTPError) as context:
+            with urlopen(url + "/other", timeout=5):
+                pass
+        self.assertEqual(context.exception.code, 404)
+        context.exception.close()
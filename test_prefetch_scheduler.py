@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for refreshing content ahead of time
+"""
+
+import datetime
+import threading
+from unittest import TestCase
+
+from prefetch_scheduler import PrefetchScheduler
+
+
+class PrefetchSchedulerTest(TestCase):
+    """Test when the job runs"""
+
+    def testNextRunAtIntervalOrMidnight(self):
+        """The job runs after the interval, or just after midnight if that is sooner"""
+        now = datetime.datetime(2024, 5, 17, 12, 0)
+        scheduler = PrefetchScheduler(None, interval=1800, afterMidnight=30, now=lambda: now)
+        self.assertEqual(scheduler.secondsToNextRun(), 1800)
+        now = datetime.datetime(2024, 5, 17, 23, 50)
+        self.assertEqual(scheduler.secondsToNextRun(), 630)
+
+    def testRunsUntilStopped(self):
+        """The job runs at start and again on schedule, also after failing"""
+        runs = []
+        ran = threading.Event()
+
+        def job():
+            runs.append(1)
+            if len(runs) == 3:
+                ran.set()
+            raise OSError("upstream down")
+
+        scheduler = PrefetchScheduler(job, interval=0.01)
+        scheduler.start()
+        self.assertTrue(ran.wait(2))
+        scheduler.stop()
+        count = len(runs)
+        self.assertFalse(scheduler.is_alive())
+        self.assertEqual(len(runs), count)
+
+    def testStoppedDuringDelay(self):
+        """Stopping before the delay has passed means the job never runs"""
+        runs = []
+        scheduler = PrefetchScheduler(lambda: runs.append(1), delay=60)
+        scheduler.start()
+        scheduler.stop()
+        self.assertFalse(scheduler.is_alive())
+        self.assertEqual(runs, [])
@@ -0,0 +1,83 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for profiling the running bot
+"""
+
+import os
+import pstats
+import shutil
+import signal
+import tempfile
+from unittest import mock, TestCase
+
+from profiler import Profiler
+
+
+def handleMessage():
+    """Stand in for the work done for a message"""
+    return sum(range(100))
+
+
+class ProfilerTest(TestCase):
+    """Test arming, opening and closing windows"""
+
+    def setUp(self):
+        """A profiler writing to a temporary directory"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.filename = os.path.join(tmp, "marvin.pstats")
+        self.profiler = Profiler()
+        previous = signal.getsignal(signal.SIGUSR1)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+
+    def testNotArmedWithoutFile(self):
+        """Without a profile file nothing is armed and ticks do nothing"""
+        self.assertFalse(self.profiler.configure({"profilestart": 1}))
+        self.profiler.tick()
+        self.assertIsNone(self.profiler.window)
+
+    def testWindowClosedAfterMessages(self):
+        """A window opened at start closes after profilemessages and is written"""
+        with self.assertLogs("marvin.profiler", "INFO") as logs:
+            self.assertTrue(self.profiler.configure({
+                "profilefile": self.filename, "profilemessages": 3, "profilestart": 1
+            }))
+            for _ in range(3):
+                self.profiler.tick()
+                handleMessage()
+                self.profiler.record("actionHello", 0.002)
+            self.assertIsNotNone(self.profiler.window)
+            self.profiler.tick()
+        self.assertIsNone(self.profiler.window)
+
+        functions = [name for _, _, name in pstats.Stats(self.filename).stats]
+        self.assertIn("handleMessage", functions)
+        self.assertIn("actionHello: 3 calls, 6.0 ms, 2000 us per call", "\n".join(logs.output))
+
+    def testWindowClosedAfterSeconds(self):
+        """A window closes on the first message after profileseconds"""
+        self.profiler.configure({"profilefile": self.filename, "profileseconds": 5})
+        clock = [100.0, 101.0, 104.0, 105.0, 105.0]
+        with mock.patch("profiler.time.monotonic", side_effect=clock):
+            self.profiler.toggle()
+            self.profiler.tick()
+            self.profiler.tick()
+            self.assertIsNotNone(self.profiler.window)
+            self.profiler.tick()
+        self.assertIsNone(self.profiler.window)
+        self.assertTrue(os.path.exists(self.filename))
+
+    def testSignalToggles(self):
+        """SIGUSR1 opens a window on the next message and closes it on the one after"""
+        self.profiler.configure({"profilefile": self.filename})
+        self.profiler.record("actionHello", 1.0)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.profiler.tick()
+        self.assertIsNotNone(self.profiler.window)
+        self.assertEqual(self.profiler.window.actions, {})
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.profiler.tick()
+        self.assertIsNone(self.profiler.window)
+        self.assertTrue(os.path.exists(self.filename))
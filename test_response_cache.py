@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the cache of responses from upstream services
+"""
+
+import threading
+from unittest import mock, TestCase
+
+from response_cache import ResponseCache
+
+
+class ResponseCacheTest(TestCase):
+    """Test fresh, stale and missing responses"""
+
+    def setUp(self):
+        self.now = 100.0
+        self.cache = ResponseCache(maxSize=2, clock=lambda: self.now)
+
+    def testFreshResponseIsReused(self):
+        """The upstream is only asked again when the response is stale"""
+        fetch = mock.Mock(return_value="sunny")
+        self.assertEqual(self.cache.get("smhi", 60, fetch), "sunny")
+        self.now += 59
+        self.assertEqual(self.cache.get("smhi", 60, fetch), "sunny")
+        fetch.assert_called_once()
+        self.assertEqual(self.cache.counters()["hits"], 1)
+
+    def testStaleWhileRevalidate(self):
+        """A stale response is returned at once while it is refreshed"""
+        self.cache.get("smhi", 60, lambda: "sunny")
+        self.now += 60
+        release = threading.Event()
+
+        def slowFetch():
+            release.wait(2)
+            return "rain"
+
+        self.assertEqual(self.cache.get("smhi", 60, slowFetch), "sunny")
+        self.assertEqual(self.cache.get("smhi", 60, slowFetch), "sunny")
+        release.set()
+        self.cache.wait()
+        self.assertEqual(self.cache.get("smhi", 60, slowFetch), "rain")
+        self.assertEqual(self.cache.counters()["stale"], 2)
+
+    def testUpstreamDown(self):
+        """The last good response is kept when the upstream fails"""
+        self.cache.get("smhi", 60, lambda: "sunny")
+        self.now += 600
+        down = mock.Mock(side_effect=OSError("down"))
+        self.assertEqual(self.cache.get("smhi", 60, down), "sunny")
+        self.cache.wait()
+        self.assertEqual(self.cache.get("smhi", 60, down), "sunny")
+        self.cache.wait()
+        self.assertEqual(self.cache.counters()["errors"], 2)
+        with self.assertRaises(OSError):
+            self.cache.get("sun", 60, down)
+
+    def testLeastRecentlyUsedEvicted(self):
+        """The least recently used response is dropped when the cache is full"""
+        self.cache.get("a", 60, lambda: "a")
+        self.cache.get("b", 60, lambda: "b")
+        self.cache.get("a", 60, lambda: "a")
+        self.cache.get("c", 60, lambda: "c")
+        self.assertEqual(list(self.cache.entries), ["a", "c"])
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the strings shared by the action modules
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from string_store import StringStore
+
+
+class StringStoreTest(TestCase):
+    """Test looking up and reloading strings"""
+
+    def setUp(self):
+        """Write a strings file and a store reading it"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.filename = os.path.join(tmp, "strings.json")
+        self.write({
+            "fixed": "hello",
+            "choice": ["a", "b", "c"],
+            "keyed": {"one": "1", "many": ["x", "y"], "range": 5, "inner": {"k": "v"}},
+        })
+        self.now = 0.0
+        self.store = StringStore(self.filename, checkInterval=1.0, clock=lambda: self.now)
+
+    def write(self, strings, mtime=None):
+        """Write the strings to the file, optionally setting its modification time"""
+        with open(self.filename, "w", encoding="utf-8") as f:
+            json.dump(strings, f)
+        if mtime is not None:
+            os.utime(self.filename, (mtime, mtime))
+
+    def testLookups(self):
+        """Each kind of entry resolves like the strings file describes"""
+        self.assertEqual(self.store.get("fixed"), "hello")
+        self.assertEqual(self.store.get("choice", choose=lambda count: count - 1), "c")
+        self.assertEqual(self.store.get("keyed", "one"), "1")
+        self.assertEqual(self.store.get("keyed", "many", lambda count: 0), "x")
+        self.assertEqual(self.store.get("keyed", "range"), 5)
+        self.assertEqual(self.store.get("keyed", "inner"), {"k": "v"})
+        self.assertEqual(self.store.get("keyed")["one"], "1")
+
+    def testReloadWhenChanged(self):
+        """The file is loaded again once it has changed and the check interval has passed"""
+        self.write({"fixed": "hello"}, mtime=1000)
+        self.assertEqual(self.store.get("fixed"), "hello")
+        self.write({"fixed": "changed"}, mtime=2000)
+        self.assertEqual(self.store.get("fixed"), "hello")
+        self.now = 2.0
+        self.assertEqual(self.store.get("fixed"), "changed")
@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tests for logging through a queue with structured fields
+"""
+
+import io
+import logging
+from unittest import mock, TestCase
+
+import structured_log
+from structured_log import fields, logRaw, Sampler, setupLogging, stopLogging
+
+
+class SamplerTest(TestCase):
+    """Test letting a number of events through each second"""
+
+    def testRateEachSecond(self):
+        """Events over the rate are skipped and counted until the next second"""
+        now = [10.0]
+        sampler = Sampler(2, clock=lambda: now[0])
+        self.assertEqual([sampler.take() for _ in range(4)], [0, 0, None, None])
+        now[0] = 11.5
+        self.assertEqual(sampler.take(), 2)
+        self.assertEqual(sampler.take(), 0)
+
+    def testUnlimited(self):
+        """A rate of 0 lets everything through"""
+        sampler = Sampler(0)
+        self.assertEqual({sampler.take() for _ in range(1000)}, {0})
+
+
+class StructuredLogTest(TestCase):
+    """Test the records written by the listener"""
+
+    def setUp(self):
+        """Log to a string through the queue"""
+        self.stream = io.StringIO()
+        self.addCleanup(stopLogging)
+        sampler = mock.patch("structured_log.SAMPLER", Sampler(0))
+        sampler.start()
+        self.addCleanup(sampler.stop)
+
+    def lines(self):
+        """Wait for the queued records to be written and return them"""
+        stopLogging()
+        return self.stream.getvalue().splitlines()
+
+    def testFieldsAfterMessage(self):
+        """Structured fields are written as key=value after the message"""
+        setupLogging({"loglevel": "info"}, self.stream)
+        log = logging.getLogger("marvin.test")
+        log.info("Action failed: %s", "oops", extra=fields(action="marvinJoke", latency="4ms"))
+        log.debug("Not written below the level")
+        lines = self.lines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith(
+            "INFO marvin.test: Action failed: oops action=marvinJoke latency=4ms"
+        ), lines[0])
+
+    def testRawLinesSampled(self):
+        """Raw lines over the rate are skipped and counted on the next one logged"""
+        setupLogging({"lograwrate": 2}, self.stream)
+        now = [100.0]
+        structured_log.SAMPLER.clock = lambda: now[0]
+        for number in range(5):
+            logRaw(f"line {number} 100%", nick="mos")
+        now[0] = 101.0
+        logRaw("line 5", channel="#db-o-webb")
+        lines = self.lines()
+        self.assertEqual([line.split(": ", 1)[1] for line in lines], [
+            "line 0 100% nick=mos",
+            "line 1 100% nick=mos",
+            "line 5 channel=#db-o-webb skipped=3",
+        ])
+
+    def testRawLinesBelowLevel(self):
+        """Raw lines are not sampled nor written when info is not enabled"""
+        setupLogging({"loglevel": "WARNING"}, self.stream)
+        logRaw("line")
+        self.assertEqual(self.lines(), [])